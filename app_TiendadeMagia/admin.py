@@ -1,5 +1,32 @@
-from django.contrib import admin
-from .models import Producto, OrdenDeVenta, DetalleOrden
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.core.paginator import Paginator
+from django.template.response import TemplateResponse
+from django.utils.functional import cached_property
+from . import ajustes, estados
+from .autocompletar import filtrar_ordenes, filtrar_productos, leer_pk
+from .basedatos import escritura
+from .inventario import (
+    VENTA, StockInsuficiente, ajustar_reserva, liberar_lineas, liberar_orden, liberar_stock, registrar_movimiento,
+    reservar_stock,
+)
+from .models import (
+    Producto, OrdenDeVenta, DetalleOrden, Tarea, CambioDeEstado, OrdenArchivada, DetalleArchivado, MovimientoInventario,
+)
+from .paginacion import conteo_estimado
+from .totales import recalcular_resumenes, recalcular_totales
+
+# =========================================================================
+# PAGINADOR CON CONTEO ESTIMADO
+# =========================================================================
+
+class PaginadorConteoEstimado(Paginator):
+    """Paginator cuyo total sale de paginacion.conteo_estimado (sin COUNT(*) sobre la tabla completa)."""
+
+    @cached_property
+    def count(self):
+        return conteo_estimado(self.object_list)
 
 # =========================================================================
 # CLASES ADMIN PARA PERSONALIZAR EL PANEL
@@ -23,14 +50,121 @@ class ProductoAdmin(admin.ModelAdmin):
     )
     search_fields = ('nombre', 'categoria', 'proveedor')
     ordering = ('nombre',)
+    actions = ('ajustar_precio_stock',)
+
+    def get_search_results(self, request, queryset, search_term):
+        # La búsqueda (y el autocompletado de los detalles) se resuelve por pk
+        # o en el índice FTS5 en lugar de LIKE '%...%'
+        if not search_term:
+            return queryset, False
+        return filtrar_productos(queryset, search_term), False
+
+    @admin.action(description='Ajustar precio / stock de los seleccionados', permissions=['change'])
+    def ajustar_precio_stock(self, request, queryset):
+        """Página intermedia con vista previa; 'Aplicar' hace un solo UPDATE sobre la selección (ajustes.py)."""
+        contexto = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Ajustar precio y stock',
+            'total': queryset.count(),
+            'seleccionados': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across') == '1',
+            'modos': ajustes.MODOS_AJUSTE,
+            'datos': request.POST,
+        }
+        confirmar = request.POST.get('confirmar')
+        if confirmar:
+            try:
+                ajuste = ajustes.leer_formulario(request.POST)
+            except ajustes.AjusteInvalido as e:
+                contexto['error'] = str(e)
+            else:
+                if confirmar == 'aplicar':
+                    resultado = ajustes.aplicar(queryset, **ajuste)
+                    self.message_user(
+                        request,
+                        f"Ajuste aplicado a {resultado['productos']} productos "
+                        f"({resultado['lineas']} líneas de {resultado['ordenes']} órdenes pendientes repreciadas).",
+                        messages.SUCCESS,
+                    )
+                    return None
+                contexto['previa'] = ajustes.vista_previa(queryset, **ajuste)
+        return TemplateResponse(request, 'admin/app_TiendadeMagia/producto/ajustar_precio_stock.html', contexto)
+
+class DetalleOrdenAdminForm(forms.ModelForm):
+    """Avisa en el formulario si el stock no alcanza o la orden está cancelada.
+
+    La comprobación de stock es sólo para mostrar el error: quien garantiza
+    que no se venda de más es el UPDATE condicional de _guardar_linea.
+    """
+
+    def clean(self):
+        datos = super().clean()
+        orden = datos.get('orden')
+        if self.has_changed() and self._orden_cancelada(orden):
+            raise forms.ValidationError('La orden está cancelada: sus líneas ya no se pueden modificar.')
+        producto, cantidad = datos.get('producto'), datos.get('cantidad')
+        if producto is None or not cantidad:
+            return datos
+        # self.instance aún tiene los valores guardados: sólo hace falta la diferencia
+        reservado = self.instance.cantidad if self.instance.pk and self.instance.producto_id == producto.pk else 0
+        faltan = cantidad - reservado
+        if faltan > 0 and not Producto.objects.filter(pk=producto.pk, stock__gte=faltan).exists():
+            raise forms.ValidationError(str(StockInsuficiente(producto.pk, faltan)))
+        return datos
+
+    def _orden_cancelada(self, orden):
+        # En el inline `orden` es la orden del formulario padre, con el estado que se está guardando
+        if orden is not None and orden.estado == estados.ESTADO_CANCELADO:
+            return True
+        pks = {self.instance.orden_id, getattr(orden, 'pk', None)} - {None}
+        return bool(pks) and estados.primera_cancelada(*pks) is not None
+
+def _guardar_linea(detalle, anterior=None):
+    """Guarda una línea moviendo su reserva e historial como agregar_detalle / editar_detalle.
+
+    `anterior` es (producto_pk, cantidad) de la línea ya guardada, o None si es nueva.
+    """
+    if anterior is not None:
+        ajustar_reserva(*anterior, detalle.producto_id, detalle.cantidad, detalle.pk)
+        detalle.save()
+    else:
+        reservar_stock(detalle.producto_id, detalle.cantidad, registrar=False)
+        detalle.save()
+        registrar_movimiento(detalle.producto_id, VENTA, -detalle.cantidad, detalle.pk)
+
+def _recalcular_ordenes(ordenes):
+    """Total y resumen de las órdenes tocadas desde el admin, recalculados desde sus líneas."""
+    recalcular_totales(ordenes)
+    recalcular_resumenes(ordenes)
+
+def _borrar_linea(detalle):
+    """Borra una línea y devuelve su stock (salvo si la orden ya lo devolvió al cancelarse)."""
+    detalle_pk = detalle.pk
+    detalle.delete()
+    if estados.primera_cancelada(detalle.orden_id) is None:
+        liberar_stock(detalle.producto_id, detalle.cantidad, detalle_pk)
+
+class OrdenDeVentaAdminForm(forms.ModelForm):
+    """Sólo ofrece los cambios de estado permitidos por TRANSICIONES_ESTADO."""
+
+    def clean_estado(self):
+        estado = self.cleaned_data['estado']
+        anterior = self.initial.get('estado')
+        if self.instance.pk and estado != anterior and estado not in estados.destinos_permitidos(anterior):
+            raise forms.ValidationError(f'Una orden {anterior} no puede pasar a {estado}.')
+        return estado
 
 class DetalleOrdenInline(admin.TabularInline):
     """Permite editar los detalles directamente desde la orden."""
     model = DetalleOrden
+    form = DetalleOrdenAdminForm # Stock y órdenes canceladas; se guarda en OrdenDeVentaAdmin.save_formset
     extra = 1 # Número de formularios vacíos a mostrar
     readonly_fields = ('precio_unitario',) # El precio se obtiene del producto
+    autocomplete_fields = ('producto',) # En lugar de un <select> con todo el catálogo
 
 class OrdenDeVentaAdmin(admin.ModelAdmin):
+    form = OrdenDeVentaAdminForm
     list_display = (
         'pk', 
         'cliente', 
@@ -44,6 +178,217 @@ class OrdenDeVentaAdmin(admin.ModelAdmin):
     search_fields = ('cliente', 'pk')
     ordering = ('-fecha_orden',)
     inlines = [DetalleOrdenInline]
+    date_hierarchy = 'fecha_orden' # Rangos sobre el índice orden_fecha_idx
+    paginator = PaginadorConteoEstimado
+    show_full_result_count = False # Evita un segundo COUNT(*) al filtrar
+    actions = ('marcar_enviado', 'marcar_entregado', 'marcar_cancelado')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Por pk o prefijo del cliente sobre el índice de LOWER(cliente), en
+        # lugar de LIKE '%...%'; también lo usa el autocompletado de los detalles
+        if not search_term:
+            return queryset, False
+        return filtrar_ordenes(queryset, search_term), False
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            super().save_model(request, obj, form, change)
+            return
+        # El estado pasa por estados.cambiar_estado (stock al cancelar y
+        # CambioDeEstado); el resto sólo con los campos editados, para no
+        # pisar los deltas de total / num_lineas / unidades
+        estado_nuevo, obj.estado = obj.estado, form.initial['estado']
+        campos = [campo for campo in form.changed_data if campo != 'estado']
+        if campos:
+            obj.save(update_fields=campos + ['modificado'])
+        if estado_nuevo != obj.estado:
+            estados.cambiar_estado(OrdenDeVenta.objects.filter(pk=obj.pk), estado_nuevo,
+                                   usuario=request.user.get_username(), canal='admin',
+                                   criterio={'ordenes': [obj.pk]})
+            obj.estado = estado_nuevo
+
+    def save_formset(self, request, form, formset, change):
+        # Las líneas del inline reservan y liberan stock como DetalleOrdenAdmin
+        if formset.model is not DetalleOrden:
+            return super().save_formset(request, form, formset, change)
+        detalles = formset.save(commit=False)
+        for detalle in formset.deleted_objects:
+            _borrar_linea(detalle)
+        anteriores = {
+            pk: (producto_pk, cantidad)
+            for pk, producto_pk, cantidad in DetalleOrden.objects.filter(
+                pk__in=[detalle.pk for detalle, _ in formset.changed_objects]
+            ).values_list('pk', 'producto_id', 'cantidad')
+        }
+        for detalle in detalles:
+            anterior = anteriores.get(detalle.pk)
+            # Precio del producto al agregarlo o cambiarlo, como en las vistas
+            if anterior is None or anterior[0] != detalle.producto_id:
+                detalle.precio_unitario = detalle.producto.precio
+            detalle.subtotal = detalle.subtotal_calculado
+            _guardar_linea(detalle, anterior)
+        formset.save_m2m()
+
+    def delete_model(self, request, obj):
+        # Una orden cancelada ya devolvió su stock al cancelarse
+        if obj.estado != estados.ESTADO_CANCELADO:
+            liberar_orden(obj.pk)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with escritura():
+            liberar_lineas(DetalleOrden.objects.filter(
+                orden__in=queryset.exclude(estado=estados.ESTADO_CANCELADO)
+            ))
+            super().delete_queryset(request, queryset)
+
+    def save_related(self, request, form, formsets, change):
+        # Las líneas editadas en el inline no pasan por las vistas: se recalculan total y resumen
+        super().save_related(request, form, formsets, change)
+        _recalcular_ordenes(OrdenDeVenta.objects.filter(pk=form.instance.pk))
+
+    def _cambiar_estado(self, request, queryset, estado_nuevo):
+        # Un UPDATE por estado de origen y una fila de CambioDeEstado por lote (estados.py)
+        if request.POST.get('select_across') == '1':
+            criterio = {'filtros': request.GET.dict()}
+        else:
+            criterio = {'ordenes': sorted(int(pk) for pk in request.POST.getlist(helpers.ACTION_CHECKBOX_NAME))}
+        resultado = estados.cambiar_estado(queryset, estado_nuevo, usuario=request.user.get_username(),
+                                           canal='admin', criterio=criterio)
+        mensaje = f"{resultado['total']} órdenes pasadas a {estado_nuevo}."
+        if resultado['omitidas']:
+            omitidas = ', '.join(f'{n} en {estado}' for estado, n in resultado['omitidas'].items())
+            mensaje += f' Omitidas por no permitir esa transición: {omitidas}.'
+        self.message_user(request, mensaje, messages.WARNING if resultado['omitidas'] else messages.SUCCESS)
+
+    @admin.action(description='Marcar como Enviado', permissions=['change'])
+    def marcar_enviado(self, request, queryset):
+        self._cambiar_estado(request, queryset, 'Enviado')
+
+    @admin.action(description='Marcar como Entregado', permissions=['change'])
+    def marcar_entregado(self, request, queryset):
+        self._cambiar_estado(request, queryset, 'Entregado')
+
+    @admin.action(description='Marcar como Cancelado', permissions=['change'])
+    def marcar_cancelado(self, request, queryset):
+        self._cambiar_estado(request, queryset, 'Cancelado')
+
+class DetalleOrdenAdmin(admin.ModelAdmin):
+    form = DetalleOrdenAdminForm
+    list_display = (
+        'pk',
+        'orden',
+        'producto',
+        'cantidad',
+        'precio_unitario',
+        'descuento',
+        'subtotal',
+    )
+    list_select_related = ('orden', 'producto') # Un solo JOIN en lugar de dos consultas por fila
+    list_filter = ('orden__estado',)
+    search_fields = ('orden__pk', 'producto__nombre')
+    autocomplete_fields = ('orden', 'producto') # Sin cargar todas las órdenes ni productos
+    date_hierarchy = 'orden__fecha_orden'
+    paginator = PaginadorConteoEstimado
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # Un número busca la línea o la orden por pk; un texto, el producto en el índice FTS5
+        if not search_term:
+            return queryset, False
+        pk = leer_pk(search_term)
+        if pk is not None:
+            return queryset.filter(pk=pk) | queryset.filter(orden_id=pk), False
+        productos = filtrar_productos(Producto.objects.all(), search_term)
+        return queryset.filter(producto__in=productos), False
+
+    def save_model(self, request, obj, form, change):
+        # Stock e historial como en agregar_detalle / editar_detalle (inventario.py);
+        # el admin ya envuelve el formulario en una transacción
+        anterior = (form.initial['producto'], form.initial['cantidad']) if change else None
+        _guardar_linea(obj, anterior)
+        # Resumen de la orden nueva y, si la línea cambió de orden, de la anterior
+        ordenes = {obj.orden_id}
+        if change and form.initial.get('orden'):
+            ordenes.add(form.initial['orden'])
+        _recalcular_ordenes(OrdenDeVenta.objects.filter(pk__in=ordenes))
+
+    def delete_model(self, request, obj):
+        _borrar_linea(obj)
+        _recalcular_ordenes(OrdenDeVenta.objects.filter(pk=obj.orden_id))
+
+    def delete_queryset(self, request, queryset):
+        with escritura():
+            ordenes = list(queryset.values_list('orden_id', flat=True).distinct())
+            liberar_lineas(queryset.exclude(orden__estado=estados.ESTADO_CANCELADO))
+            super().delete_queryset(request, queryset)
+            _recalcular_ordenes(OrdenDeVenta.objects.filter(pk__in=ordenes))
+
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'tipo', 'estado', 'progreso', 'total', 'trabajador', 'intentos', 'creada', 'terminada')
+    list_filter = ('estado', 'tipo')
+    readonly_fields = ('progreso', 'total', 'resultado', 'error', 'archivo', 'trabajador', 'intentos',
+                       'creada', 'iniciada', 'latido', 'terminada')
+    paginator = PaginadorConteoEstimado
+    show_full_result_count = False
+
+class CambioDeEstadoAdmin(admin.ModelAdmin):
+    # Registro de auditoría: sólo lectura
+    list_display = ('pk', 'fecha', 'usuario', 'canal', 'estado_nuevo', 'total')
+    list_filter = ('estado_nuevo', 'canal')
+    readonly_fields = ('fecha', 'usuario', 'canal', 'estado_nuevo', 'criterio', 'movidas', 'omitidas', 'total')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+class SoloLecturaMixin:
+    """Archivo y auditoría: se consultan en el admin pero no se editan."""
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+class DetalleArchivadoInline(SoloLecturaMixin, admin.TabularInline):
+    model = DetalleArchivado
+    fields = ('producto', 'cantidad', 'precio_unitario', 'descuento', 'subtotal', 'observaciones')
+    readonly_fields = fields
+    extra = 0
+
+class OrdenArchivadaAdmin(SoloLecturaMixin, admin.ModelAdmin):
+    list_display = ('pk', 'cliente', 'fecha_orden', 'total', 'estado', 'metodo_pago', 'archivada')
+    list_filter = ('estado', 'metodo_pago')
+    search_fields = ('cliente', 'pk')
+    ordering = ('-fecha_orden',)
+    inlines = [DetalleArchivadoInline]
+    date_hierarchy = 'fecha_orden'
+    paginator = PaginadorConteoEstimado
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # Mismo criterio que las órdenes vigentes: pk o prefijo del cliente
+        if not search_term:
+            return queryset, False
+        pk = leer_pk(search_term)
+        if pk is not None:
+            return queryset.filter(pk=pk), False
+        return queryset.filter(cliente__istartswith=search_term.strip()), False
+
+class MovimientoInventarioAdmin(SoloLecturaMixin, admin.ModelAdmin):
+    list_display = ('fecha', 'producto', 'tipo', 'cantidad', 'detalle_id', 'nota')
+    list_filter = ('tipo',)
+    list_select_related = ('producto',)
+    ordering = ('-fecha', '-pk')
+    date_hierarchy = 'fecha'
+    paginator = PaginadorConteoEstimado
+    show_full_result_count = False
 
 # =========================================================================
 # REGISTRO DE MODELOS
@@ -51,4 +396,8 @@ class OrdenDeVentaAdmin(admin.ModelAdmin):
 
 admin.site.register(Producto, ProductoAdmin)
 admin.site.register(OrdenDeVenta, OrdenDeVentaAdmin)
-admin.site.register(DetalleOrden)
\ No newline at end of file
+admin.site.register(DetalleOrden, DetalleOrdenAdmin)
+admin.site.register(Tarea, TareaAdmin)
+admin.site.register(CambioDeEstado, CambioDeEstadoAdmin)
+admin.site.register(OrdenArchivada, OrdenArchivadaAdmin)
+admin.site.register(MovimientoInventario, MovimientoInventarioAdmin)
\ No newline at end of file
@@ -0,0 +1,219 @@
+import decimal
+
+from django.db.models import (
+    Count, DecimalField, F, IntegerField, Max, Min, OuterRef, Subquery, Sum, Value,
+)
+from django.db.models.functions import Cast, Coalesce, Greatest, Round
+
+from . import catalogo, reportes, versiones
+from .basedatos import escritura
+from .inventario import AJUSTE, registrar_movimientos
+from .models import Producto, OrdenDeVenta, DetalleOrden, MovimientoInventario
+from .totales import recalcular_totales
+
+# =========================================================================
+# AJUSTES MASIVOS DE PRECIO Y STOCK
+# =========================================================================
+# Cambia el precio y/o el stock de todos los productos de una categoría /
+# proveedor (o de una selección del admin) con un solo UPDATE:
+#
+#     UPDATE producto SET precio = MAX(ROUND(precio * 1.10, 2), 0) WHERE categoria = ...
+#
+# Cada ajuste es (modo, valor): 'porcentaje' multiplica por (1 + valor/100)
+# y 'monto' suma valor; el resultado nunca baja de 0. La vista previa sale
+# de una sola consulta agregada con los mismos valores calculados.
+#
+# Con `repreciar_pendientes` las líneas de órdenes 'Pendiente' de esos
+# productos toman el precio nuevo (un UPDATE) y se recalculan los totales
+# de sus órdenes (otro UPDATE), ajustando la tabla de resumen por
+# diferencia. update() no dispara señales: aquí se invalidan a mano el
+# catálogo en caché y las versiones de las tablas.
+#
+# Un ajuste de stock lee antes del UPDATE, en la misma transacción, la
+# diferencia que tendrá cada producto y la agrega al historial de
+# inventario como movimientos 'ajuste' (un solo INSERT).
+
+MODOS_AJUSTE = [
+    ('porcentaje', 'Porcentaje (%)'),
+    ('monto', 'Monto fijo'),
+]
+
+ESTADO_REPRECIABLE = 'Pendiente'
+
+CERO = decimal.Decimal('0.00')
+
+_CAMPO_PRECIO = DecimalField(max_digits=10, decimal_places=2)
+_CAMPO_FACTOR = DecimalField(max_digits=12, decimal_places=6)
+_CAMPO_VALOR = DecimalField(max_digits=16, decimal_places=2)
+
+
+class AjusteInvalido(ValueError):
+    """Los parámetros del ajuste no son válidos."""
+
+
+def productos_filtrados(categoria=None, proveedor=None):
+    """Productos de `categoria` y/o `proveedor` (sin filtro, todos)."""
+    productos = Producto.objects.all()
+    if categoria:
+        productos = productos.filter(categoria=categoria)
+    if proveedor:
+        productos = productos.filter(proveedor=proveedor)
+    return productos
+
+
+def leer_ajuste(modo, valor, entero=False):
+    """Valida un ajuste del formulario/comando y devuelve (modo, Decimal) o None si está vacío."""
+    if valor in (None, ''):
+        return None
+    if modo not in dict(MODOS_AJUSTE):
+        raise AjusteInvalido(f'Modo de ajuste desconocido: {modo}.')
+    try:
+        numero = decimal.Decimal(str(valor).strip().replace(',', '.'))
+    except decimal.InvalidOperation:
+        raise AjusteInvalido(f'"{valor}" no es un número.')
+    if not numero.is_finite():
+        raise AjusteInvalido(f'"{valor}" no es un número.')
+    if modo == 'porcentaje' and numero <= -100:
+        raise AjusteInvalido('Un porcentaje de -100 o menos dejaría todo en 0; usa un monto.')
+    if modo == 'monto' and entero and numero != numero.to_integral_value():
+        raise AjusteInvalido('El ajuste de stock por monto debe ser un número entero.')
+    return modo, numero
+
+
+def leer_formulario(datos):
+    """Lee precio_modo/precio_valor, stock_modo/stock_valor y repreciar_pendientes de un POST."""
+    precio = leer_ajuste(datos.get('precio_modo', 'porcentaje'), datos.get('precio_valor'))
+    stock = leer_ajuste(datos.get('stock_modo', 'monto'), datos.get('stock_valor'), entero=True)
+    if precio is None and stock is None:
+        raise AjusteInvalido('Indica un ajuste de precio, de stock o ambos.')
+    return {
+        'precio': precio,
+        'stock': stock,
+        'repreciar_pendientes': bool(datos.get('repreciar_pendientes')),
+    }
+
+
+def _factor(valor):
+    return Value(1 + valor / 100, output_field=_CAMPO_FACTOR)
+
+
+def expresion_precio(ajuste):
+    """Expresión SQL del precio nuevo (F('precio') si no hay ajuste)."""
+    if ajuste is None:
+        return F('precio')
+    modo, valor = ajuste
+    if modo == 'porcentaje':
+        nuevo = Round(F('precio') * _factor(valor), 2, output_field=_CAMPO_PRECIO)
+    else:
+        nuevo = F('precio') + Value(valor, output_field=_CAMPO_PRECIO)
+    return Greatest(nuevo, Value(CERO, output_field=_CAMPO_PRECIO), output_field=_CAMPO_PRECIO)
+
+
+def expresion_stock(ajuste):
+    """Expresión SQL del stock nuevo (F('stock') si no hay ajuste)."""
+    if ajuste is None:
+        return F('stock')
+    modo, valor = ajuste
+    if modo == 'porcentaje':
+        nuevo = Cast(Round(F('stock') * _factor(valor)), IntegerField())
+    else:
+        nuevo = F('stock') + Value(int(valor))
+    return Greatest(nuevo, Value(0), output_field=IntegerField())
+
+
+def _lineas_pendientes(productos):
+    return DetalleOrden.objects.filter(orden__estado=ESTADO_REPRECIABLE, producto__in=productos.values('pk'))
+
+
+def vista_previa(productos, precio=None, stock=None, repreciar_pendientes=False):
+    """Resumen del ajuste sin aplicarlo, calculado en una sola consulta agregada."""
+    nuevo_precio, nuevo_stock = expresion_precio(precio), expresion_stock(stock)
+    agregados = {
+        'productos': Count('pk'),
+        'precio_min': Min('precio'),
+        'precio_max': Max('precio'),
+        'precio_nuevo_min': Min(nuevo_precio),
+        'precio_nuevo_max': Max(nuevo_precio),
+        'stock_total': Sum('stock'),
+        'stock_nuevo': Sum(nuevo_stock),
+        'valor_inventario': Sum(F('precio') * F('stock'), output_field=_CAMPO_VALOR),
+        'valor_nuevo': Sum(nuevo_precio * nuevo_stock, output_field=_CAMPO_VALOR),
+    }
+    if repreciar_pendientes and precio is not None:
+        # Unidades de cada producto en órdenes pendientes, como subconsulta por índice
+        pendientes = (
+            DetalleOrden.objects.filter(producto=OuterRef('pk'), orden__estado=ESTADO_REPRECIABLE)
+            .values('producto')
+        )
+        productos = productos.annotate(
+            lineas_del_producto=Coalesce(Subquery(pendientes.annotate(n=Count('pk')).values('n')), 0),
+            unidades_del_producto=Coalesce(Subquery(pendientes.annotate(n=Sum('cantidad')).values('n')), 0),
+        )
+        agregados['lineas_pendientes'] = Sum('lineas_del_producto')
+        agregados['delta_pendientes'] = Sum(
+            F('unidades_del_producto') * (nuevo_precio - F('precio')), output_field=_CAMPO_VALOR
+        )
+    fila = productos.order_by().aggregate(**agregados)
+    return {
+        clave: valor.quantize(CERO) if isinstance(valor, decimal.Decimal) else (valor or 0)
+        for clave, valor in fila.items()
+    }
+
+
+def aplicar(productos, precio=None, stock=None, repreciar_pendientes=False):
+    """Aplica el ajuste a `productos` y devuelve {'productos', 'lineas', 'ordenes'} modificados.
+
+    `productos` se vuelve a evaluar después del UPDATE para repreciar las
+    líneas, así que no debe filtrar por precio ni por stock.
+    """
+    if precio is None and stock is None:
+        raise AjusteInvalido('Indica un ajuste de precio, de stock o ambos.')
+    cambios = {}
+    if precio is not None:
+        cambios['precio'] = expresion_precio(precio)
+    if stock is not None:
+        cambios['stock'] = expresion_stock(stock)
+
+    resultado = {'productos': 0, 'lineas': 0, 'ordenes': 0}
+    with escritura():
+        diferencias = []
+        if stock is not None:
+            diferencias = list(
+                productos.annotate(diferencia=cambios['stock'] - F('stock')).exclude(diferencia=0)
+                .values_list('pk', 'diferencia')
+            )
+        resultado['productos'] = productos.update(**cambios)
+        if not resultado['productos']:
+            return resultado
+        registrar_movimientos(
+            MovimientoInventario(producto_id=pk, tipo=AJUSTE, cantidad=diferencia, nota='Ajuste masivo')
+            for pk, diferencia in diferencias
+        )
+        versiones.incrementar(Producto)
+        catalogo.invalidar_al_confirmar()
+
+        if repreciar_pendientes and precio is not None:
+            resultado['lineas'], resultado['ordenes'] = repreciar_lineas_pendientes(productos)
+    return resultado
+
+
+def repreciar_lineas_pendientes(productos):
+    """Pasa el precio actual de `productos` a sus líneas en órdenes pendientes y recalcula los totales.
+
+    Devuelve (lineas, ordenes) actualizadas.
+    """
+    lineas = _lineas_pendientes(productos)
+    precio_actual = Subquery(Producto.objects.filter(pk=OuterRef('producto_id')).order_by().values('precio')[:1])
+    subtotal = Greatest(
+        F('cantidad') * precio_actual - Coalesce(F('descuento'), Value(CERO)),
+        Value(CERO, output_field=_CAMPO_PRECIO),
+        output_field=_CAMPO_PRECIO,
+    )
+    actualizadas = reportes.actualizar_con_resumen(
+        lineas, lambda: lineas.update(precio_unitario=precio_actual, subtotal=subtotal)
+    )
+    if not actualizadas:
+        return 0, 0
+    versiones.incrementar(DetalleOrden)
+    ordenes = recalcular_totales(OrdenDeVenta.objects.filter(pk__in=lineas.values('orden_id')))
+    return actualizadas, ordenes
@@ -0,0 +1,163 @@
+import hashlib
+from functools import wraps
+
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from . import versiones
+from .models import Producto, OrdenDeVenta, DetalleOrden
+from .paginacion import paginar_por_cursor, tamano_pagina
+
+# =========================================================================
+# API JSON (v1) CON GET CONDICIONAL
+# =========================================================================
+# Rutas bajo /api/v1/ para productos, órdenes y detalles. Todas las
+# respuestas llevan un ETag fuerte y Last-Modified tomados de VersionTabla
+# (versiones.py): el ETag combina la versión de cada tabla involucrada con
+# la URL completa, así que un sondeo con If-None-Match que no cambió recibe
+# 304 tras una sola consulta, sin leer ni serializar filas.
+#
+# Parámetros comunes de las listas:
+#   ?campos=nombre,precio   campos a devolver ('id' siempre se incluye)
+#   ?por_pagina=50          tamaño de página (máx. 100)
+#   ?despues=<cursor>       página siguiente ('siguiente' de la respuesta)
+#   ?antes=<cursor>         página anterior ('anterior' de la respuesta)
+
+VERSION_API = 'v1'
+
+CAMPOS_PRODUCTO = ('id', 'nombre', 'descripcion', 'categoria', 'precio', 'proveedor', 'stock', 'fecha_registro')
+CAMPOS_ORDEN = ('id', 'cliente', 'fecha_orden', 'direccion_envio', 'total', 'estado', 'metodo_pago', 'comentarios',
+                'num_lineas', 'unidades', 'producto_muestra')
+CAMPOS_DETALLE = ('id', 'orden', 'producto', 'cantidad', 'precio_unitario', 'subtotal', 'descuento', 'observaciones')
+
+# Filtros exactos admitidos por lista: parámetro -> lookup
+FILTROS_PRODUCTO = {'categoria': 'categoria', 'proveedor': 'proveedor'}
+FILTROS_ORDEN = {'estado': 'estado', 'metodo_pago': 'metodo_pago', 'cliente': 'cliente'}
+FILTROS_DETALLE = {'orden': 'orden_id', 'producto': 'producto_id'}
+
+
+class ErrorDeParametros(ValueError):
+    """Un parámetro del querystring no es válido; se responde 400."""
+
+
+def error_json(mensaje, status):
+    return JsonResponse({'error': mensaje}, status=status)
+
+
+def respuesta_condicional(*modelos):
+    """Decorador: responde 304 si la versión de las tablas de `modelos` no cambió.
+
+    La vista sólo se ejecuta cuando el cliente no tiene la representación
+    vigente; a su respuesta se le agregan ETag, Last-Modified y
+    Cache-Control: no-cache (guardar, pero revalidar siempre).
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            numeros, modificado = versiones.leer(*modelos)
+            firma = '|'.join([VERSION_API, request.get_full_path(),
+                              *(f'{tabla}={numero}' for tabla, numero in sorted(numeros.items()))])
+            etag = quote_etag(hashlib.sha1(firma.encode('utf-8')).hexdigest())
+            ultima = int(modificado.timestamp())
+
+            respuesta = get_conditional_response(request, etag=etag, last_modified=ultima)
+            if respuesta is None:
+                respuesta = vista(request, *args, **kwargs)
+            if respuesta.status_code in (200, 304):
+                respuesta['ETag'] = etag
+                respuesta['Last-Modified'] = http_date(ultima)
+                patch_cache_control(respuesta, no_cache=True)
+            return respuesta
+        return require_safe(envoltura)
+    return decorador
+
+
+def campos_pedidos(request, permitidos):
+    """Lee ?campos= y devuelve la tupla de campos a consultar (con 'id' primero)."""
+    texto = request.GET.get('campos')
+    if not texto:
+        return permitidos
+    pedidos = [c.strip() for c in texto.split(',') if c.strip()]
+    desconocidos = [c for c in pedidos if c not in permitidos]
+    if desconocidos:
+        raise ErrorDeParametros(
+            f'Campos desconocidos: {", ".join(desconocidos)}. Disponibles: {", ".join(permitidos)}.'
+        )
+    return ('id', *dict.fromkeys(c for c in pedidos if c != 'id'))
+
+
+def aplicar_filtros(request, queryset, filtros):
+    condiciones = {lookup: request.GET[parametro] for parametro, lookup in filtros.items() if parametro in request.GET}
+    return queryset.filter(**condiciones) if condiciones else queryset
+
+
+def lista_paginada(request, queryset, campos_permitidos, filtros):
+    """Respuesta JSON de una página por cursor (orden por id) de `queryset`."""
+    try:
+        campos = campos_pedidos(request, campos_permitidos)
+        queryset = aplicar_filtros(request, queryset, filtros)
+        pagina = paginar_por_cursor(
+            queryset.values(*campos),
+            ('id',),
+            despues=request.GET.get('despues'),
+            antes=request.GET.get('antes'),
+            tamano=tamano_pagina(request),
+        )
+    except ValueError as e:  # incluye ErrorDeParametros y filtros con valores inválidos
+        return error_json(str(e), 400)
+    return JsonResponse({
+        'resultados': list(pagina),
+        'siguiente': pagina.siguiente,
+        'anterior': pagina.anterior,
+    })
+
+
+def obtener_fila(request, queryset, pk, campos_permitidos):
+    """Devuelve (fila, None) o (None, respuesta de error)."""
+    try:
+        campos = campos_pedidos(request, campos_permitidos)
+    except ErrorDeParametros as e:
+        return None, error_json(str(e), 400)
+    fila = queryset.filter(pk=pk).values(*campos).first()
+    if fila is None:
+        return None, error_json('No encontrado.', 404)
+    return fila, None
+
+
+# =========================================================================
+# VISTAS
+# =========================================================================
+
+@respuesta_condicional(Producto)
+def productos(request):
+    return lista_paginada(request, Producto.objects.all(), CAMPOS_PRODUCTO, FILTROS_PRODUCTO)
+
+
+@respuesta_condicional(Producto)
+def producto(request, pk):
+    fila, error = obtener_fila(request, Producto.objects.all(), pk, CAMPOS_PRODUCTO)
+    return error or JsonResponse(fila)
+
+
+@respuesta_condicional(OrdenDeVenta)
+def ordenes(request):
+    return lista_paginada(request, OrdenDeVenta.objects.all(), CAMPOS_ORDEN, FILTROS_ORDEN)
+
+
+@respuesta_condicional(OrdenDeVenta, DetalleOrden)
+def orden(request, pk):
+    """Una orden con sus líneas en 'detalles'."""
+    fila, error = obtener_fila(request, OrdenDeVenta.objects.all(), pk, CAMPOS_ORDEN)
+    if error:
+        return error
+    fila['detalles'] = list(
+        DetalleOrden.objects.filter(orden_id=pk).order_by('id').values(*CAMPOS_DETALLE)
+    )
+    return JsonResponse(fila)
+
+
+@respuesta_condicional(DetalleOrden)
+def detalles(request):
+    return lista_paginada(request, DetalleOrden.objects.all(), CAMPOS_DETALLE, FILTROS_DETALLE)
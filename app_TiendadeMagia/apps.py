@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AppTiendademagiaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app_TiendadeMagia'
+
+    def ready(self):
+        from . import signals
+        signals.conectar()
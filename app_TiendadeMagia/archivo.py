@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import reportes, versiones
+from .basedatos import escritura
+from .models import DetalleArchivado, DetalleOrden, OrdenArchivada, OrdenDeVenta
+
+# =========================================================================
+# ARCHIVO DE ÓRDENES CERRADAS
+# =========================================================================
+# Las órdenes 'Entregado' / 'Cancelado' con más de ARCHIVO_ANTIGUEDAD_DIAS
+# días pasan de OrdenDeVenta / DetalleOrden a OrdenArchivada /
+# DetalleArchivado, así las listas, los COUNT del admin y los agregados
+# sólo recorren las órdenes vivas.
+#
+# Se archiva por lotes de ARCHIVO_TAMANO_LOTE órdenes, cada uno en su propia
+# transacción corta (el candado de escritura de SQLite no se retiene durante
+# todo el proceso y un corte sólo pierde el lote en curso):
+#
+#   1. se eligen los pks del lote por el índice (estado, fecha_orden);
+#   2. sus aportes al resumen de ventas pasan a las filas `archivado`
+#      con una consulta agregada (reportes.pasar_al_archivo);
+#   3. se copian las órdenes y sus líneas con bulk_create;
+#   4. se borran de las tablas de trabajo con DELETE directos.
+#
+# El borrado no pasa por delete() del ORM: éste cargaría cada línea y
+# enviaría sus señales (resumen, totales, versiones), que aquí no aplican
+# porque el resumen ya se trasladó y la orden desaparece entera.
+
+ESTADOS_ARCHIVABLES = ('Entregado', 'Cancelado')
+
+CAMPOS_ORDEN = ('id', 'cliente', 'fecha_orden', 'direccion_envio', 'total', 'estado', 'metodo_pago',
+                'comentarios', 'num_lineas', 'unidades', 'producto_muestra')
+CAMPOS_DETALLE = ('id', 'orden_id', 'producto_id', 'cantidad', 'precio_unitario', 'subtotal', 'descuento',
+                  'observaciones')
+
+
+def _antiguedad_dias():
+    return getattr(settings, 'ARCHIVO_ANTIGUEDAD_DIAS', 365)
+
+
+def _tamano_lote():
+    return getattr(settings, 'ARCHIVO_TAMANO_LOTE', 500)
+
+
+def fecha_limite(antiguedad_dias=None):
+    """Se archivan las órdenes cerradas anteriores a esta fecha."""
+    dias = _antiguedad_dias() if antiguedad_dias is None else antiguedad_dias
+    return timezone.now() - timedelta(days=dias)
+
+
+def ordenes_archivables(limite):
+    return OrdenDeVenta.objects.filter(estado__in=ESTADOS_ARCHIVABLES, fecha_orden__lt=limite)
+
+
+def _borrar_sin_senales(queryset):
+    # DELETE ... WHERE directo, sin cargar las filas ni enviar señales
+    return queryset._raw_delete(queryset.db)
+
+
+def archivar_lote(pks, limite):
+    """Archiva las órdenes `pks` que sigan siendo archivables; devuelve (ordenes, lineas)."""
+    with escritura():
+        ordenes = ordenes_archivables(limite).filter(pk__in=pks)
+        filas = list(ordenes.values(*CAMPOS_ORDEN))
+        if not filas:
+            return 0, 0
+        pks = [fila['id'] for fila in filas]
+        detalles = DetalleOrden.objects.filter(orden_id__in=pks)
+
+        reportes.pasar_al_archivo(detalles)
+        ahora = timezone.now()
+        OrdenArchivada.objects.bulk_create([OrdenArchivada(archivada=ahora, **fila) for fila in filas])
+        lineas = DetalleArchivado.objects.bulk_create(
+            [DetalleArchivado(**fila) for fila in detalles.values(*CAMPOS_DETALLE)]
+        )
+
+        _borrar_sin_senales(detalles)
+        _borrar_sin_senales(OrdenDeVenta.objects.filter(pk__in=pks))
+        versiones.incrementar(OrdenDeVenta, DetalleOrden)
+    return len(filas), len(lineas)
+
+
+def archivar(antiguedad_dias=None, tamano_lote=None, al_avanzar=None):
+    """Archiva todas las órdenes cerradas anteriores al límite; devuelve (ordenes, lineas).
+
+    `al_avanzar(ordenes)` se llama después de cada lote.
+    """
+    limite = fecha_limite(antiguedad_dias)
+    tamano_lote = max(1, tamano_lote or _tamano_lote())
+    total_ordenes = total_lineas = 0
+    while True:
+        pks = list(ordenes_archivables(limite).order_by('pk').values_list('pk', flat=True)[:tamano_lote])
+        if not pks:
+            break
+        ordenes, lineas = archivar_lote(pks, limite)
+        total_ordenes += ordenes
+        total_lineas += lineas
+        if al_avanzar:
+            al_avanzar(total_ordenes)
+    return total_ordenes, total_lineas
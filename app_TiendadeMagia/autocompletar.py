@@ -0,0 +1,116 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.functions import Lower
+
+from .busqueda import filtrar_por_busqueda
+from .models import Producto, OrdenDeVenta
+
+# =========================================================================
+# AUTOCOMPLETADO DE ÓRDENES Y PRODUCTOS
+# =========================================================================
+# Reemplaza los <select> con todas las órdenes / productos de los formularios
+# de detalle (y los del admin) por búsquedas acotadas:
+#
+#   - órdenes: '#123' o '123' busca por pk; cualquier otro texto es un
+#     prefijo del cliente sin distinguir mayúsculas, resuelto como rango
+#     sobre el índice de LOWER(cliente) (orden_cliente_min_idx).
+#   - productos: número -> pk; texto -> índice FTS5 por prefijos (busqueda.py).
+#
+# Cada respuesta devuelve como máximo LIMITE_AUTOCOMPLETAR filas y se guarda
+# AUTOCOMPLETAR_TIMEOUT segundos en la caché AUTOCOMPLETAR_CACHE, así que las
+# teclas repetidas de varios usuarios no vuelven a la base.
+
+LIMITE_AUTOCOMPLETAR = 20
+
+# Mayor que cualquier carácter: 'abc' <= x < 'abc' + FIN_DE_RANGO es el prefijo 'abc'
+FIN_DE_RANGO = '\U0010ffff'
+
+
+def _cache():
+    return caches[getattr(settings, 'AUTOCOMPLETAR_CACHE', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'AUTOCOMPLETAR_TIMEOUT', 15)
+
+
+def leer_pk(texto):
+    """'123' o '#123' -> 123; cualquier otra cosa -> None."""
+    texto = texto.strip().lstrip('#')
+    return int(texto) if texto.isdigit() else None
+
+
+def filtrar_ordenes(queryset, texto):
+    """Restringe `queryset` a las órdenes cuyo pk es `texto` o cuyo cliente empieza por él."""
+    pk = leer_pk(texto)
+    if pk is not None:
+        return queryset.filter(pk=pk)
+    prefijo = texto.strip().lower()
+    if not prefijo:
+        return queryset
+    return queryset.alias(cliente_min=Lower('cliente')).filter(
+        cliente_min__gte=prefijo, cliente_min__lt=prefijo + FIN_DE_RANGO
+    )
+
+
+def filtrar_productos(queryset, texto):
+    """Restringe `queryset` a los productos cuyo pk es `texto` o que coinciden en el índice FTS."""
+    pk = leer_pk(texto)
+    if pk is not None:
+        return queryset.filter(pk=pk)
+    return filtrar_por_busqueda(queryset, texto)
+
+
+def texto_orden(pk, cliente):
+    return f'#{pk} - {cliente}'
+
+
+def texto_producto(nombre, precio, stock):
+    return f'{nombre} - ${precio:.2f} (Stock: {stock})'
+
+
+def _consultar_ordenes(texto, limite):
+    filas = (
+        filtrar_ordenes(OrdenDeVenta.objects.all(), texto)
+        .order_by(Lower('cliente'), '-fecha_orden')
+        .values_list('pk', 'cliente')[:limite]
+    )
+    return [{'id': pk, 'texto': texto_orden(pk, cliente)} for pk, cliente in filas]
+
+
+def _consultar_productos(texto, limite, disponibles):
+    productos = Producto.objects.filter(stock__gt=0) if disponibles else Producto.objects.all()
+    filas = (
+        filtrar_productos(productos, texto)
+        .order_by('nombre')
+        .values_list('pk', 'nombre', 'precio', 'stock')[:limite]
+    )
+    return [{'id': pk, 'texto': texto_producto(nombre, precio, stock)} for pk, nombre, precio, stock in filas]
+
+
+def _en_cache(tipo, texto, limite, consultar):
+    resumen = hashlib.md5(texto.strip().lower().encode('utf-8')).hexdigest()
+    clave = f'autocompletar:{tipo}:{limite}:{resumen}'
+    cache = _cache()
+    resultados = cache.get(clave)
+    if resultados is None:
+        resultados = consultar()
+        cache.set(clave, resultados, _timeout())
+    return resultados
+
+
+def ordenes(texto, limite=LIMITE_AUTOCOMPLETAR):
+    """Hasta `limite` órdenes como [{'id', 'texto'}] para `texto`."""
+    if not texto.strip():
+        return []
+    return _en_cache('ordenes', texto, limite, lambda: _consultar_ordenes(texto, limite))
+
+
+def productos(texto, limite=LIMITE_AUTOCOMPLETAR, disponibles=False):
+    """Hasta `limite` productos como [{'id', 'texto'}]; con `disponibles` sólo los que tienen stock."""
+    if not texto.strip():
+        return []
+    tipo = 'productos-disponibles' if disponibles else 'productos'
+    return _en_cache(tipo, texto, limite, lambda: _consultar_productos(texto, limite, disponibles))
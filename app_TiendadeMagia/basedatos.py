@@ -0,0 +1,61 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+
+# =========================================================================
+# AJUSTES DE CONEXIÓN A SQLITE
+# =========================================================================
+# Receptor de connection_created (conectado en signals.py) que aplica
+# settings.SQLITE_PRAGMAS a cada conexión SQLite nueva. Se ejecutan sobre la
+# conexión DB-API directamente para que no cuenten como consultas de la
+# petición en la instrumentación (instrumentacion.py).
+#
+# journal_mode = WAL no está entre ellos: se guarda en el archivo de la base
+# y basta activarlo una vez con `python manage.py activar_wal`.
+
+
+def sentencias_pragma(pragmas):
+    return [f'PRAGMA {nombre} = {valor}' for nombre, valor in pragmas.items()]
+
+
+def aplicar_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    for sentencia in sentencias_pragma(getattr(settings, 'SQLITE_PRAGMAS', {})):
+        connection.connection.execute(sentencia)
+
+
+# =========================================================================
+# TRANSACCIONES DE ESCRITURA
+# =========================================================================
+# Una transacción DEFERRED de SQLite empieza como lectora y pide el candado
+# de escritura en su primer INSERT/UPDATE; si otro escritor confirmó entre
+# tanto, falla al instante con "database is locked" sin esperar
+# busy_timeout. `escritura()` abre el bloque atómico más externo con
+# BEGIN <SQLITE_MODO_ESCRITURA> (IMMEDIATE) para pedir el candado desde el
+# inicio. Sólo la usan las rutas que leen y luego escriben; el resto de
+# transacciones (admin, sesiones, lecturas) siguen siendo DEFERRED y no
+# bloquean a los escritores.
+
+
+@contextmanager
+def escritura(using=None):
+    """transaction.atomic() que en SQLite empieza con el candado de escritura."""
+    conexion = transaction.get_connection(using)
+    modo = getattr(settings, 'SQLITE_MODO_ESCRITURA', None)
+    if conexion.vendor != 'sqlite' or not modo or conexion.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    # Al conectar, Django toma transaction_mode de OPTIONS: conectar primero
+    conexion.ensure_connection()
+    previo = conexion.transaction_mode
+    conexion.transaction_mode = modo
+    try:
+        with transaction.atomic(using=using):
+            conexion.transaction_mode = previo
+            yield
+    finally:
+        conexion.transaction_mode = previo
@@ -0,0 +1,126 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Producto
+
+# =========================================================================
+# ÍNDICE DE BÚSQUEDA DE PRODUCTOS (SQLite FTS5)
+# =========================================================================
+# Tabla virtual FTS5 con nombre, descripción, categoría y proveedor, cuyo
+# rowid es la pk del producto. Se crea en la migración 0006, se mantiene con
+# las señales de Producto y se reconstruye con `manage.py reconstruir_busqueda`.
+# En motores que no son SQLite se usa un filtro icontains como respaldo.
+
+TABLA_FTS = 'app_tiendademagia_producto_fts'
+
+# Pesos de bm25() por columna: nombre, descripcion, categoria, proveedor
+PESOS_BM25 = (10.0, 1.0, 4.0, 2.0)
+
+LIMITE_RESULTADOS = 50
+
+SQL_CREAR_TABLA = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_FTS} USING fts5("
+    "nombre, descripcion, categoria, proveedor, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+
+def fts_disponible(conexion=None):
+    return (conexion or connection).vendor == 'sqlite'
+
+
+def expresion_match(texto):
+    """Convierte lo que escribe el usuario en una consulta FTS5 por prefijos.
+
+    Cada palabra se cita (para neutralizar la sintaxis de FTS5) y se marca
+    como prefijo: 'var mag' -> '"var"* "mag"*' (todas deben aparecer).
+    """
+    palabras = re.findall(r'\w+', texto or '')
+    return ' '.join('"%s"*' % p.replace('"', '""') for p in palabras)
+
+
+def indexar_producto(producto):
+    if not fts_disponible():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLA_FTS} WHERE rowid = %s", [producto.pk])
+        cursor.execute(
+            f"INSERT INTO {TABLA_FTS} (rowid, nombre, descripcion, categoria, proveedor) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            [producto.pk, producto.nombre, producto.descripcion or '', producto.categoria,
+             producto.proveedor or ''],
+        )
+
+
+def quitar_producto(producto_pk):
+    if not fts_disponible():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLA_FTS} WHERE rowid = %s", [producto_pk])
+
+
+def reconstruir_indice(conexion=None):
+    """Vacía el índice y lo vuelve a llenar desde la tabla de productos."""
+    conexion = conexion or connection
+    if not fts_disponible(conexion):
+        return 0
+    tabla = Producto._meta.db_table
+    with conexion.cursor() as cursor:
+        cursor.execute(SQL_CREAR_TABLA)
+        cursor.execute(f"DELETE FROM {TABLA_FTS}")
+        cursor.execute(
+            f"INSERT INTO {TABLA_FTS} (rowid, nombre, descripcion, categoria, proveedor) "
+            f"SELECT id, nombre, COALESCE(descripcion, ''), categoria, COALESCE(proveedor, '') FROM {tabla}"
+        )
+        cursor.execute(f"INSERT INTO {TABLA_FTS} ({TABLA_FTS}) VALUES ('optimize')")
+        cursor.execute(f"SELECT COUNT(*) FROM {TABLA_FTS}")
+        return cursor.fetchone()[0]
+
+
+def buscar_productos(texto, limite=LIMITE_RESULTADOS):
+    """Devuelve hasta `limite` productos que coinciden con `texto`, del más relevante al menos."""
+    if fts_disponible():
+        expresion = expresion_match(texto)
+        if not expresion:
+            return []
+        pesos = ', '.join(str(p) for p in PESOS_BM25)
+        return list(Producto.objects.raw(
+            f"SELECT p.* FROM {TABLA_FTS} f JOIN {Producto._meta.db_table} p ON p.id = f.rowid "
+            f"WHERE {TABLA_FTS} MATCH %s ORDER BY bm25({TABLA_FTS}, {pesos}) LIMIT %s",
+            [expresion, limite],
+        ))
+
+    texto = (texto or '').strip()
+    if not texto:
+        return []
+    return list(Producto.objects.filter(nombre__icontains=texto).order_by('nombre')[:limite])
+
+
+def filtrar_por_busqueda(queryset, texto):
+    """Restringe `queryset` a los productos que coinciden con `texto` (sin límite).
+
+    Se usa en el admin: la coincidencia se resuelve en el índice y el resto
+    del queryset (orden, filtros, paginación) queda igual.
+    """
+    expresion = expresion_match(texto)
+    if not expresion:
+        return queryset
+    if not fts_disponible():
+        return queryset.filter(nombre__icontains=texto)
+    return queryset.filter(
+        pk__in=RawSQL(f"SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s", [expresion])
+    )
+
+
+# =========================================================================
+# RECEPTORES DE SEÑALES (conectados en signals.py)
+# =========================================================================
+
+def producto_post_save(sender, instance, raw=False, **kwargs):
+    indexar_producto(instance)
+
+
+def producto_post_delete(sender, instance, **kwargs):
+    quitar_producto(instance.pk)
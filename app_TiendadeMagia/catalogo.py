@@ -0,0 +1,105 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from .models import Producto
+
+# =========================================================================
+# CATÁLOGO DE PRODUCTOS EN CACHÉ PARA LOS FORMULARIOS DE ÓRDENES
+# =========================================================================
+# Guarda una lista compacta (pk, nombre, precio, stock) y el HTML de las
+# <option> ya renderizado. Las claves llevan un número de versión que se
+# incrementa cuando se guarda o borra un Producto (al confirmar la
+# transacción), así que nunca hay que borrar entradas: las viejas dejan de
+# leerse y expiran solas.
+#
+# CATALOGO_CACHE elige el alias de CACHES (por defecto 'default').
+
+CLAVE_VERSION = 'catalogo:version'
+
+VARIANTES = {
+    'disponibles': {'stock__gt': 0},  # agregar_orden
+    'todos': {},                      # filtros de ver_detalles
+}
+
+
+def _cache():
+    return caches[getattr(settings, 'CATALOGO_CACHE', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'CATALOGO_TIMEOUT', 3600)
+
+
+def version_actual():
+    cache = _cache()
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        # Se inicia con un valor basado en el reloj para no reutilizar una
+        # versión anterior si la clave fue desalojada de la caché.
+        cache.add(CLAVE_VERSION, time.time_ns(), timeout=None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def invalidar():
+    """Incrementa la versión del catálogo; las entradas anteriores quedan obsoletas."""
+    cache = _cache()
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        cache.set(CLAVE_VERSION, time.time_ns(), timeout=None)
+
+
+def invalidar_al_confirmar():
+    """Invalida cuando la transacción actual se confirme (o de inmediato si no hay)."""
+    transaction.on_commit(invalidar)
+
+
+def _construir(variante):
+    filas = list(
+        Producto.objects.filter(**VARIANTES[variante])
+        .order_by('nombre')
+        .values_list('pk', 'nombre', 'precio', 'stock')
+    )
+    opciones = format_html_join(
+        '\n', '<option value="{}">{} - ${} (Stock: {})</option>',
+        ((pk, nombre, f'{precio:.2f}', stock) for pk, nombre, precio, stock in filas),
+    )
+    return {'productos': filas, 'opciones': str(opciones)}
+
+
+def obtener(variante='disponibles'):
+    """Devuelve {'productos': [(pk, nombre, precio, stock)], 'opciones': html} desde la caché."""
+    clave = f'catalogo:v{version_actual()}:{variante}'
+    cache = _cache()
+    datos = cache.get(clave)
+    if datos is None:
+        datos = _construir(variante)
+        cache.set(clave, datos, timeout=_timeout())
+    return datos
+
+
+def productos(variante='disponibles'):
+    return obtener(variante)['productos']
+
+
+def opciones_productos(variante='disponibles', seleccionado=None):
+    """HTML de las <option> del catálogo, marcando `seleccionado` si se indica."""
+    html = obtener(variante)['opciones']
+    if seleccionado is not None:
+        valor = format_html('<option value="{}">', seleccionado)
+        html = html.replace(valor, valor[:-1] + ' selected>', 1)
+    return mark_safe(html)
+
+
+# =========================================================================
+# RECEPTORES DE SEÑALES (conectados en signals.py)
+# =========================================================================
+
+def producto_cambiado(sender, instance=None, **kwargs):
+    invalidar_al_confirmar()
@@ -0,0 +1,122 @@
+from django.db.models import Count
+
+from . import inventario, reportes, versiones
+from .basedatos import escritura
+from .models import ESTADO_CHOICES, TRANSICIONES_ESTADO, CambioDeEstado, DetalleOrden, OrdenDeVenta
+
+# =========================================================================
+# CAMBIOS DE ESTADO EN BLOQUE
+# =========================================================================
+# Pasa un grupo de órdenes (una selección, todas las de un estado o lo que
+# filtre el admin) a otro estado sin recorrerlas una por una:
+#
+#   1. una consulta cuenta las órdenes del grupo por estado de origen;
+#   2. por cada origen desde el que se permite la transición
+#      (TRANSICIONES_ESTADO) se traslada su aporte en el resumen de ventas
+#      con una consulta agregada y se ejecuta
+#          UPDATE orden SET estado = <nuevo> WHERE <grupo> AND estado = <origen>
+#   3. las órdenes en estados sin esa transición se cuentan como omitidas;
+#   4. se guarda UNA fila de CambioDeEstado con los conteos del lote.
+#
+# Cancelar devuelve al stock las líneas de las órdenes movidas
+# (inventario.liberar_lineas: un UPDATE de productos y un INSERT de
+# devoluciones) en la misma transacción. Una orden cancelada no tiene
+# salida hacia otro estado, así que su stock no se vuelve a reservar.
+#
+# update() no dispara las señales de OrdenDeVenta: el resumen y la versión
+# de la tabla se ajustan aquí, y ConModificadoQuerySet marca `modificado`
+# para las filas en caché de las listas.
+
+ESTADOS = [valor for valor, _ in ESTADO_CHOICES]
+ESTADO_CANCELADO = 'Cancelado'
+
+
+class TransicionInvalida(ValueError):
+    """El estado pedido no existe o la selección de órdenes está vacía."""
+
+
+class OrdenCancelada(ValueError):
+    """La orden está cancelada: su stock ya se devolvió y sus líneas no se modifican."""
+
+
+def primera_cancelada(*orden_pks):
+    """pk de la primera orden cancelada entre `orden_pks` (None si ninguna lo está)."""
+    return (
+        OrdenDeVenta.objects.filter(pk__in=orden_pks, estado=ESTADO_CANCELADO)
+        .order_by('pk').values_list('pk', flat=True).first()
+    )
+
+
+def exigir_abiertas(*orden_pks):
+    """Lanza OrdenCancelada si alguna de las órdenes está cancelada.
+
+    Se llama dentro de la transacción de escritura de la línea, para que
+    una cancelación simultánea no quede entre la comprobación y la reserva.
+    """
+    pk = primera_cancelada(*orden_pks)
+    if pk is not None:
+        raise OrdenCancelada(f'La orden #{pk} está cancelada: sus líneas ya no se pueden modificar.')
+
+
+def destinos_permitidos(estado):
+    return TRANSICIONES_ESTADO.get(estado, ())
+
+
+def leer_seleccion(datos):
+    """Lee del POST las órdenes a cambiar: 'ordenes' (pks) y/o 'desde_estado'.
+
+    Devuelve (queryset, criterio); sin ninguno de los dos no se cambia nada,
+    para no mover todas las órdenes por un formulario vacío.
+    """
+    ordenes = OrdenDeVenta.objects.all()
+    criterio = {}
+    pks = [pk for pk in datos.getlist('ordenes') if pk]
+    if pks:
+        if not all(pk.isdigit() for pk in pks):
+            raise TransicionInvalida('Los números de orden deben ser enteros.')
+        criterio['ordenes'] = sorted({int(pk) for pk in pks})
+        ordenes = ordenes.filter(pk__in=criterio['ordenes'])
+    desde_estado = datos.get('desde_estado')
+    if desde_estado:
+        if desde_estado not in ESTADOS:
+            raise TransicionInvalida(f'Estado desconocido: {desde_estado}.')
+        criterio['desde_estado'] = desde_estado
+        ordenes = ordenes.filter(estado=desde_estado)
+    if not criterio:
+        raise TransicionInvalida('Elige órdenes o un estado de origen.')
+    return ordenes, criterio
+
+
+def cambiar_estado(ordenes, estado_nuevo, usuario='', canal='vista', criterio=None):
+    """Pasa `ordenes` a `estado_nuevo` con un UPDATE por estado de origen permitido.
+
+    Devuelve {'estado_nuevo', 'movidas', 'omitidas', 'total', 'registro'}:
+    movidas/omitidas son {estado de origen: órdenes} y 'registro' el pk del
+    CambioDeEstado guardado (None si no se movió ninguna).
+    """
+    if estado_nuevo not in ESTADOS:
+        raise TransicionInvalida(f'Estado desconocido: {estado_nuevo}.')
+    resultado = {'estado_nuevo': estado_nuevo, 'movidas': {}, 'omitidas': {}, 'total': 0, 'registro': None}
+    with escritura():
+        conteos = dict(ordenes.order_by().values_list('estado').annotate(n=Count('pk')))
+        for estado in ESTADOS:
+            if not conteos.get(estado):
+                continue
+            if estado_nuevo not in destinos_permitidos(estado):
+                resultado['omitidas'][estado] = conteos[estado]
+                continue
+            grupo = ordenes.filter(estado=estado)
+            lineas = DetalleOrden.objects.filter(orden__in=grupo)
+            if estado_nuevo == ESTADO_CANCELADO:
+                inventario.liberar_lineas(lineas, nota='Orden cancelada')
+            reportes.mover_estado(lineas, estado_nuevo)
+            resultado['movidas'][estado] = grupo.update(estado=estado_nuevo)
+
+        resultado['total'] = sum(resultado['movidas'].values())
+        if resultado['total']:
+            versiones.incrementar(OrdenDeVenta)
+            resultado['registro'] = CambioDeEstado.objects.create(
+                usuario=usuario, canal=canal, estado_nuevo=estado_nuevo, criterio=criterio or {},
+                movidas=resultado['movidas'], omitidas=resultado['omitidas'], total=resultado['total'],
+            ).pk
+    return resultado
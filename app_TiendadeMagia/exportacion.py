@@ -0,0 +1,96 @@
+import csv
+import decimal
+import json
+from datetime import date, datetime
+
+from .models import DetalleOrden
+
+# =========================================================================
+# EXPORTACIÓN EN STREAMING DE ÓRDENES Y DETALLES
+# =========================================================================
+# Se lee con un iterador del servidor (sin caché del queryset) y cada fila se
+# convierte a texto en cuanto llega, así la memoria no depende del número de
+# líneas exportadas. Las columnas coinciden con las que acepta
+# `manage.py importar_ordenes`, de modo que un archivo exportado se puede
+# volver a importar.
+
+TAMANO_BLOQUE_EXPORTACION = 2000
+
+FORMATOS_EXPORTACION = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+COLUMNAS = (
+    ('referencia', 'orden_id'),
+    ('fecha_orden', 'orden__fecha_orden'),
+    ('cliente', 'orden__cliente'),
+    ('direccion_envio', 'orden__direccion_envio'),
+    ('estado', 'orden__estado'),
+    ('metodo_pago', 'orden__metodo_pago'),
+    ('comentarios', 'orden__comentarios'),
+    ('total', 'orden__total'),
+    ('detalle_id', 'pk'),
+    ('producto', 'producto_id'),
+    ('producto_nombre', 'producto__nombre'),
+    ('categoria', 'producto__categoria'),
+    ('cantidad', 'cantidad'),
+    ('precio_unitario', 'precio_unitario'),
+    ('descuento', 'descuento'),
+    ('subtotal', 'subtotal'),
+    ('observaciones', 'observaciones'),
+)
+
+ENCABEZADOS = [nombre for nombre, _ in COLUMNAS]
+
+
+def filas_exportacion(detalles=None):
+    """Itera tuplas con las COLUMNAS, agrupadas por orden (orden_id, pk)."""
+    if detalles is None:
+        detalles = DetalleOrden.objects.all()
+    return (
+        detalles.select_related(None)
+        .order_by('orden_id', 'pk')
+        .values_list(*[campo for _, campo in COLUMNAS])
+        .iterator(chunk_size=TAMANO_BLOQUE_EXPORTACION)
+    )
+
+
+class _Eco:
+    """Objeto tipo archivo que devuelve lo escrito en lugar de guardarlo."""
+
+    def write(self, valor):
+        return valor
+
+
+def _a_texto(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, decimal.Decimal):
+        return str(valor)
+    return valor
+
+
+def generar_csv(filas):
+    """Genera el CSV línea por línea; el encabezado sale antes de consultar."""
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(ENCABEZADOS)
+    for fila in filas:
+        yield escritor.writerow([_a_texto(v) for v in fila])
+
+
+def generar_jsonl(filas):
+    """Genera un objeto JSON por línea de detalle."""
+    for fila in filas:
+        yield json.dumps(
+            {nombre: _a_texto(valor) for nombre, valor in zip(ENCABEZADOS, fila)},
+            ensure_ascii=False,
+        ) + '\n'
+
+
+def generar_exportacion(formato, detalles=None):
+    """Devuelve el generador de texto para `formato` ('csv' o 'jsonl')."""
+    filas = filas_exportacion(detalles)
+    if formato == 'jsonl':
+        return generar_jsonl(filas)
+    return generar_csv(filas)
@@ -0,0 +1,61 @@
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import DetalleOrden, ESTADO_CHOICES
+
+# =========================================================================
+# FILTROS COMPARTIDOS DE DETALLES DE ORDEN
+# =========================================================================
+# Los usan ver_detalles, las exportaciones y sus comandos, para que la misma
+# combinación de parámetros seleccione las mismas filas en todos lados.
+
+
+def leer_fecha(valor):
+    """Convierte 'AAAA-MM-DD' en date; None si falta o no es válida."""
+    try:
+        return parse_date(valor or '')
+    except ValueError:
+        return None
+
+
+def inicio_del_dia(dia):
+    """Datetime con zona horaria del inicio de `dia` en la zona activa."""
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def filtrar_detalles(parametros, detalles=None):
+    """Aplica los filtros de estado, producto y rango de fechas de `parametros`.
+
+    `parametros` es cualquier mapeo (request.GET, opciones de un comando).
+    Devuelve el queryset (con orden y producto en el mismo JOIN) y los
+    valores de filtro ya normalizados para re-pintar el formulario.
+    """
+    if detalles is None:
+        detalles = DetalleOrden.objects.select_related('orden', 'producto')
+    filtros = {}
+
+    estado = parametros.get('estado')
+    if estado in dict(ESTADO_CHOICES):
+        detalles = detalles.filter(orden__estado=estado)
+        filtros['estado'] = estado
+
+    producto = str(parametros.get('producto') or '')
+    if producto.isdigit():
+        detalles = detalles.filter(producto_id=int(producto))
+        filtros['producto'] = int(producto)
+
+    # Los límites se convierten a datetimes con zona horaria para que la
+    # comparación use directamente la columna fecha_orden.
+    desde = leer_fecha(parametros.get('desde'))
+    if desde:
+        detalles = detalles.filter(orden__fecha_orden__gte=inicio_del_dia(desde))
+        filtros['desde'] = desde
+
+    hasta = leer_fecha(parametros.get('hasta'))
+    if hasta:
+        detalles = detalles.filter(orden__fecha_orden__lt=inicio_del_dia(hasta + timedelta(days=1)))
+        filtros['hasta'] = hasta
+
+    return detalles, filtros
@@ -0,0 +1,92 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+# =========================================================================
+# FILAS DE LAS LISTAS EN CACHÉ
+# =========================================================================
+# Cada fila de ver_producto, ver_ordenes y ver_detalles se renderiza con su
+# propia plantilla (fila_*.html) y se guarda en la caché FRAGMENTOS_CACHE
+# con una clave formada por el pk y la columna `modificado` de cada modelo
+# que muestra la fila. Una página lee todas sus filas con un solo get_many y
+# sólo renderiza las que cambiaron desde la última vez; nunca hay que borrar
+# entradas, las viejas dejan de pedirse y expiran solas.
+#
+# Se activa con FRAGMENTOS_ACTIVOS (modo de renderizado de producción en
+# settings.py); si no, cada fila se renderiza siempre.
+
+# Forma parte de la clave: subirla al cambiar las plantillas de fila para
+# no servir el HTML anterior que siga en la caché.
+VERSION_PLANTILLAS = 3
+
+PLANTILLAS = {
+    'producto': 'producto/fila_producto.html',
+    'orden': 'orden/fila_orden.html',
+    'detalle': 'orden/fila_detalle.html',
+}
+
+
+def _activos():
+    return getattr(settings, 'FRAGMENTOS_ACTIVOS', False)
+
+
+def _cache():
+    return caches[getattr(settings, 'FRAGMENTOS_CACHE', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'FRAGMENTOS_TIMEOUT', 86400)
+
+
+def version_producto(producto):
+    return (producto.pk, producto.modificado)
+
+
+def version_orden(orden):
+    # El resumen de líneas se guarda en la orden con update(), que marca `modificado`
+    return (orden.pk, orden.modificado)
+
+
+def version_detalle(detalle):
+    return (detalle.pk, detalle.modificado, detalle.orden.modificado, detalle.producto.modificado)
+
+
+VERSIONES = {
+    'producto': version_producto,
+    'orden': version_orden,
+    'detalle': version_detalle,
+}
+
+
+def clave_fila(tipo, version):
+    resumen = hashlib.md5(repr(version).encode('utf-8')).hexdigest()
+    return f'fila:{tipo}:v{VERSION_PLANTILLAS}:{version[0]}:{resumen}'
+
+
+def _renderizar(plantilla, tipo, objeto):
+    return plantilla.render({tipo: objeto})
+
+
+def renderizar_filas(tipo, objetos):
+    """Devuelve el HTML de las filas de `objetos` (tipo 'producto', 'orden' o 'detalle')."""
+    plantilla = get_template(PLANTILLAS[tipo])
+    objetos = list(objetos)
+    if not _activos():
+        return mark_safe(''.join(_renderizar(plantilla, tipo, objeto) for objeto in objetos))
+
+    claves = [clave_fila(tipo, VERSIONES[tipo](objeto)) for objeto in objetos]
+    cache = _cache()
+    guardadas = cache.get_many(claves)
+    nuevas = {}
+    partes = []
+    for clave, objeto in zip(claves, objetos):
+        html = guardadas.get(clave)
+        if html is None:
+            html = nuevas[clave] = _renderizar(plantilla, tipo, objeto)
+        partes.append(html)
+    if nuevas:
+        cache.set_many(nuevas, _timeout())
+    return mark_safe(''.join(partes))
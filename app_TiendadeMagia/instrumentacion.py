@@ -0,0 +1,241 @@
+import contextvars
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template as PlantillaDjango
+from django.urls import Resolver404, resolve, reverse
+
+# =========================================================================
+# INSTRUMENTACIÓN POR PETICIÓN: CONSULTAS SQL, PLANTILLAS Y TIEMPO TOTAL
+# =========================================================================
+# Se activa con INSTRUMENTACION_ACTIVA = True en settings. Para cada petición
+# registra número y tiempo de consultas SQL, tiempo de render de plantillas y
+# tiempo total; lo emite como una línea de log JSON y en las cabeceras
+# Server-Timing / X-Consultas-SQL. PRESUPUESTOS_CONSULTAS declara el máximo
+# de consultas por nombre de URL (ej. {'ver_ordenes': 3}).
+
+logger = logging.getLogger('app_TiendadeMagia.instrumentacion')
+
+# Mediciones abiertas en el contexto actual (anidables: middleware y pruebas)
+_mediciones_activas = contextvars.ContextVar('mediciones_activas', default=())
+
+
+class PresupuestoExcedido(AssertionError):
+    """Una vista hizo más consultas SQL de las declaradas en su presupuesto."""
+
+
+class Medicion:
+    """Acumula las métricas de una petición (o de un bloque de código)."""
+
+    def __init__(self, guardar_sql=False):
+        self.guardar_sql = guardar_sql
+        self.consultas = 0
+        self.tiempo_sql = 0.0
+        self.tiempo_plantillas = 0.0
+        self.sql = []
+        self.inicio = time.perf_counter()
+        self.tiempo_total = None
+
+    def terminar(self):
+        self.tiempo_total = time.perf_counter() - self.inicio
+
+    def como_dict(self):
+        return {
+            'consultas': self.consultas,
+            'sql_ms': round(self.tiempo_sql * 1000, 2),
+            'plantillas_ms': round(self.tiempo_plantillas * 1000, 2),
+            'total_ms': round((self.tiempo_total or 0) * 1000, 2),
+        }
+
+
+def contar_consultas(execute, sql, params, many, context):
+    """execute_wrapper fijo de cada conexión: suma la consulta a las mediciones activas.
+
+    Se instala en todas las conexiones (signals.py) y no dentro de `medir`
+    porque las conexiones son por hilo: bajo ASGI el ORM de una vista async
+    corre en el hilo de sync_to_async, no en el que abrió la medición. Las
+    contextvars sí viajan a ese hilo, así que cada consulta se cuenta sólo
+    en las mediciones de su propia petición.
+    """
+    mediciones = _mediciones_activas.get()
+    if not mediciones:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        transcurrido = time.perf_counter() - inicio
+        for medicion in mediciones:
+            medicion.consultas += 1
+            medicion.tiempo_sql += transcurrido
+            if medicion.guardar_sql:
+                medicion.sql.append(sql)
+
+
+def instalar_contador_sql(sender=None, connection=None, **kwargs):
+    """Receptor de connection_created; también se llama a mano para las conexiones ya abiertas."""
+    if contar_consultas not in connection.execute_wrappers:
+        connection.execute_wrappers.append(contar_consultas)
+
+
+_render_original = PlantillaDjango.render
+
+
+def _render_medido(self, context=None, request=None):
+    mediciones = _mediciones_activas.get()
+    if not mediciones:
+        return _render_original(self, context, request)
+    inicio = time.perf_counter()
+    try:
+        return _render_original(self, context, request)
+    finally:
+        transcurrido = time.perf_counter() - inicio
+        for medicion in mediciones:
+            medicion.tiempo_plantillas += transcurrido
+
+
+def instalar_medicion_plantillas():
+    """Envuelve el render del backend de plantillas de Django (una sola vez)."""
+    if PlantillaDjango.render is not _render_medido:
+        PlantillaDjango.render = _render_medido
+
+
+@contextmanager
+def medir(guardar_sql=False):
+    """Mide las consultas SQL y el render de plantillas del bloque.
+
+    Funciona con DEBUG = False porque usa execute_wrapper en cada conexión.
+    """
+    instalar_medicion_plantillas()
+    for conexion in connections.all(initialized_only=True):
+        instalar_contador_sql(connection=conexion)
+    medicion = Medicion(guardar_sql)
+    token = _mediciones_activas.set(_mediciones_activas.get() + (medicion,))
+    try:
+        yield medicion
+    finally:
+        medicion.terminar()
+        _mediciones_activas.reset(token)
+
+
+def presupuesto_para(nombre_url):
+    return getattr(settings, 'PRESUPUESTOS_CONSULTAS', {}).get(nombre_url)
+
+
+def verificar_presupuesto(nombre_url, medicion):
+    """Lanza PresupuestoExcedido si la medición supera el presupuesto de `nombre_url`."""
+    limite = presupuesto_para(nombre_url)
+    if limite is not None and medicion.consultas > limite:
+        detalle = '\n'.join(medicion.sql)
+        raise PresupuestoExcedido(
+            f"La vista '{nombre_url}' hizo {medicion.consultas} consultas SQL "
+            f"(presupuesto: {limite}).{chr(10) + detalle if detalle else ''}"
+        )
+
+
+def cabecera_server_timing(medicion):
+    return ', '.join([
+        f'sql;dur={medicion.tiempo_sql * 1000:.2f};desc="{medicion.consultas} consultas"',
+        f'plantillas;dur={medicion.tiempo_plantillas * 1000:.2f}',
+        f'total;dur={(medicion.tiempo_total or 0) * 1000:.2f}',
+    ])
+
+
+class InstrumentacionMiddleware:
+    """Middleware opcional que mide cada petición y aplica los presupuestos.
+
+    Con INSTRUMENTACION_ESTRICTA = True una vista que excede su presupuesto
+    lanza PresupuestoExcedido (útil en pruebas); si no, sólo se registra una
+    advertencia. En respuestas en streaming sólo se mide lo ocurrido antes
+    de empezar a enviar el cuerpo.
+
+    Acepta cadenas síncronas y asíncronas: bajo ASGI las vistas async se
+    esperan directamente, sin pasar por el adaptador a un hilo.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTACION_ACTIVA', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.estricta = getattr(settings, 'INSTRUMENTACION_ESTRICTA', False)
+        instalar_medicion_plantillas()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        nombre_url = self._nombre_url(request)
+        with medir(guardar_sql=self.estricta) as medicion:
+            response = self.get_response(request)
+        return self._registrar(request, nombre_url, medicion, response)
+
+    async def __acall__(self, request):
+        nombre_url = self._nombre_url(request)
+        with medir(guardar_sql=self.estricta) as medicion:
+            response = await self.get_response(request)
+        return self._registrar(request, nombre_url, medicion, response)
+
+    @staticmethod
+    def _nombre_url(request):
+        try:
+            return resolve(request.path_info).url_name
+        except Resolver404:
+            return None
+
+    def _registrar(self, request, nombre_url, medicion, response):
+        registro = {
+            'vista': nombre_url,
+            'metodo': request.method,
+            'ruta': request.path,
+            'estado': response.status_code,
+            **medicion.como_dict(),
+        }
+        limite = presupuesto_para(nombre_url)
+        excedido = limite is not None and medicion.consultas > limite
+        if limite is not None:
+            registro['presupuesto'] = limite
+
+        response['Server-Timing'] = cabecera_server_timing(medicion)
+        response['X-Consultas-SQL'] = str(medicion.consultas)
+
+        if excedido:
+            logger.warning(json.dumps({**registro, 'presupuesto_excedido': True}))
+            if self.estricta:
+                verificar_presupuesto(nombre_url, medicion)
+        else:
+            logger.info(json.dumps(registro))
+        return response
+
+
+# =========================================================================
+# AYUDA PARA PRUEBAS
+# =========================================================================
+
+class PresupuestoConsultasMixin:
+    """Mixin para TestCase: `assertPresupuesto` ejecuta una petición y verifica su presupuesto.
+
+        respuesta = self.assertPresupuesto('ver_ordenes')
+        respuesta = self.assertPresupuesto('editar_orden', args=[orden.pk])
+    """
+
+    def assertPresupuesto(self, nombre_url, args=None, kwargs=None, datos=None, metodo='get'):
+        limite = presupuesto_para(nombre_url)
+        if limite is None:
+            self.fail(f"No hay presupuesto declarado para '{nombre_url}' en PRESUPUESTOS_CONSULTAS.")
+        url = reverse(nombre_url, args=args, kwargs=kwargs)
+        with medir(guardar_sql=True) as medicion:
+            respuesta = getattr(self.client, metodo)(url, datos or {})
+            if getattr(respuesta, 'streaming', False):
+                b''.join(respuesta.streaming_content)
+        verificar_presupuesto(nombre_url, medicion)
+        return respuesta
@@ -0,0 +1,184 @@
+from collections import Counter
+
+from django.db.models import F, OuterRef, Subquery, Sum
+
+from . import catalogo, versiones
+from .models import Producto, DetalleOrden, MovimientoInventario
+
+# =========================================================================
+# RESERVA DE STOCK
+# =========================================================================
+# Cada línea de orden descuenta su cantidad del stock del producto con un
+# UPDATE condicional:
+#
+#     UPDATE producto SET stock = stock - n WHERE id = %s AND stock >= n
+#
+# Si no se actualizó ninguna fila es que no alcanzaba: no hay lectura previa
+# que pueda quedar vieja, así que dos pedidos simultáneos nunca venden la
+# misma unidad. Conviene llamarlo como PRIMERA escritura de la transacción:
+# en SQLite toma el candado de escritura desde el inicio y en PostgreSQL
+# bloquea sólo la fila del producto.
+#
+# UPDATE no dispara señales, así que cada cambio invalida a mano el catálogo
+# en caché de los formularios (catalogo.py) y la versión de la tabla
+# (versiones.py).
+#
+# Cada cambio agrega además un MovimientoInventario (venta, devolución,
+# recepción o ajuste) en la misma transacción, ligado a la línea de orden
+# cuando la hay. Quien reserva antes de crear la línea (y aún no tiene su
+# pk) pasa registrar=False y llama después a `registrar_movimientos`.
+
+RECEPCION, VENTA, DEVOLUCION, AJUSTE = 'recepcion', 'venta', 'devolucion', 'ajuste'
+
+
+class StockInsuficiente(ValueError):
+    """No hay stock suficiente para reservar la cantidad pedida."""
+
+    def __init__(self, producto_pk, cantidad):
+        self.producto_pk = producto_pk
+        self.cantidad = cantidad
+        disponible = Producto.objects.filter(pk=producto_pk).values_list('nombre', 'stock').first()
+        if disponible is None:
+            mensaje = f'El producto #{producto_pk} ya no existe.'
+        else:
+            nombre, stock = disponible
+            mensaje = f'Stock insuficiente para "{nombre}": se pidieron {cantidad} y quedan {stock}.'
+        super().__init__(mensaje)
+
+
+def registrar_movimientos(movimientos):
+    """Agrega al historial una lista de MovimientoInventario (un solo INSERT)."""
+    return MovimientoInventario.objects.bulk_create([m for m in movimientos if m.cantidad])
+
+
+def registrar_movimiento(producto_pk, tipo, cantidad, detalle_id=None, nota=''):
+    registrar_movimientos([MovimientoInventario(
+        producto_id=producto_pk, tipo=tipo, cantidad=cantidad, detalle_id=detalle_id, nota=nota,
+    )])
+
+
+def reservar_stock(producto_pk, cantidad, detalle_id=None, registrar=True):
+    """Descuenta `cantidad` del stock o lanza StockInsuficiente sin tocar nada."""
+    if cantidad <= 0:
+        return
+    actualizados = Producto.objects.filter(pk=producto_pk, stock__gte=cantidad).update(
+        stock=F('stock') - cantidad
+    )
+    if not actualizados:
+        raise StockInsuficiente(producto_pk, cantidad)
+    if registrar:
+        registrar_movimiento(producto_pk, VENTA, -cantidad, detalle_id)
+    versiones.incrementar(Producto)
+    catalogo.invalidar_al_confirmar()
+
+
+def liberar_stock(producto_pk, cantidad, detalle_id=None, tipo=DEVOLUCION, nota='', registrar=True):
+    """Devuelve (o recibe, con tipo=RECEPCION) `cantidad` unidades al stock del producto."""
+    if cantidad <= 0:
+        return
+    Producto.objects.filter(pk=producto_pk).update(stock=F('stock') + cantidad)
+    if registrar:
+        registrar_movimiento(producto_pk, tipo, cantidad, detalle_id, nota)
+    versiones.incrementar(Producto)
+    catalogo.invalidar_al_confirmar()
+
+
+def ajustar_stock(producto_pk, cantidad, nota=''):
+    """Corrige el stock en `cantidad` (con signo) sin dejarlo bajo 0; devuelve si se aplicó."""
+    if not cantidad:
+        return False
+    actualizados = Producto.objects.filter(pk=producto_pk, stock__gte=max(0, -cantidad)).update(
+        stock=F('stock') + cantidad
+    )
+    if actualizados:
+        registrar_movimiento(producto_pk, AJUSTE, cantidad, nota=nota)
+        versiones.incrementar(Producto)
+        catalogo.invalidar_al_confirmar()
+    return bool(actualizados)
+
+
+def ajustar_reserva(producto_anterior_pk, cantidad_anterior, producto_nuevo_pk, cantidad_nueva, detalle_id=None):
+    """Mueve la reserva de una línea editada (cambio de cantidad y/o de producto).
+
+    Primero se reserva lo nuevo y después se libera lo anterior, para que un
+    fallo por falta de stock no deje nada a medias.
+    """
+    if producto_anterior_pk == producto_nuevo_pk:
+        diferencia = cantidad_nueva - cantidad_anterior
+        if diferencia > 0:
+            reservar_stock(producto_nuevo_pk, diferencia, detalle_id)
+        else:
+            liberar_stock(producto_nuevo_pk, -diferencia, detalle_id)
+        return
+    reservar_stock(producto_nuevo_pk, cantidad_nueva, detalle_id)
+    liberar_stock(producto_anterior_pk, cantidad_anterior, detalle_id)
+
+
+def reservar_lineas(cantidades, registrar=True):
+    """Reserva varias líneas ({producto_pk: cantidad}) o ninguna.
+
+    Se recorren en orden de pk para que dos transacciones que reservan los
+    mismos productos tomen los candados de fila en el mismo orden.
+    """
+    for producto_pk, cantidad in sorted(Counter(cantidades).items()):
+        reservar_stock(producto_pk, cantidad, registrar=registrar)
+
+
+def liberar_lineas(lineas, nota=''):
+    """Devuelve al stock las cantidades de `lineas` (queryset de DetalleOrden).
+
+    Un solo UPDATE suma a cada producto lo de sus líneas y un INSERT
+    registra una devolución por línea; devuelve cuántas líneas se liberaron.
+    """
+    movimientos = [
+        MovimientoInventario(producto_id=producto_pk, tipo=DEVOLUCION, cantidad=cantidad, detalle_id=pk, nota=nota)
+        for pk, producto_pk, cantidad in lineas.order_by('producto', 'pk').values_list('pk', 'producto', 'cantidad')
+    ]
+    if not movimientos:
+        return 0
+    devueltas = (
+        lineas.filter(producto=OuterRef('pk'))
+        .order_by().values('producto').annotate(unidades=Sum('cantidad')).values('unidades')
+    )
+    Producto.objects.filter(pk__in={m.producto_id for m in movimientos}).update(
+        stock=F('stock') + Subquery(devueltas)
+    )
+    registrar_movimientos(movimientos)
+    versiones.incrementar(Producto)
+    catalogo.invalidar_al_confirmar()
+    return len(movimientos)
+
+
+def liberar_orden(orden_pk):
+    """Devuelve al stock las cantidades de todas las líneas de la orden.
+
+    Debe llamarse antes de borrar la orden (el borrado en cascada de sus
+    líneas no pasa por aquí). Registra una devolución por línea.
+    """
+    liberar_lineas(DetalleOrden.objects.filter(orden_id=orden_pk))
+
+
+# -------------------------------------------------------------------------
+# Cambios de stock hechos con save() (formularios de producto, admin)
+# -------------------------------------------------------------------------
+# Un producto nuevo entra como recepción de su stock inicial; editar el campo
+# stock a mano queda como ajuste por la diferencia.
+
+def producto_pre_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._stock_anterior = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and 'stock' not in update_fields:
+        return
+    instance._stock_anterior = Producto.objects.filter(pk=instance.pk).values_list('stock', flat=True).first()
+
+
+def producto_post_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        registrar_movimiento(instance.pk, RECEPCION, int(instance.stock or 0), nota='Alta del producto')
+        return
+    anterior = getattr(instance, '_stock_anterior', None)
+    if anterior is not None and instance.stock != anterior:
+        registrar_movimiento(instance.pk, AJUSTE, int(instance.stock) - anterior, nota='Edición del producto')
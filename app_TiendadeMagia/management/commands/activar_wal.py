@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Cambia la base SQLite a journal_mode = WAL (lectores y un escritor a la vez). "
+        "El modo queda guardado en el archivo, así que basta ejecutarlo una vez."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Alias de la base de datos (por defecto "default").'
+        )
+        parser.add_argument(
+            '--revertir', action='store_true',
+            help='Vuelve al diario clásico (journal_mode = DELETE).'
+        )
+
+    def handle(self, *args, **options):
+        conexion = connections[options['database']]
+        if conexion.vendor != 'sqlite':
+            raise CommandError(f"La base '{options['database']}' no es SQLite.")
+
+        modo = 'DELETE' if options['revertir'] else 'WAL'
+        with conexion.cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode = {modo}')
+            resultado = cursor.fetchone()[0].upper()
+        if resultado != modo:
+            raise CommandError(f"SQLite no aceptó journal_mode = {modo} (quedó en {resultado}).")
+        self.stdout.write(self.style.SUCCESS(f"journal_mode = {resultado} en {conexion.settings_dict['NAME']}."))
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app_TiendadeMagia import ajustes
+
+
+class Command(BaseCommand):
+    help = (
+        "Ajusta el precio y/o el stock de todos los productos de una categoría y/o proveedor "
+        "con un solo UPDATE. Muestra antes una vista previa; con --simular no modifica nada."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categoria', help='Sólo productos de esta categoría.')
+        parser.add_argument('--proveedor', help='Sólo productos de este proveedor.')
+        precio = parser.add_mutually_exclusive_group()
+        precio.add_argument('--precio-porcentaje', help='Cambia el precio en este porcentaje (p. ej. 10 o -5).')
+        precio.add_argument('--precio-monto', help='Suma este monto al precio (p. ej. 2.50 o -1).')
+        stock = parser.add_mutually_exclusive_group()
+        stock.add_argument('--stock-porcentaje', help='Cambia el stock en este porcentaje (redondeado).')
+        stock.add_argument('--stock-monto', help='Suma estas unidades al stock (entero).')
+        parser.add_argument(
+            '--repreciar-pendientes', action='store_true',
+            help='Aplica el precio nuevo a las líneas de órdenes Pendientes y recalcula sus totales.'
+        )
+        parser.add_argument('--simular', action='store_true', help='Sólo muestra la vista previa.')
+
+    def handle(self, *args, **options):
+        try:
+            if options['precio_porcentaje'] is not None:
+                precio = ajustes.leer_ajuste('porcentaje', options['precio_porcentaje'])
+            else:
+                precio = ajustes.leer_ajuste('monto', options['precio_monto'])
+            if options['stock_porcentaje'] is not None:
+                stock = ajustes.leer_ajuste('porcentaje', options['stock_porcentaje'], entero=True)
+            else:
+                stock = ajustes.leer_ajuste('monto', options['stock_monto'], entero=True)
+        except ajustes.AjusteInvalido as e:
+            raise CommandError(str(e))
+        if precio is None and stock is None:
+            raise CommandError('Indica un ajuste de precio, de stock o ambos.')
+
+        productos = ajustes.productos_filtrados(options['categoria'], options['proveedor'])
+        repreciar = options['repreciar_pendientes']
+
+        previa = ajustes.vista_previa(productos, precio, stock, repreciar)
+        self.stdout.write(
+            f"{previa['productos']} productos. "
+            f"Precio {previa['precio_min']}-{previa['precio_max']} -> "
+            f"{previa['precio_nuevo_min']}-{previa['precio_nuevo_max']}; "
+            f"stock {previa['stock_total']} -> {previa['stock_nuevo']}; "
+            f"valor del inventario {previa['valor_inventario']} -> {previa['valor_nuevo']}."
+        )
+        if 'lineas_pendientes' in previa:
+            self.stdout.write(
+                f"{previa['lineas_pendientes']} líneas de órdenes pendientes; "
+                f"sus totales cambian en {previa['delta_pendientes']}."
+            )
+        if options['simular']:
+            self.stdout.write(self.style.WARNING('Simulación: no se modificó nada.'))
+            return
+
+        resultado = ajustes.aplicar(productos, precio, stock, repreciar)
+        self.stdout.write(self.style.SUCCESS(
+            f"Ajuste aplicado: {resultado['productos']} productos, {resultado['lineas']} líneas "
+            f"y {resultado['ordenes']} órdenes pendientes actualizadas."
+        ))
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app_TiendadeMagia.archivo import archivar, fecha_limite, ordenes_archivables
+
+
+class Command(BaseCommand):
+    help = (
+        "Pasa a las tablas de archivo las órdenes 'Entregado' y 'Cancelado' más antiguas que "
+        "ARCHIVO_ANTIGUEDAD_DIAS, por lotes de una transacción cada uno."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias', type=int, default=None,
+            help='Antigüedad mínima en días (por defecto ARCHIVO_ANTIGUEDAD_DIAS).'
+        )
+        parser.add_argument(
+            '--lote', type=int, default=None,
+            help='Órdenes archivadas por transacción (por defecto ARCHIVO_TAMANO_LOTE).'
+        )
+        parser.add_argument(
+            '--simular', action='store_true',
+            help='Sólo cuenta las órdenes que se archivarían.'
+        )
+
+    def handle(self, *args, **options):
+        if options['simular']:
+            limite = fecha_limite(options['dias'])
+            cantidad = ordenes_archivables(limite).count()
+            self.stdout.write(f"{cantidad} órdenes cerradas anteriores a {limite:%Y-%m-%d} se archivarían.")
+            return
+
+        verbosidad = options['verbosity']
+
+        def al_avanzar(ordenes):
+            if verbosidad > 1:
+                self.stdout.write(f"{ordenes} órdenes archivadas...")
+
+        inicio = time.perf_counter()
+        ordenes, lineas = archivar(options['dias'], options['lote'], al_avanzar=al_avanzar)
+        self.stdout.write(self.style.SUCCESS(
+            f"Archivo terminado: {ordenes} órdenes y {lineas} líneas en {time.perf_counter() - inicio:.2f} s."
+        ))
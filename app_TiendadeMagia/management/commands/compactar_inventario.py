@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app_TiendadeMagia.movimientos import compactar, tomar_fotos
+
+
+class Command(BaseCommand):
+    help = (
+        "Guarda una foto del stock de cada producto y reemplaza por fotos los movimientos de "
+        "inventario más antiguos que INVENTARIO_CONSERVAR_DIAS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--conservar-dias', type=int, default=None,
+            help='Días de movimientos que se conservan (por defecto INVENTARIO_CONSERVAR_DIAS).'
+        )
+        parser.add_argument(
+            '--solo-fotos', action='store_true',
+            help='Sólo guarda la foto actual, sin borrar movimientos.'
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        fotos = tomar_fotos()
+        if options['solo_fotos']:
+            self.stdout.write(self.style.SUCCESS(f"{fotos} fotos de inventario guardadas."))
+            return
+
+        fotos_corte, borrados = compactar(options['conservar_dias'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Inventario compactado: {fotos + fotos_corte} fotos guardadas y {borrados} movimientos "
+            f"reemplazados en {time.perf_counter() - inicio:.2f} s."
+        ))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from app_TiendadeMagia.totales import buscar_resumenes_desfasados, conciliar_por_bloques, recalcular_resumenes
+
+
+class Command(BaseCommand):
+    help = (
+        "Busca órdenes cuyo resumen (num_lineas, unidades, producto_muestra) no coincide con "
+        "sus detalles y lo corrige; también sirve para llenarlo la primera vez. "
+        "Recorre la tabla por bloques de pk para no cargarla completa."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=1000,
+            help='Número de órdenes revisadas por consulta (por defecto 1000).'
+        )
+        parser.add_argument(
+            '--solo-reportar', action='store_true',
+            help='Muestra las diferencias sin modificar la base de datos.'
+        )
+
+    def handle(self, *args, **options):
+        lote = max(1, options['lote'])
+        solo_reportar = options['solo_reportar']
+        verbosidad = options['verbosity']
+
+        revisadas = corregidas = 0
+        for en_bloque, desfasadas in conciliar_por_bloques(
+            buscar_resumenes_desfasados, recalcular_resumenes, lote=lote, solo_reportar=solo_reportar
+        ):
+            revisadas += en_bloque
+            if verbosidad > 1:
+                for pk, guardado, calculado in desfasadas:
+                    self.stdout.write(f"Orden #{pk}: guardado {guardado} / calculado {calculado}")
+            corregidas += len(desfasadas)
+
+        accion = 'con diferencias' if solo_reportar else 'corregidas'
+        self.stdout.write(self.style.SUCCESS(
+            f"Conciliación terminada: {revisadas} órdenes revisadas, {corregidas} {accion}."
+        ))
@@ -0,0 +1,80 @@
+import signal
+import subprocess
+import sys
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app_TiendadeMagia.tareas import TIPOS_TAREA, ejecutar_hilos
+
+
+class Command(BaseCommand):
+    help = (
+        "Ejecuta las tareas en segundo plano (exportaciones, reconstrucción del resumen, "
+        "conciliaciones) que encolan las vistas. Corre hasta recibir Ctrl+C / SIGTERM."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hilos', type=int, default=2,
+            help='Hilos trabajadores por proceso (por defecto 2).'
+        )
+        parser.add_argument(
+            '--procesos', type=int, default=0,
+            help='Procesos trabajadores, cada uno con --hilos hilos (por defecto 0: sólo este proceso).'
+        )
+        parser.add_argument(
+            '--espera', type=float, default=1.0,
+            help='Segundos entre consultas a la cola cuando está vacía (por defecto 1).'
+        )
+        parser.add_argument(
+            '--una-vez', action='store_true',
+            help='Termina en cuanto la cola queda vacía (útil en cron o en pruebas).'
+        )
+
+    def handle(self, *args, **options):
+        hilos = max(1, options['hilos'])
+        procesos = max(0, options['procesos'])
+        espera = max(0.05, options['espera'])
+        una_vez = options['una_vez']
+
+        tipos = ', '.join(sorted(TIPOS_TAREA))
+        forma = f'{procesos} procesos x {hilos} hilos' if procesos else f'{hilos} hilos'
+        if options['verbosity']:
+            self.stdout.write(f'Trabajadores de tareas ({forma}); tipos: {tipos}.')
+
+        anteriores = {senal: signal.getsignal(senal) for senal in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            if procesos:
+                self._con_procesos(procesos, hilos, espera, una_vez)
+            else:
+                detener = threading.Event()
+                for senal in anteriores:
+                    signal.signal(senal, lambda *_: detener.set())
+                ejecutar_hilos(hilos, espera, una_vez, detener)
+        finally:
+            for senal, manejador in anteriores.items():
+                signal.signal(senal, manejador)
+
+        if options['verbosity']:
+            self.stdout.write(self.style.SUCCESS('Trabajadores detenidos.'))
+
+    def _con_procesos(self, procesos, hilos, espera, una_vez):
+        # Cada proceso es este mismo comando sin --procesos: abre sus propias
+        # conexiones y atiende SIGTERM terminando la tarea en curso
+        comando = [sys.executable, '-m', 'django', 'ejecutar_tareas',
+                   '--hilos', str(hilos), '--espera', str(espera), '--verbosity', '0']
+        if una_vez:
+            comando.append('--una-vez')
+        pool = [subprocess.Popen(comando, cwd=settings.BASE_DIR) for _ in range(procesos)]
+
+        def detener(*_):
+            for proceso in pool:
+                if proceso.poll() is None:
+                    proceso.terminate()
+
+        signal.signal(signal.SIGTERM, detener)
+        signal.signal(signal.SIGINT, detener)
+        for proceso in pool:
+            proceso.wait()
@@ -0,0 +1,56 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app_TiendadeMagia.exportacion import FORMATOS_EXPORTACION, generar_exportacion
+from app_TiendadeMagia.filtros import filtrar_detalles
+from app_TiendadeMagia.models import ESTADO_CHOICES
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta las órdenes con sus detalles y productos como CSV o JSONL, "
+        "leyendo por bloques para mantener la memoria constante."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--formato', choices=sorted(FORMATOS_EXPORTACION), default='csv',
+            help='Formato de salida (por defecto csv).'
+        )
+        parser.add_argument(
+            '--salida', default='-',
+            help="Archivo de destino ('-' para stdout, valor por defecto)."
+        )
+        parser.add_argument('--estado', choices=[valor for valor, _ in ESTADO_CHOICES])
+        parser.add_argument('--producto', type=int, help='Id del producto.')
+        parser.add_argument('--desde', help='Fecha inicial de la orden (AAAA-MM-DD).')
+        parser.add_argument('--hasta', help='Fecha final de la orden, inclusive (AAAA-MM-DD).')
+
+    def handle(self, *args, **options):
+        detalles, _ = filtrar_detalles(options)
+        ruta = options['salida']
+
+        try:
+            destino = sys.stdout if ruta == '-' else open(ruta, 'w', newline='', encoding='utf-8')
+        except OSError as e:
+            raise CommandError(f'No se pudo abrir {ruta}: {e}')
+
+        inicio = time.perf_counter()
+        lineas = 0
+        try:
+            for texto in generar_exportacion(options['formato'], detalles):
+                destino.write(texto)
+                lineas += 1
+        finally:
+            if destino is not sys.stdout:
+                destino.close()
+
+        if options['formato'] == 'csv':
+            lineas -= 1  # encabezado
+        transcurrido = max(time.perf_counter() - inicio, 1e-9)
+        self.stderr.write(self.style.SUCCESS(
+            f'Exportación terminada: {lineas} detalles en {transcurrido:.2f} s '
+            f'({lineas / transcurrido:,.0f} detalles/s).'
+        ))
@@ -0,0 +1,287 @@
+import csv
+import decimal
+import json
+import sys
+import time
+from itertools import groupby, islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app_TiendadeMagia.models import (
+    Producto,
+    OrdenDeVenta,
+    DetalleOrden,
+    MovimientoInventario,
+    ESTADO_CHOICES,
+    METODO_CHOICES,
+)
+from app_TiendadeMagia import versiones
+from app_TiendadeMagia.basedatos import escritura
+from app_TiendadeMagia.estados import ESTADO_CANCELADO
+from app_TiendadeMagia.inventario import VENTA, StockInsuficiente, registrar_movimientos, reservar_lineas
+from app_TiendadeMagia.reportes import acumular_detalles
+
+CERO = decimal.Decimal('0.00')
+
+
+class ErrorDeFila(ValueError):
+    """Una orden del archivo no se puede importar; se omite y se reporta."""
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa órdenes de venta y sus detalles desde un archivo CSV o JSONL.\n\n"
+        "CSV: una fila por línea de pedido con las columnas referencia, cliente, "
+        "direccion_envio, estado, metodo_pago, comentarios, producto, cantidad, "
+        "precio_unitario, descuento y observaciones. Las filas con la misma "
+        "referencia (consecutivas) forman una sola orden.\n"
+        "JSONL: un objeto por línea, ya sea una orden con una lista 'detalles' o "
+        "una línea plana con las mismas columnas que el CSV.\n"
+        "'producto' acepta el id o el nombre exacto del producto.\n"
+        "Cada orden descuenta su stock; las que no alcanzan se omiten y se reportan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="Ruta del archivo a importar ('-' para leer de stdin).")
+        parser.add_argument(
+            '--formato', choices=['csv', 'jsonl'],
+            help='Formato del archivo. Por defecto se deduce de la extensión.'
+        )
+        parser.add_argument(
+            '--lote', type=int, default=500,
+            help='Órdenes por transacción (por defecto 500).'
+        )
+        parser.add_argument(
+            '--delimitador', default=',',
+            help='Separador de columnas para CSV (por defecto ",").'
+        )
+
+    # ---------------------------------------------------------------------
+    # LECTURA EN STREAMING
+    # ---------------------------------------------------------------------
+
+    def _leer_csv(self, archivo, delimitador):
+        """Agrupa las filas consecutivas con la misma referencia en una orden."""
+        filas = enumerate(csv.DictReader(archivo, delimiter=delimitador), start=2)
+        for referencia, grupo in groupby(filas, key=lambda f: f[1].get('referencia') or f'#fila-{f[0]}'):
+            grupo = list(grupo)
+            yield grupo[0][0], referencia, grupo[0][1], [fila for _, fila in grupo]
+
+    def _leer_jsonl(self, archivo):
+        def lineas():
+            for numero, texto in enumerate(archivo, start=1):
+                if not texto.strip():
+                    continue
+                try:
+                    yield numero, json.loads(texto)
+                except ValueError as e:
+                    yield numero, ErrorDeFila(f'JSON inválido: {e}')
+
+        def clave(item):
+            numero, obj = item
+            if isinstance(obj, dict) and not isinstance(obj.get('detalles'), list) and obj.get('referencia'):
+                return obj['referencia']
+            return f'#linea-{numero}'
+
+        for referencia, grupo in groupby(lineas(), key=clave):
+            grupo = list(grupo)
+            numero, primero = grupo[0]
+            if isinstance(primero, dict) and isinstance(primero.get('detalles'), list):
+                yield numero, primero.get('referencia') or referencia, primero, primero['detalles']
+            else:
+                yield numero, referencia, primero, [obj for _, obj in grupo]
+
+    # ---------------------------------------------------------------------
+    # CONSTRUCCIÓN DE OBJETOS
+    # ---------------------------------------------------------------------
+
+    def _cargar_productos(self):
+        """Tabla en memoria id/nombre -> (pk, precio) para no consultar por fila."""
+        por_id, por_nombre, categorias, nombres = {}, {}, {}, {}
+        for pk, nombre, precio, categoria in Producto.objects.values_list(
+            'pk', 'nombre', 'precio', 'categoria'
+        ).iterator():
+            por_id[str(pk)] = (pk, precio)
+            por_nombre.setdefault(nombre.strip().lower(), (pk, precio))
+            categorias[pk] = categoria
+            nombres[pk] = nombre
+        return por_id, por_nombre, categorias, nombres
+
+    def _resolver_producto(self, valor):
+        valor = str(valor or '').strip()
+        encontrado = self.productos_por_id.get(valor) or self.productos_por_nombre.get(valor.lower())
+        if encontrado is None:
+            raise ErrorDeFila(f"Producto desconocido: '{valor}'")
+        return encontrado
+
+    def _decimal(self, valor, defecto):
+        if valor in (None, ''):
+            return defecto
+        try:
+            return decimal.Decimal(str(valor))
+        except decimal.InvalidOperation:
+            raise ErrorDeFila(f"Número inválido: '{valor}'")
+
+    def _construir_orden(self, cabecera, lineas):
+        """Valida una orden y devuelve (OrdenDeVenta, [DetalleOrden]) sin guardar."""
+        for obj in (cabecera, *lineas):
+            if isinstance(obj, Exception):
+                raise obj
+            if not isinstance(obj, dict):
+                raise ErrorDeFila('Se esperaba un objeto JSON.')
+
+        cliente = (cabecera.get('cliente') or '').strip()
+        direccion = (cabecera.get('direccion_envio') or '').strip()
+        if not cliente or not direccion:
+            raise ErrorDeFila('Faltan cliente o direccion_envio.')
+        estado = cabecera.get('estado') or 'Pendiente'
+        metodo = cabecera.get('metodo_pago') or 'Efectivo'
+        if estado not in self.estados or metodo not in self.metodos:
+            raise ErrorDeFila(f"Estado o método de pago inválido: '{estado}' / '{metodo}'")
+        if not lineas:
+            raise ErrorDeFila('La orden no tiene detalles.')
+
+        # unique_together('orden', 'producto'): las líneas repetidas se fusionan
+        detalles = {}
+        for linea in lineas:
+            producto_pk, precio_actual = self._resolver_producto(linea.get('producto'))
+            try:
+                cantidad = int(linea.get('cantidad') or 0)
+            except (TypeError, ValueError):
+                raise ErrorDeFila(f"Cantidad inválida: '{linea.get('cantidad')}'")
+            descuento = self._decimal(linea.get('descuento'), CERO)
+            if cantidad <= 0 or descuento < 0:
+                raise ErrorDeFila('Cantidad y Descuento deben ser válidos.')
+
+            detalle = detalles.get(producto_pk)
+            if detalle is None:
+                detalles[producto_pk] = DetalleOrden(
+                    producto_id=producto_pk,
+                    cantidad=cantidad,
+                    precio_unitario=self._decimal(linea.get('precio_unitario'), precio_actual),
+                    descuento=descuento,
+                    observaciones=(linea.get('observaciones') or None),
+                )
+            else:
+                detalle.cantidad += cantidad
+                detalle.descuento += descuento
+
+        total = CERO
+        for detalle in detalles.values():
+            detalle.subtotal = detalle.subtotal_calculado
+            if detalle.subtotal < 0:
+                raise ErrorDeFila('El subtotal no puede ser negativo.')
+            total += detalle.subtotal
+
+        detalles = list(detalles.values())
+        orden = OrdenDeVenta(
+            cliente=cliente,
+            direccion_envio=direccion,
+            estado=estado,
+            metodo_pago=metodo,
+            comentarios=cabecera.get('comentarios') or None,
+            total=total,
+            num_lineas=len(detalles),
+            unidades=sum(detalle.cantidad for detalle in detalles),
+            producto_muestra=self.nombres[detalles[0].producto_id],
+        )
+        return orden, detalles
+
+    def _guardar_lote(self, lote):
+        """Inserta un lote de órdenes y sus detalles en una sola transacción.
+
+        Cada orden reserva su stock como en `ordenes.crear_orden`; las que no
+        alcanzan se omiten (su reserva se deshace con un savepoint) y se
+        reportan. Las que llegan canceladas no reservan ni registran
+        movimientos: una orden cancelada ya no retiene stock y nunca se
+        libera (estados.py). Devuelve (ordenes, detalles, omitidas).
+        """
+        ordenes, detalles = [], []
+        omitidas = 0
+        with escritura():
+            for numero, referencia, orden, lineas in lote:
+                if orden.estado == ESTADO_CANCELADO:
+                    ordenes.append(orden)
+                    detalles.append(lineas)
+                    continue
+                try:
+                    with transaction.atomic():
+                        reservar_lineas({d.producto_id: d.cantidad for d in lineas}, registrar=False)
+                except StockInsuficiente as e:
+                    omitidas += 1
+                    self.stderr.write(f'Línea {numero} ({referencia}): {e}')
+                    continue
+                ordenes.append(orden)
+                detalles.append(lineas)
+            if not ordenes:
+                return 0, 0, omitidas
+
+            OrdenDeVenta.objects.bulk_create(ordenes)
+            for orden, lineas in zip(ordenes, detalles):
+                for detalle in lineas:
+                    detalle.orden = orden
+            nuevos = [d for lineas in detalles for d in lineas]
+            DetalleOrden.objects.bulk_create(nuevos)
+            registrar_movimientos(
+                MovimientoInventario(producto_id=d.producto_id, tipo=VENTA, cantidad=-d.cantidad, detalle_id=d.pk)
+                for d in nuevos if d.orden.estado != ESTADO_CANCELADO
+            )
+            # bulk_create no envía señales: el resumen de ventas se acumula
+            # aquí con un delta por clave para todo el lote.
+            acumular_detalles(nuevos, categorias=self.categorias)
+            versiones.incrementar(OrdenDeVenta, DetalleOrden)
+        return len(ordenes), len(nuevos), omitidas
+
+    # ---------------------------------------------------------------------
+    # EJECUCIÓN
+    # ---------------------------------------------------------------------
+
+    def handle(self, *args, **options):
+        ruta = options['archivo']
+        formato = options['formato'] or ('jsonl' if ruta.endswith(('.jsonl', '.ndjson')) else 'csv')
+        tamano_lote = max(1, options['lote'])
+
+        self.estados = dict(ESTADO_CHOICES)
+        self.metodos = dict(METODO_CHOICES)
+        self.productos_por_id, self.productos_por_nombre, self.categorias, self.nombres = self._cargar_productos()
+
+        try:
+            archivo = sys.stdin if ruta == '-' else open(ruta, newline='', encoding='utf-8')
+        except OSError as e:
+            raise CommandError(f'No se pudo abrir {ruta}: {e}')
+
+        inicio = time.perf_counter()
+        ordenes_creadas = detalles_creados = omitidas = 0
+        with archivo:
+            if formato == 'jsonl':
+                fuente = self._leer_jsonl(archivo)
+            else:
+                fuente = self._leer_csv(archivo, options['delimitador'])
+
+            while True:
+                bloque = list(islice(fuente, tamano_lote))
+                if not bloque:
+                    break
+                lote = []
+                for numero, referencia, cabecera, lineas in bloque:
+                    try:
+                        lote.append((numero, referencia, *self._construir_orden(cabecera, lineas)))
+                    except ErrorDeFila as e:
+                        omitidas += 1
+                        self.stderr.write(f'Línea {numero} ({referencia}): {e}')
+                if lote:
+                    nuevas, lineas, sin_stock = self._guardar_lote(lote)
+                    ordenes_creadas += nuevas
+                    detalles_creados += lineas
+                    omitidas += sin_stock
+
+        transcurrido = max(time.perf_counter() - inicio, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            f'Importación terminada en {transcurrido:.2f} s: '
+            f'{ordenes_creadas} órdenes, {detalles_creados} detalles, {omitidas} omitidas.'
+        ))
+        self.stdout.write(
+            f'Rendimiento: {detalles_creados / transcurrido:,.0f} detalles/s, '
+            f'{ordenes_creadas / transcurrido:,.0f} órdenes/s.'
+        )
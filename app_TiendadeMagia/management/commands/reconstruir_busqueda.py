@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app_TiendadeMagia.busqueda import fts_disponible, reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de búsqueda de texto completo (FTS5) de los productos."
+
+    def handle(self, *args, **options):
+        if not fts_disponible():
+            self.stdout.write(self.style.WARNING(
+                'La base de datos no es SQLite: la búsqueda usa icontains y no hay índice que reconstruir.'
+            ))
+            return
+        inicio = time.perf_counter()
+        indexados = reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS(
+            f'Índice reconstruido: {indexados} productos en {time.perf_counter() - inicio:.2f} s.'
+        ))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app_TiendadeMagia.reportes import reconstruir_resumen
+
+
+class Command(BaseCommand):
+    help = "Reconstruye desde cero la tabla de resumen de ventas (ResumenVentaDiaria)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=2000,
+            help='Filas de resumen insertadas por bulk_create (por defecto 2000).'
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        creadas = reconstruir_resumen(tamano_lote=max(1, options['lote']))
+        self.stdout.write(self.style.SUCCESS(
+            f'Resumen reconstruido: {creadas} filas en {time.perf_counter() - inicio:.2f} s.'
+        ))
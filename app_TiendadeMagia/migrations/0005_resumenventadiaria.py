@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:22
+
+import decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def llenar_resumen(apps, schema_editor):
+    # El historial existente entra al resumen con una consulta agregada por
+    # clave (la misma que reportes.reconstruir_resumen); desde aquí lo
+    # mantienen las señales.
+    DetalleOrden = apps.get_model('app_TiendadeMagia', 'DetalleOrden')
+    ResumenVentaDiaria = apps.get_model('app_TiendadeMagia', 'ResumenVentaDiaria')
+    filas = (
+        DetalleOrden.objects
+        .annotate(fecha=TruncDate('orden__fecha_orden', tzinfo=timezone.get_current_timezone()))
+        .values('fecha', 'producto_id', 'producto__categoria', 'orden__metodo_pago', 'orden__estado')
+        .annotate(
+            unidades=Sum('cantidad'),
+            bruto=Sum(F('cantidad') * F('precio_unitario')),
+            descuento_total=Sum('descuento'),
+            neto=Sum('subtotal'),
+        )
+        .order_by()
+    )
+    ResumenVentaDiaria.objects.bulk_create(
+        (ResumenVentaDiaria(
+            fecha=fila['fecha'],
+            producto_id=fila['producto_id'],
+            categoria=fila['producto__categoria'],
+            metodo_pago=fila['orden__metodo_pago'],
+            estado=fila['orden__estado'],
+            unidades=fila['unidades'],
+            bruto=fila['bruto'],
+            descuento=fila['descuento_total'] or decimal.Decimal('0.00'),
+            neto=fila['neto'] or decimal.Decimal('0.00'),
+        ) for fila in filas.iterator(chunk_size=2000)),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_TiendadeMagia', '0004_detalleorden_descuento_detalleorden_observaciones_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenVentaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('categoria', models.CharField(max_length=50)),
+                ('metodo_pago', models.CharField(choices=[('Efectivo', 'Efectivo'), ('Tarjeta', 'Tarjeta de Crédito/Débito'), ('Transferencia', 'Transferencia Bancaria')], max_length=50)),
+                ('estado', models.CharField(choices=[('Pendiente', 'Pendiente'), ('Enviado', 'Enviado'), ('Entregado', 'Entregado'), ('Cancelado', 'Cancelado')], max_length=50)),
+                ('unidades', models.IntegerField(default=0)),
+                ('bruto', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('descuento', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('neto', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes', to='app_TiendadeMagia.producto')),
+            ],
+            options={
+                'verbose_name': 'Resumen de Venta Diaria',
+                'verbose_name_plural': 'Resúmenes de Ventas Diarias',
+                'ordering': ['-fecha'],
+                'unique_together': {('fecha', 'producto', 'categoria', 'metodo_pago', 'estado')},
+            },
+        ),
+        migrations.RunPython(llenar_resumen, migrations.RunPython.noop),
+    ]
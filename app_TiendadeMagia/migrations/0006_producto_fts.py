@@ -0,0 +1,36 @@
+from django.db import migrations
+
+TABLA_FTS = 'app_tiendademagia_producto_fts'
+
+
+def crear_indice(apps, schema_editor):
+    # FTS5 sólo existe en SQLite; en otros motores la búsqueda usa icontains.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    tabla = apps.get_model('app_TiendadeMagia', 'Producto')._meta.db_table
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_FTS} USING fts5("
+        "nombre, descripcion, categoria, proveedor, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {TABLA_FTS} (rowid, nombre, descripcion, categoria, proveedor) "
+        f"SELECT id, nombre, COALESCE(descripcion, ''), categoria, COALESCE(proveedor, '') FROM {tabla}"
+    )
+
+
+def borrar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {TABLA_FTS}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_TiendadeMagia', '0005_resumenventadiaria'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
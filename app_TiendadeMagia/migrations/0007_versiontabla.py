@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:35
+
+from django.db import migrations, models
+from django.utils import timezone
+
+TABLAS_VERSIONADAS = (
+    'app_tiendademagia.producto',
+    'app_tiendademagia.ordendeventa',
+    'app_tiendademagia.detalleorden',
+)
+
+
+def crear_versiones(apps, schema_editor):
+    VersionTabla = apps.get_model('app_TiendadeMagia', 'VersionTabla')
+    ahora = timezone.now()
+    VersionTabla.objects.bulk_create(
+        [VersionTabla(tabla=tabla, version=1, modificado=ahora) for tabla in TABLAS_VERSIONADAS],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_TiendadeMagia', '0006_producto_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionTabla',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tabla', models.CharField(max_length=100, unique=True)),
+                ('version', models.BigIntegerField(default=0)),
+                ('modificado', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Versión de Tabla',
+                'verbose_name_plural': 'Versiones de Tablas',
+            },
+        ),
+        migrations.RunPython(crear_versiones, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_TiendadeMagia', '0007_versiontabla'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ordendeventa',
+            index=models.Index(fields=['-fecha_orden', '-id'], name='orden_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordendeventa',
+            index=models.Index(fields=['estado', '-fecha_orden'], name='orden_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordendeventa',
+            index=models.Index(fields=['cliente', '-fecha_orden'], name='orden_cliente_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['nombre'], name='producto_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['categoria', 'nombre'], name='producto_categoria_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['nombre'], name='producto_disponible_idx'),
+        ),
+    ]
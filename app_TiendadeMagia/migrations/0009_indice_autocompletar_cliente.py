@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:46
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_TiendadeMagia', '0008_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ordendeventa',
+            index=models.Index(django.db.models.functions.text.Lower('cliente'), models.OrderBy(models.F('fecha_orden'), descending=True), name='orden_cliente_min_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_TiendadeMagia', '0009_indice_autocompletar_cliente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detalleorden',
+            name='modificado',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='ordendeventa',
+            name='modificado',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='modificado',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
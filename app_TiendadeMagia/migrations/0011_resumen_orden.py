@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:52
+
+from django.db import migrations, models
+from django.db.models import CharField, Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def llenar_resumen(apps, schema_editor):
+    # Las órdenes existentes toman su resumen de las líneas con un solo
+    # UPDATE (las mismas subconsultas que totales.recalcular_resumenes).
+    OrdenDeVenta = apps.get_model('app_TiendadeMagia', 'OrdenDeVenta')
+    DetalleOrden = apps.get_model('app_TiendadeMagia', 'DetalleOrden')
+    lineas = DetalleOrden.objects.filter(orden=OuterRef('pk')).values('orden')
+    primera = DetalleOrden.objects.filter(orden=OuterRef('pk')).order_by('pk').values('producto__nombre')[:1]
+    OrdenDeVenta.objects.update(
+        num_lineas=Coalesce(Subquery(lineas.annotate(n=Count('pk')).values('n'), output_field=IntegerField()), Value(0)),
+        unidades=Coalesce(Subquery(lineas.annotate(n=Sum('cantidad')).values('n'), output_field=IntegerField()), Value(0)),
+        producto_muestra=Coalesce(Subquery(primera, output_field=CharField()), Value('')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_TiendadeMagia', '0010_modificado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ordendeventa',
+            name='num_lineas',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ordendeventa',
+            name='producto_muestra',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='ordendeventa',
+            name='unidades',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(llenar_resumen, migrations.RunPython.noop),
+    ]
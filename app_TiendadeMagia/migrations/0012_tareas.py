@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:56
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_TiendadeMagia', '0011_resumen_orden'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=50)),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('estado', models.CharField(choices=[('Pendiente', 'Pendiente'), ('En curso', 'En curso'), ('Terminada', 'Terminada'), ('Fallida', 'Fallida')], default='Pendiente', max_length=20)),
+                ('progreso', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(blank=True, null=True)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('archivo', models.CharField(blank=True, default='', max_length=255)),
+                ('trabajador', models.CharField(blank=True, default='', max_length=100)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('creada', models.DateTimeField(default=django.utils.timezone.now)),
+                ('iniciada', models.DateTimeField(blank=True, null=True)),
+                ('latido', models.DateTimeField(blank=True, null=True)),
+                ('terminada', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Tarea',
+                'verbose_name_plural': 'Tareas',
+                'ordering': ['-pk'],
+                'indexes': [models.Index(fields=['estado', 'id'], name='tarea_estado_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_TiendadeMagia', '0012_tareas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioDeEstado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('usuario', models.CharField(blank=True, default='', max_length=150)),
+                ('canal', models.CharField(default='vista', max_length=20)),
+                ('estado_nuevo', models.CharField(choices=[('Pendiente', 'Pendiente'), ('Enviado', 'Enviado'), ('Entregado', 'Entregado'), ('Cancelado', 'Cancelado')], max_length=50)),
+                ('criterio', models.JSONField(blank=True, default=dict)),
+                ('movidas', models.JSONField(blank=True, default=dict)),
+                ('omitidas', models.JSONField(blank=True, default=dict)),
+                ('total', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Cambio de Estado',
+                'verbose_name_plural': 'Cambios de Estado',
+                'ordering': ['-pk'],
+            },
+        ),
+    ]
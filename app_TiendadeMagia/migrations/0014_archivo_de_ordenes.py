@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:08
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_TiendadeMagia', '0013_cambios_de_estado'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='resumenventadiaria',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='resumenventadiaria',
+            name='archivado',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterUniqueTogether(
+            name='resumenventadiaria',
+            unique_together={('fecha', 'producto', 'categoria', 'metodo_pago', 'estado', 'archivado')},
+        ),
+        migrations.CreateModel(
+            name='OrdenArchivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('cliente', models.CharField(max_length=100)),
+                ('fecha_orden', models.DateTimeField()),
+                ('direccion_envio', models.TextField()),
+                ('total', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('estado', models.CharField(choices=[('Pendiente', 'Pendiente'), ('Enviado', 'Enviado'), ('Entregado', 'Entregado'), ('Cancelado', 'Cancelado')], max_length=50)),
+                ('metodo_pago', models.CharField(choices=[('Efectivo', 'Efectivo'), ('Tarjeta', 'Tarjeta de Crédito/Débito'), ('Transferencia', 'Transferencia Bancaria')], max_length=50)),
+                ('comentarios', models.TextField(blank=True, null=True)),
+                ('num_lineas', models.IntegerField(default=0)),
+                ('unidades', models.IntegerField(default=0)),
+                ('producto_muestra', models.CharField(blank=True, default='', max_length=100)),
+                ('archivada', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Orden Archivada',
+                'verbose_name_plural': 'Órdenes Archivadas',
+                'ordering': ['-fecha_orden'],
+                'indexes': [models.Index(fields=['-fecha_orden', '-id'], name='archivada_fecha_idx'), models.Index(fields=['estado', '-fecha_orden'], name='archivada_estado_fecha_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DetalleArchivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('cantidad', models.IntegerField()),
+                ('precio_unitario', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('subtotal', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('descuento', models.DecimalField(blank=True, decimal_places=2, default=0.0, max_digits=10, null=True)),
+                ('observaciones', models.CharField(blank=True, max_length=255, null=True)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, related_name='+', to='app_TiendadeMagia.producto')),
+                ('orden', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='detalles', to='app_TiendadeMagia.ordenarchivada')),
+            ],
+            options={
+                'verbose_name': 'Detalle Archivado',
+                'verbose_name_plural': 'Detalles Archivados',
+            },
+        ),
+    ]
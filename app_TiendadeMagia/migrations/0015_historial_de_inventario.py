@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:12
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def foto_inicial(apps, schema_editor):
+    # El stock anterior al historial entra como una foto de cada producto:
+    # sin ella el stock a una fecha sumaría sólo los movimientos nuevos.
+    Producto = apps.get_model('app_TiendadeMagia', 'Producto')
+    FotoInventario = apps.get_model('app_TiendadeMagia', 'FotoInventario')
+    ahora = timezone.now()
+    FotoInventario.objects.bulk_create(
+        (FotoInventario(producto_id=pk, fecha=ahora, stock=stock)
+         for pk, stock in Producto.objects.values_list('pk', 'stock').iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_TiendadeMagia', '0014_archivo_de_ordenes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FotoInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField()),
+                ('stock', models.IntegerField()),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fotos', to='app_TiendadeMagia.producto')),
+            ],
+            options={
+                'verbose_name': 'Foto de Inventario',
+                'verbose_name_plural': 'Fotos de Inventario',
+                'ordering': ['-fecha'],
+                'constraints': [models.UniqueConstraint(fields=('producto', 'fecha'), name='foto_producto_fecha_unica')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MovimientoInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('recepcion', 'Recepción'), ('venta', 'Venta'), ('devolucion', 'Devolución'), ('ajuste', 'Ajuste')], max_length=20)),
+                ('cantidad', models.IntegerField()),
+                ('nota', models.CharField(blank=True, default='', max_length=255)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('detalle', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app_TiendadeMagia.detalleorden')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='app_TiendadeMagia.producto')),
+            ],
+            options={
+                'verbose_name': 'Movimiento de Inventario',
+                'verbose_name_plural': 'Movimientos de Inventario',
+                'ordering': ['-fecha', '-pk'],
+                'indexes': [models.Index(fields=['producto', 'fecha', 'id'], name='movimiento_producto_fecha_idx'), models.Index(fields=['fecha'], name='movimiento_fecha_idx')],
+            },
+        ),
+        migrations.RunPython(foto_inicial, migrations.RunPython.noop),
+    ]
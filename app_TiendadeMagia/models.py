@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.functions import Lower
+from django.utils import timezone
 from datetime import date 
 import decimal
 
@@ -13,14 +15,63 @@ ESTADO_CHOICES = [
     ('Cancelado', 'Cancelado'),
 ]
 
+# Estados a los que puede pasar una orden desde cada estado (estados.py)
+TRANSICIONES_ESTADO = {
+    'Pendiente': ('Enviado', 'Cancelado'),
+    'Enviado': ('Entregado', 'Cancelado'),
+    'Entregado': (),
+    'Cancelado': (),
+}
+
 METODO_CHOICES = [
     ('Efectivo', 'Efectivo'),
     ('Tarjeta', 'Tarjeta de Crédito/Débito'),
     ('Transferencia', 'Transferencia Bancaria'),
 ]
 
+TIPO_MOVIMIENTO_CHOICES = [
+    ('recepcion', 'Recepción'),
+    ('venta', 'Venta'),
+    ('devolucion', 'Devolución'),
+    ('ajuste', 'Ajuste'),
+]
+
+ESTADO_TAREA_CHOICES = [
+    ('Pendiente', 'Pendiente'),
+    ('En curso', 'En curso'),
+    ('Terminada', 'Terminada'),
+    ('Fallida', 'Fallida'),
+]
+
+# =========================================================================
+# 2. MARCA DE MODIFICACIÓN
+# =========================================================================
+
+class ConModificadoQuerySet(models.QuerySet):
+    """Mantiene la columna `modificado` también en las escrituras en bloque.
+
+    auto_now sólo actúa en save() y bulk_create(); update() y bulk_update()
+    (reservas de stock, totales, importaciones) la actualizan aquí. Las
+    cachés de filas de las listas (fragmentos.py) dependen de ella.
+    """
+
+    def update(self, **kwargs):
+        kwargs.setdefault('modificado', timezone.now())
+        return super().update(**kwargs)
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        objs = list(objs)
+        ahora = timezone.now()
+        for obj in objs:
+            obj.modificado = ahora
+        fields = list(fields)
+        if 'modificado' not in fields:
+            fields.append('modificado')
+        return super().bulk_update(objs, fields, batch_size=batch_size)
+
+
 # =========================================================================
-# 2. MODELO Producto
+# 3. MODELO Producto
 # =========================================================================
 
 class Producto(models.Model):
@@ -31,18 +82,29 @@ class Producto(models.Model):
     proveedor = models.CharField(max_length=100, blank=True, null=True)
     stock = models.IntegerField(default=0)
     fecha_registro = models.DateField(default=date.today) 
+    modificado = models.DateTimeField(auto_now=True)
+
+    objects = ConModificadoQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Producto de Magia"
         verbose_name_plural = "Productos de Magia"
         ordering = ['nombre']
+        indexes = [
+            # Listado, admin y búsqueda por prefijo ordenan por nombre
+            models.Index(fields=['nombre'], name='producto_nombre_idx'),
+            # Filtro por categoría (admin, API) con el mismo orden
+            models.Index(fields=['categoria', 'nombre'], name='producto_categoria_idx'),
+            # Catálogo 'disponibles' de los formularios: stock > 0 ordenado por nombre
+            models.Index(fields=['nombre'], condition=models.Q(stock__gt=0), name='producto_disponible_idx'),
+        ]
 
     def __str__(self):
         return self.nombre
 
 
 # =========================================================================
-# 3. MODELO OrdenDeVenta
+# 4. MODELO OrdenDeVenta
 # =========================================================================
 
 class OrdenDeVenta(models.Model):
@@ -55,18 +117,37 @@ class OrdenDeVenta(models.Model):
     metodo_pago = models.CharField(max_length=50, choices=METODO_CHOICES, default='Efectivo')
     
     comentarios = models.TextField(blank=True, null=True) 
+    modificado = models.DateTimeField(auto_now=True)
+
+    # Resumen de las líneas, mantenido en cada escritura de DetalleOrden
+    # (totales.ajustar_resumen_orden) para que la lista no lea los detalles
+    num_lineas = models.IntegerField(default=0, editable=False)
+    unidades = models.IntegerField(default=0, editable=False)
+    producto_muestra = models.CharField(max_length=100, blank=True, default='', editable=False)
+
+    objects = ConModificadoQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Orden de Venta"
         verbose_name_plural = "Órdenes de Venta"
         ordering = ['-fecha_orden']
+        indexes = [
+            # Páginas por cursor (-fecha_orden, -pk) y rangos de fecha de los filtros
+            models.Index(fields=['-fecha_orden', '-id'], name='orden_fecha_idx'),
+            # Filtro por estado (admin, API, detalles) con el orden de la lista
+            models.Index(fields=['estado', '-fecha_orden'], name='orden_estado_fecha_idx'),
+            # Órdenes de un cliente (API, búsqueda del admin)
+            models.Index(fields=['cliente', '-fecha_orden'], name='orden_cliente_fecha_idx'),
+            # Autocompletado por prefijo del cliente sin distinguir mayúsculas (autocompletar.py)
+            models.Index(Lower('cliente'), models.F('fecha_orden').desc(), name='orden_cliente_min_idx'),
+        ]
 
     def __str__(self):
         return f"Orden #{self.pk} - Cliente: {self.cliente}"
 
 
 # =========================================================================
-# 4. MODELO DetalleOrden
+# 5. MODELO DetalleOrden
 # =========================================================================
 
 class DetalleOrden(models.Model):
@@ -80,6 +161,9 @@ class DetalleOrden(models.Model):
     subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     descuento = models.DecimalField(max_digits=10, decimal_places=2, default=0.00, blank=True, null=True)
     observaciones = models.CharField(max_length=255, blank=True, null=True)
+    modificado = models.DateTimeField(auto_now=True)
+
+    objects = ConModificadoQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Detalle de Orden"
@@ -87,9 +171,252 @@ class DetalleOrden(models.Model):
         unique_together = ('orden', 'producto') 
         
     def __str__(self):
-        return f"{self.cantidad} x {self.producto.nombre} en Orden #{self.orden.pk}"
+        return f"{self.cantidad} x {self.producto.nombre} en Orden #{self.orden_id}"
 
     @property
     def subtotal_calculado(self):
         desc = self.descuento if self.descuento is not None else decimal.Decimal('0.00')
-        return (self.cantidad * self.precio_unitario) - desc
\ No newline at end of file
+        return (self.cantidad * self.precio_unitario) - desc
+
+# =========================================================================
+# 6. MODELO ResumenVentaDiaria (TABLA DE RESUMEN PARA REPORTES)
+# =========================================================================
+
+class ResumenVentaDiaria(models.Model):
+    """Ventas pre-agregadas por día × producto × categoría × método de pago × estado.
+
+    Se mantiene al día de forma incremental desde las escrituras de
+    DetalleOrden y OrdenDeVenta (ver reportes.py) y se puede reconstruir con
+    `manage.py reconstruir_resumen`. Las filas con `archivado` resumen las
+    órdenes que ya pasaron a las tablas de archivo (archivo.py).
+    """
+    fecha = models.DateField()
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='resumenes')
+    categoria = models.CharField(max_length=50)
+    metodo_pago = models.CharField(max_length=50, choices=METODO_CHOICES)
+    estado = models.CharField(max_length=50, choices=ESTADO_CHOICES)
+    archivado = models.BooleanField(default=False)
+
+    unidades = models.IntegerField(default=0)
+    bruto = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    descuento = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    neto = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Resumen de Venta Diaria"
+        verbose_name_plural = "Resúmenes de Ventas Diarias"
+        unique_together = ('fecha', 'producto', 'categoria', 'metodo_pago', 'estado', 'archivado')
+        ordering = ['-fecha']
+
+    def __str__(self):
+        return f"{self.fecha} - {self.producto_id} ({self.estado}/{self.metodo_pago}): {self.neto}"
+
+
+# =========================================================================
+# 7. MODELO VersionTabla (VERSIÓN DE CAMBIOS POR TABLA PARA LA API)
+# =========================================================================
+
+class VersionTabla(models.Model):
+    """Contador de cambios de una tabla; alimenta los ETag / Last-Modified de la API.
+
+    Se incrementa en la misma transacción que cada escritura (ver
+    versiones.py), así que leerlo cuesta una consulta por índice único.
+    """
+    tabla = models.CharField(max_length=100, unique=True)
+    version = models.BigIntegerField(default=0)
+    modificado = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Versión de Tabla"
+        verbose_name_plural = "Versiones de Tablas"
+
+    def __str__(self):
+        return f"{self.tabla} v{self.version}"
+
+
+# =========================================================================
+# 8. MODELO Tarea (TRABAJOS EN SEGUNDO PLANO)
+# =========================================================================
+
+class Tarea(models.Model):
+    """Trabajo largo (exportación, reconstrucción, conciliación) encolado desde una vista.
+
+    La vista sólo crea la fila y responde con su id; un proceso
+    `manage.py ejecutar_tareas` la toma, la ejecuta y va guardando el
+    avance (ver tareas.py).
+    """
+    tipo = models.CharField(max_length=50)
+    parametros = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADO_TAREA_CHOICES, default='Pendiente')
+
+    progreso = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    resultado = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    archivo = models.CharField(max_length=255, blank=True, default='') # Ruta del archivo generado, si hay
+
+    trabajador = models.CharField(max_length=100, blank=True, default='')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    creada = models.DateTimeField(default=timezone.now)
+    iniciada = models.DateTimeField(null=True, blank=True)
+    latido = models.DateTimeField(null=True, blank=True) # Último avance reportado por el trabajador
+    terminada = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Tarea"
+        verbose_name_plural = "Tareas"
+        ordering = ['-pk']
+        indexes = [
+            # Cola: la siguiente pendiente y las en curso sin latido
+            models.Index(fields=['estado', 'id'], name='tarea_estado_idx'),
+        ]
+
+    def __str__(self):
+        return f"Tarea #{self.pk} {self.tipo} ({self.estado})"
+
+    @property
+    def activa(self):
+        return self.estado in ('Pendiente', 'En curso')
+
+    @property
+    def porcentaje(self):
+        if self.estado == 'Terminada':
+            return 100
+        if not self.total:
+            return 0
+        return min(100, int(self.progreso * 100 / self.total))
+
+
+# =========================================================================
+# 9. MODELO CambioDeEstado (AUDITORÍA DE CAMBIOS DE ESTADO EN BLOQUE)
+# =========================================================================
+
+class CambioDeEstado(models.Model):
+    """Un cambio de estado aplicado a un grupo de órdenes (una fila por lote, no por orden).
+
+    `movidas` y `omitidas` cuentan las órdenes por su estado de origen;
+    `criterio` describe cómo se eligieron (pks, estado o filtros del admin).
+    """
+    fecha = models.DateTimeField(default=timezone.now)
+    usuario = models.CharField(max_length=150, blank=True, default='')
+    canal = models.CharField(max_length=20, default='vista') # 'vista' o 'admin'
+    estado_nuevo = models.CharField(max_length=50, choices=ESTADO_CHOICES)
+    criterio = models.JSONField(default=dict, blank=True)
+    movidas = models.JSONField(default=dict, blank=True)
+    omitidas = models.JSONField(default=dict, blank=True)
+    total = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Cambio de Estado"
+        verbose_name_plural = "Cambios de Estado"
+        ordering = ['-pk']
+
+    def __str__(self):
+        return f"{self.fecha:%Y-%m-%d %H:%M} -> {self.estado_nuevo}: {self.total} órdenes"
+
+
+# =========================================================================
+# 10. MODELOS OrdenArchivada / DetalleArchivado (ÓRDENES CERRADAS ANTIGUAS)
+# =========================================================================
+# Copia de sólo lectura de las órdenes 'Entregado' / 'Cancelado' que
+# `manage.py archivar_ordenes` saca de las tablas de trabajo (archivo.py).
+# Conservan el mismo pk que tenían.
+
+class OrdenArchivada(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    cliente = models.CharField(max_length=100)
+    fecha_orden = models.DateTimeField()
+    direccion_envio = models.TextField()
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    estado = models.CharField(max_length=50, choices=ESTADO_CHOICES)
+    metodo_pago = models.CharField(max_length=50, choices=METODO_CHOICES)
+    comentarios = models.TextField(blank=True, null=True)
+    num_lineas = models.IntegerField(default=0)
+    unidades = models.IntegerField(default=0)
+    producto_muestra = models.CharField(max_length=100, blank=True, default='')
+    archivada = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Orden Archivada"
+        verbose_name_plural = "Órdenes Archivadas"
+        ordering = ['-fecha_orden']
+        indexes = [
+            # Páginas por cursor (-fecha_orden, -pk) del explorador del archivo
+            models.Index(fields=['-fecha_orden', '-id'], name='archivada_fecha_idx'),
+            models.Index(fields=['estado', '-fecha_orden'], name='archivada_estado_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"Orden archivada #{self.pk} - Cliente: {self.cliente}"
+
+
+class DetalleArchivado(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    orden = models.ForeignKey(OrdenArchivada, on_delete=models.CASCADE, related_name='detalles')
+    producto = models.ForeignKey(Producto, on_delete=models.RESTRICT, related_name='+')
+    cantidad = models.IntegerField()
+    precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    descuento = models.DecimalField(max_digits=10, decimal_places=2, default=0.00, blank=True, null=True)
+    observaciones = models.CharField(max_length=255, blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Detalle Archivado"
+        verbose_name_plural = "Detalles Archivados"
+
+    def __str__(self):
+        return f"{self.cantidad} x {self.producto_id} en Orden archivada #{self.orden_id}"
+
+
+# =========================================================================
+# 11. MODELOS MovimientoInventario / FotoInventario (HISTORIAL DE STOCK)
+# =========================================================================
+# Cada cambio de Producto.stock agrega un movimiento en la misma transacción
+# (inventario.py); las fotos guardan el stock de cada producto en un
+# instante, así el stock a una fecha es la foto anterior más los movimientos
+# posteriores a ella (movimientos.py).
+
+class MovimientoInventario(models.Model):
+    """Entrada del historial de stock; sólo se agregan filas, nunca se editan."""
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='movimientos')
+    tipo = models.CharField(max_length=20, choices=TIPO_MOVIMIENTO_CHOICES)
+    cantidad = models.IntegerField() # Con signo: + entra al stock, - sale
+    # Sin restricción en la base: la línea puede borrarse o pasar al archivo
+    # (archivo.py, mismo pk) y el movimiento se conserva
+    detalle = models.ForeignKey(DetalleOrden, on_delete=models.DO_NOTHING, db_constraint=False,
+                                null=True, blank=True, related_name='+')
+    nota = models.CharField(max_length=255, blank=True, default='')
+    fecha = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Movimiento de Inventario"
+        verbose_name_plural = "Movimientos de Inventario"
+        ordering = ['-fecha', '-pk']
+        indexes = [
+            # Movimientos de un producto posteriores a su foto (stock a una fecha) y su historial
+            models.Index(fields=['producto', 'fecha', 'id'], name='movimiento_producto_fecha_idx'),
+            # Compactación: movimientos anteriores a un corte
+            models.Index(fields=['fecha'], name='movimiento_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.cantidad:+d} de {self.producto_id} ({self.fecha:%Y-%m-%d %H:%M})"
+
+
+class FotoInventario(models.Model):
+    """Stock de un producto en un instante, calculado desde los movimientos."""
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='fotos')
+    fecha = models.DateTimeField()
+    stock = models.IntegerField()
+
+    class Meta:
+        verbose_name = "Foto de Inventario"
+        verbose_name_plural = "Fotos de Inventario"
+        ordering = ['-fecha']
+        constraints = [
+            # También es el índice de "la foto más reciente anterior a una fecha"
+            models.UniqueConstraint(fields=['producto', 'fecha'], name='foto_producto_fecha_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id} @ {self.fecha:%Y-%m-%d %H:%M}: {self.stock}"
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import DateTimeField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .basedatos import escritura
+from .models import FotoInventario, MovimientoInventario, Producto
+
+# =========================================================================
+# HISTORIAL DE INVENTARIO: STOCK A UNA FECHA, FOTOS Y COMPACTACIÓN
+# =========================================================================
+# Producto.stock sigue siendo el valor vigente (la reserva condicional de
+# inventario.py depende de él); MovimientoInventario es el registro de cada
+# cambio y FotoInventario el stock de un producto en un instante.
+#
+# El stock a una fecha sale de una sola consulta:
+#
+#     foto más reciente con fecha <= F  (0 si no hay)
+#     + SUM(movimientos con foto.fecha < fecha <= F)
+#
+# ambas por el índice (producto, fecha), así que el costo depende de los
+# movimientos desde la última foto y no del historial entero.
+#
+# `compactar` guarda una foto al corte de cada producto con movimientos
+# anteriores a él y borra esos movimientos: el historial reciente queda
+# completo y las fechas anteriores al corte se resuelven con la foto más
+# cercana hacia atrás (granularidad de las fotos, no de los movimientos).
+
+_FECHA_MINIMA = Value(datetime(1, 1, 1, tzinfo=dt_timezone.utc), output_field=DateTimeField())
+
+
+def _conservar_dias():
+    return getattr(settings, 'INVENTARIO_CONSERVAR_DIAS', 90)
+
+
+def stocks_a_fecha(productos, fecha):
+    """Anota `productos` con `stock_a_fecha` (y `foto_fecha`) al instante `fecha`."""
+    fotos = FotoInventario.objects.filter(producto=OuterRef('pk'), fecha__lte=fecha).order_by('-fecha')
+    movimientos = (
+        MovimientoInventario.objects
+        .filter(producto=OuterRef('pk'), fecha__gt=OuterRef('foto_fecha'), fecha__lte=fecha)
+        .order_by().values('producto').annotate(suma=Sum('cantidad')).values('suma')
+    )
+    return productos.annotate(
+        foto_fecha=Coalesce(Subquery(fotos.values('fecha')[:1]), _FECHA_MINIMA),
+        stock_a_fecha=(
+            Coalesce(Subquery(fotos.values('stock')[:1]), Value(0))
+            + Coalesce(Subquery(movimientos, output_field=IntegerField()), Value(0))
+        ),
+    )
+
+
+def stock_a_fecha(producto_pk, fecha):
+    return (
+        stocks_a_fecha(Producto.objects.filter(pk=producto_pk), fecha)
+        .values_list('stock_a_fecha', flat=True).first()
+    )
+
+
+def tomar_fotos(fecha=None, productos=None):
+    """Guarda la foto de `productos` (todos por defecto) a `fecha`; devuelve cuántas se crearon.
+
+    El stock de la foto sale del historial, no de Producto.stock, para que
+    foto y movimientos digan siempre lo mismo.
+    """
+    fecha = fecha or timezone.now()
+    productos = Producto.objects.all() if productos is None else productos
+    filas = stocks_a_fecha(productos.order_by(), fecha).values_list('pk', 'stock_a_fecha')
+    return len(FotoInventario.objects.bulk_create(
+        [FotoInventario(producto_id=pk, fecha=fecha, stock=stock) for pk, stock in filas],
+        ignore_conflicts=True,
+    ))
+
+
+def compactar(conservar_dias=None):
+    """Reemplaza por fotos los movimientos anteriores al corte; devuelve (fotos, movimientos borrados)."""
+    dias = _conservar_dias() if conservar_dias is None else conservar_dias
+    corte = timezone.now() - timedelta(days=dias)
+    with escritura():
+        viejos = MovimientoInventario.objects.filter(fecha__lte=corte)
+        con_movimientos = Producto.objects.filter(pk__in=viejos.values('producto_id'))
+        fotos = tomar_fotos(corte, con_movimientos)
+        borrados, _ = viejos.delete()
+    return fotos, borrados
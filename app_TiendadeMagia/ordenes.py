@@ -0,0 +1,112 @@
+import decimal
+
+from . import versiones
+from .basedatos import escritura
+from .inventario import VENTA, registrar_movimientos, reservar_lineas
+from .models import Producto, OrdenDeVenta, DetalleOrden, MovimientoInventario
+from .reportes import acumular_detalles
+from .totales import resumen_de_lineas
+
+# =========================================================================
+# CREACIÓN DE ÓRDENES CON VARIAS LÍNEAS
+# =========================================================================
+# Una orden con N líneas se crea con un número fijo de consultas: los
+# productos se leen con un solo in_bulk, el total se calcula en Python, las
+# líneas se insertan con un solo bulk_create y todo (reserva de stock,
+# orden con su resumen de líneas, líneas y tabla de resumen de ventas) se
+# confirma en una sola transacción.
+
+CERO = decimal.Decimal('0.00')
+
+CAMPOS_ORDEN = ('cliente', 'direccion_envio', 'estado', 'metodo_pago', 'comentarios')
+
+
+def normalizar_lineas(lineas):
+    """Valida las líneas pedidas y junta las que repiten producto.
+
+    `lineas` es un iterable de dicts con 'producto', 'cantidad' y
+    opcionalmente 'descuento' y 'observaciones' (valores como llegan del
+    formulario o del JSON). Devuelve {producto_pk: {'cantidad', 'descuento',
+    'observaciones'}} en el orden en que aparecieron. Lanza ValueError si
+    alguna línea no es válida o si no hay ninguna.
+    """
+    normalizadas = {}
+    for numero, linea in enumerate(lineas, start=1):
+        try:
+            producto_pk = int(linea['producto'])
+            cantidad = int(linea['cantidad'])
+            descuento = decimal.Decimal(str(linea.get('descuento') or '0.00'))
+        except (KeyError, TypeError, ValueError, decimal.InvalidOperation):
+            raise ValueError(f'Línea {numero}: producto, cantidad y descuento deben ser válidos.')
+        if cantidad <= 0 or descuento < 0:
+            raise ValueError(f'Línea {numero}: la cantidad debe ser mayor a cero y el descuento no negativo.')
+
+        actual = normalizadas.get(producto_pk)
+        if actual is None:
+            normalizadas[producto_pk] = {
+                'cantidad': cantidad,
+                'descuento': descuento,
+                'observaciones': linea.get('observaciones') or '',
+            }
+        else:
+            # La orden admite una sola línea por producto (unique_together)
+            actual['cantidad'] += cantidad
+            actual['descuento'] += descuento
+
+    if not normalizadas:
+        raise ValueError('La orden debe tener al menos una línea.')
+    return normalizadas
+
+
+def crear_orden(datos, lineas):
+    """Crea una orden con todas sus líneas en una sola transacción y la devuelve.
+
+    `datos` trae los campos de CAMPOS_ORDEN. Lanza ValueError si un producto
+    no existe o una línea es inválida, e inventario.StockInsuficiente si no
+    alcanza el stock de alguno; en ambos casos no se guarda nada.
+    """
+    lineas = normalizar_lineas(lineas)
+    productos = Producto.objects.in_bulk(list(lineas))
+    faltantes = [pk for pk in lineas if pk not in productos]
+    if faltantes:
+        raise ValueError(f'No existen los productos: {", ".join(map(str, faltantes))}.')
+
+    detalles = []
+    for producto_pk, linea in lineas.items():
+        producto = productos[producto_pk]
+        subtotal = producto.precio * linea['cantidad'] - linea['descuento']
+        if subtotal < 0:
+            raise ValueError(f'El subtotal de "{producto.nombre}" no puede ser negativo.')
+        detalles.append(DetalleOrden(
+            producto=producto,
+            cantidad=linea['cantidad'],
+            precio_unitario=producto.precio,
+            subtotal=subtotal,
+            descuento=linea['descuento'],
+            observaciones=linea['observaciones'],
+        ))
+    total = sum((detalle.subtotal for detalle in detalles), CERO)
+
+    with escritura():
+        # La reserva va primero: si algún producto no alcanza no se escribe nada
+        reservar_lineas({pk: linea['cantidad'] for pk, linea in lineas.items()}, registrar=False)
+
+        orden = OrdenDeVenta.objects.create(
+            **{campo: datos.get(campo) for campo in CAMPOS_ORDEN if datos.get(campo) is not None},
+            total=total,
+            **resumen_de_lineas(detalles),
+        )
+        for detalle in detalles:
+            detalle.orden = orden
+        DetalleOrden.objects.bulk_create(detalles)
+        # Las ventas se registran ya con el pk de cada línea
+        registrar_movimientos(
+            MovimientoInventario(producto_id=d.producto_id, tipo=VENTA, cantidad=-d.cantidad, detalle_id=d.pk)
+            for d in detalles
+        )
+
+        # bulk_create no dispara señales: se suma al resumen y a la versión a mano
+        acumular_detalles(detalles, categorias={pk: p.categoria for pk, p in productos.items()})
+        versiones.incrementar(DetalleOrden)
+
+    return orden
@@ -0,0 +1,258 @@
+import base64
+import binascii
+import decimal
+import json
+import operator
+from datetime import date, datetime
+from functools import reduce
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Q
+
+# =========================================================================
+# PAGINACIÓN POR CURSOR (KEYSET)
+# =========================================================================
+# A diferencia de OFFSET/LIMIT, la página se localiza comparando contra los
+# valores de la última fila vista, así que el costo no crece con el número
+# de la página y no se necesita un COUNT(*).
+
+TAMANO_PAGINA_DEFECTO = 25
+TAMANO_PAGINA_MAXIMO = 100
+
+
+class _CursorEncoder(json.JSONEncoder):
+    # DjangoJSONEncoder recorta los microsegundos, lo que rompería la
+    # comparación exacta contra fecha_orden; aquí se conserva el valor completo.
+    def default(self, o):
+        if isinstance(o, (datetime, date)):
+            return o.isoformat()
+        if isinstance(o, decimal.Decimal):
+            return str(o)
+        return super().default(o)
+
+
+def codificar_cursor(valores):
+    """Convierte una lista de valores de ordenamiento en un token apto para URL."""
+    crudo = json.dumps(list(valores), cls=_CursorEncoder).encode('utf-8')
+    return base64.urlsafe_b64encode(crudo).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(token, num_campos):
+    """Devuelve la lista de valores de un cursor o None si el token no es válido."""
+    if not token:
+        return None
+    try:
+        relleno = '=' * (-len(token) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(token + relleno))
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    if not isinstance(valores, list) or len(valores) != num_campos:
+        return None
+    return valores
+
+
+def tamano_pagina(request, defecto=TAMANO_PAGINA_DEFECTO):
+    """Lee 'por_pagina' del querystring, acotado a TAMANO_PAGINA_MAXIMO."""
+    try:
+        tamano = int(request.GET.get('por_pagina', defecto))
+    except (TypeError, ValueError):
+        tamano = defecto
+    return max(1, min(tamano, TAMANO_PAGINA_MAXIMO))
+
+
+def _valor_de(obj, campo):
+    """Obtiene el valor de un campo, siguiendo relaciones con '__'.
+
+    Acepta también las filas dict de un queryset .values().
+    """
+    if isinstance(obj, dict):
+        return obj[campo]
+    for parte in campo.split('__'):
+        obj = getattr(obj, parte)
+    return obj
+
+
+def _filtro_posterior(campos, valores, invertir):
+    """Construye el Q que selecciona las filas estrictamente después del cursor.
+
+    Para (a DESC, b DESC) produce: a < va OR (a = va AND b < vb).
+    """
+    condiciones = []
+    for i, campo in enumerate(campos):
+        nombre = campo.lstrip('-')
+        descendente = campo.startswith('-') != invertir
+        lookup = 'lt' if descendente else 'gt'
+        igualdades = {c.lstrip('-'): v for c, v in zip(campos[:i], valores[:i])}
+        condiciones.append(Q(**igualdades, **{f'{nombre}__{lookup}': valores[i]}))
+    return reduce(operator.or_, condiciones)
+
+
+class PaginaCursor:
+    """Resultado de una página: filas y cursores para navegar."""
+
+    def __init__(self, object_list, siguiente=None, anterior=None, tamano=TAMANO_PAGINA_DEFECTO):
+        self.object_list = object_list
+        self.siguiente = siguiente
+        self.anterior = anterior
+        self.tamano = tamano
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def tiene_siguiente(self):
+        return self.siguiente is not None
+
+    @property
+    def tiene_anterior(self):
+        return self.anterior is not None
+
+
+def _campo_del_modelo(modelo, campo):
+    """Field de `campo` (siguiendo relaciones con '__'); None si no es un campo del modelo."""
+    partes = campo.split('__')
+    try:
+        for parte in partes[:-1]:
+            modelo = modelo._meta.get_field(parte).related_model
+        ultimo = partes[-1]
+        return modelo._meta.pk if ultimo == 'pk' else modelo._meta.get_field(ultimo)
+    except (FieldDoesNotExist, AttributeError):
+        return None
+
+
+def _valores_del_cursor(queryset, campos, token):
+    """Decodifica el cursor y convierte cada valor al tipo de su campo.
+
+    Un cursor que decodifica pero trae valores de otro tipo (una fecha que no
+    es fecha, una pk que no es entero) se trata como ausente: la vista
+    muestra la primera página en lugar de fallar en la consulta.
+    """
+    valores = decodificar_cursor(token, len(campos))
+    if valores is None:
+        return None
+    convertidos = []
+    for campo, valor in zip(campos, valores):
+        if valor is None or isinstance(valor, (list, dict)):
+            return None
+        field = _campo_del_modelo(queryset.model, campo.lstrip('-'))
+        if field is not None:
+            try:
+                valor = field.to_python(valor)
+            except (ValidationError, TypeError, ValueError):
+                return None
+            if valor is None:
+                return None
+        convertidos.append(valor)
+    return convertidos
+
+
+def _consulta_de_pagina(queryset, campos, despues, antes):
+    """Arma la consulta de una página; devuelve (qs, hacia_atras, valores_despues)."""
+    valores_despues = _valores_del_cursor(queryset, campos, despues)
+    valores_antes = None if valores_despues else _valores_del_cursor(queryset, campos, antes)
+    hacia_atras = valores_antes is not None
+
+    if hacia_atras:
+        invertidos = tuple(c[1:] if c.startswith('-') else f'-{c}' for c in campos)
+        qs = queryset.filter(_filtro_posterior(campos, valores_antes, invertir=True)).order_by(*invertidos)
+    else:
+        qs = queryset.order_by(*campos)
+        if valores_despues is not None:
+            qs = qs.filter(_filtro_posterior(campos, valores_despues, invertir=False))
+    return qs, hacia_atras, valores_despues
+
+
+def _armar_pagina(filas, campos, tamano, hacia_atras, valores_despues):
+    """Construye la PaginaCursor a partir de las `tamano + 1` filas leídas."""
+    hay_mas = len(filas) > tamano
+    filas = filas[:tamano]
+    if hacia_atras:
+        filas.reverse()
+
+    def cursor_de(obj):
+        return codificar_cursor(_valor_de(obj, c.lstrip('-')) for c in campos)
+
+    siguiente = anterior = None
+    if filas:
+        if hay_mas or hacia_atras:
+            siguiente = cursor_de(filas[-1])
+        if (hacia_atras and hay_mas) or valores_despues is not None:
+            anterior = cursor_de(filas[0])
+
+    return PaginaCursor(filas, siguiente=siguiente, anterior=anterior, tamano=tamano)
+
+
+def paginar_por_cursor(queryset, campos, despues=None, antes=None, tamano=TAMANO_PAGINA_DEFECTO):
+    """Pagina `queryset` por los `campos` de ordenamiento (ej. ('-fecha_orden', '-pk')).
+
+    El último campo debe ser único (normalmente la pk) para que el orden sea
+    total. `despues` / `antes` son tokens devueltos en una página previa.
+    Ejecuta una sola consulta: se piden `tamano + 1` filas para saber si hay
+    otra página sin contar la tabla.
+    """
+    campos = tuple(campos)
+    qs, hacia_atras, valores_despues = _consulta_de_pagina(queryset, campos, despues, antes)
+    filas = list(qs[:tamano + 1])
+    return _armar_pagina(filas, campos, tamano, hacia_atras, valores_despues)
+
+
+async def apaginar_por_cursor(queryset, campos, despues=None, antes=None, tamano=TAMANO_PAGINA_DEFECTO):
+    """Versión async de `paginar_por_cursor` (para vistas async; usa el ORM async)."""
+    campos = tuple(campos)
+    qs, hacia_atras, valores_despues = _consulta_de_pagina(queryset, campos, despues, antes)
+    filas = [fila async for fila in qs[:tamano + 1]]
+    return _armar_pagina(filas, campos, tamano, hacia_atras, valores_despues)
+
+
+# =========================================================================
+# CONTEO ESTIMADO (PAGINACIÓN CON OFFSET DEL ADMIN)
+# =========================================================================
+# El paginador del admin necesita el total de filas. Sobre la tabla completa
+# un COUNT(*) exacto recorre millones de filas, así que se usa la estadística
+# del motor: reltuples en PostgreSQL y sqlite_stat1 en SQLite (la llenan
+# ANALYZE y PRAGMA optimize; el primer número de cada índice es el total de
+# filas). Si SQLite aún no tiene estadísticas se cuenta con tope: se leen a
+# lo sumo TOPE_CONTEO filas y el admin muestra hasta ahí. Con filtros, o si
+# la tabla es pequeña, se cuenta de verdad.
+
+MINIMO_CONTEO_ESTIMADO = 10000
+TOPE_CONTEO = 100000
+
+
+def _filas_segun_sqlite_stat1(cursor, tabla):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+    if cursor.fetchone() is None:
+        return None
+    cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [tabla])
+    # Los índices parciales cuentan sólo sus filas: el mayor es el de la tabla
+    totales = [int(stat.split()[0]) for stat, in cursor.fetchall() if stat]
+    return max(totales) if totales else None
+
+
+def conteo_estimado(queryset, minimo=MINIMO_CONTEO_ESTIMADO, tope=TOPE_CONTEO):
+    """Número de filas de `queryset`: estimado si no tiene filtros y pasa de `minimo`."""
+    conexion = connections[queryset.db]
+    if queryset.query.where or queryset.query.distinct or conexion.vendor not in ('postgresql', 'sqlite'):
+        return queryset.count()
+
+    opciones = queryset.model._meta
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [opciones.db_table])
+            fila = cursor.fetchone()
+            estimado = int(fila[0] or 0) if fila else 0
+        else:
+            estimado = _filas_segun_sqlite_stat1(cursor, opciones.db_table)
+            if estimado is None:
+                return queryset.order_by()[:tope].count()
+
+    if estimado < minimo:
+        return queryset.count()
+    return estimado
@@ -0,0 +1,379 @@
+import contextvars
+import decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .basedatos import escritura
+from .models import DetalleArchivado, DetalleOrden, ResumenVentaDiaria
+
+# =========================================================================
+# MANTENIMIENTO DE LA TABLA DE RESUMEN (ResumenVentaDiaria)
+# =========================================================================
+# Cada detalle aporta (unidades, bruto, descuento, neto) a una fila de
+# resumen identificada por su clave (fecha, producto, categoría, método de
+# pago, estado). Los cambios se aplican como deltas con
+# UPDATE ... SET col = col + delta, igual que el total de la orden.
+
+CERO = decimal.Decimal('0.00')
+
+# Órdenes que se están borrando: sus detalles ya se descontaron en bloque
+# desde el pre_delete de la orden y se ignoran en su propio post_delete.
+_ordenes_en_borrado = contextvars.ContextVar('ordenes_en_borrado', default=frozenset())
+
+
+def clave_resumen(fecha_orden, producto_id, categoria, metodo_pago, estado):
+    """Clave de la fila de resumen; la fecha es el día local de la orden."""
+    return (timezone.localdate(fecha_orden), producto_id, categoria, metodo_pago, estado)
+
+
+def aporte_detalle(cantidad, precio_unitario, descuento, subtotal):
+    """Devuelve la tupla (unidades, bruto, descuento, neto) de una línea."""
+    descuento = descuento if descuento is not None else CERO
+    return (cantidad, cantidad * precio_unitario, descuento, subtotal)
+
+
+def _negar(aporte):
+    return tuple(-valor for valor in aporte)
+
+
+def aplicar_deltas(deltas, archivado=False):
+    """Aplica un dict {clave: (unidades, bruto, descuento, neto)} a la tabla de resumen.
+
+    Intenta primero el UPDATE incremental; si la fila aún no existe la crea
+    y, si otro proceso la creó al mismo tiempo, repite el UPDATE. Con
+    `archivado` se aplica a las filas de las órdenes archivadas.
+    """
+    for clave, (unidades, bruto, descuento, neto) in deltas.items():
+        if not (unidades or bruto or descuento or neto):
+            continue
+        fecha, producto_id, categoria, metodo_pago, estado = clave
+        filtro = dict(fecha=fecha, producto_id=producto_id, categoria=categoria,
+                      metodo_pago=metodo_pago, estado=estado, archivado=archivado)
+        cambios = dict(
+            unidades=F('unidades') + unidades,
+            bruto=F('bruto') + bruto,
+            descuento=F('descuento') + descuento,
+            neto=F('neto') + neto,
+        )
+        if ResumenVentaDiaria.objects.filter(**filtro).update(**cambios):
+            continue
+        try:
+            with transaction.atomic():
+                ResumenVentaDiaria.objects.create(
+                    **filtro, unidades=unidades, bruto=bruto, descuento=descuento, neto=neto
+                )
+        except IntegrityError:
+            ResumenVentaDiaria.objects.filter(**filtro).update(**cambios)
+
+
+def sumar_deltas(destino, clave, aporte):
+    actual = destino.get(clave)
+    destino[clave] = aporte if actual is None else tuple(a + b for a, b in zip(actual, aporte))
+
+
+def acumular_detalles(detalles, signo=1, categorias=None):
+    """Suma al resumen un lote de detalles ya cargados (p. ej. tras un bulk_create).
+
+    Cada detalle debe tener `orden` accesible sin consulta (asignada o con
+    select_related). La categoría sale de `categorias` ({producto_id:
+    categoria}) si se pasa, o de `detalle.producto`.
+    """
+    deltas = {}
+    for detalle in detalles:
+        orden = detalle.orden
+        if categorias is not None:
+            categoria = categorias[detalle.producto_id]
+        else:
+            categoria = detalle.producto.categoria
+        clave = clave_resumen(orden.fecha_orden, detalle.producto_id, categoria,
+                              orden.metodo_pago, orden.estado)
+        aporte = aporte_detalle(detalle.cantidad, detalle.precio_unitario, detalle.descuento, detalle.subtotal)
+        sumar_deltas(deltas, clave, aporte if signo > 0 else _negar(aporte))
+    aplicar_deltas(deltas)
+
+
+def _aportes_por_producto(orden_pk):
+    """Aportes agregados por (producto, categoría) de todas las líneas de una orden."""
+    return (
+        DetalleOrden.objects.filter(orden_id=orden_pk)
+        .values('producto_id', 'producto__categoria')
+        .annotate(
+            unidades=Sum('cantidad'),
+            bruto=Sum(F('cantidad') * F('precio_unitario')),
+            descuento_total=Sum('descuento'),
+            neto=Sum('subtotal'),
+        )
+    )
+
+
+def mover_orden(orden_pk, anterior, nueva):
+    """Traslada las líneas de una orden de una clave a otra.
+
+    `anterior` y `nueva` son tuplas (fecha_orden, metodo_pago, estado), o
+    None para sólo agregar/quitar.
+    """
+    deltas = {}
+    for fila in _aportes_por_producto(orden_pk):
+        aporte = (fila['unidades'], fila['bruto'], fila['descuento_total'] or CERO, fila['neto'])
+        for extremo, signo in ((anterior, -1), (nueva, 1)):
+            if extremo is None:
+                continue
+            fecha_orden, metodo_pago, estado = extremo
+            clave = clave_resumen(fecha_orden, fila['producto_id'], fila['producto__categoria'], metodo_pago, estado)
+            sumar_deltas(deltas, clave, aporte if signo > 0 else _negar(aporte))
+    aplicar_deltas(deltas)
+
+
+# =========================================================================
+# RECEPTORES DE SEÑALES (conectados en apps.py)
+# =========================================================================
+
+_CAMPOS_ANTERIORES = (
+    'orden_id', 'producto_id', 'cantidad', 'precio_unitario', 'descuento', 'subtotal',
+    'orden__fecha_orden', 'orden__metodo_pago', 'orden__estado', 'producto__categoria',
+)
+
+
+def _aporte_guardado(fila):
+    clave = clave_resumen(fila['orden__fecha_orden'], fila['producto_id'], fila['producto__categoria'],
+                          fila['orden__metodo_pago'], fila['orden__estado'])
+    return clave, aporte_detalle(fila['cantidad'], fila['precio_unitario'], fila['descuento'], fila['subtotal'])
+
+
+def detalle_pre_save(sender, instance, raw=False, **kwargs):
+    instance._resumen_anterior = None
+    if raw or instance.pk is None:
+        return
+    fila = DetalleOrden.objects.filter(pk=instance.pk).values(*_CAMPOS_ANTERIORES).first()
+    if fila is not None:
+        instance._resumen_anterior = _aporte_guardado(fila)
+
+
+def detalle_post_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    deltas = {}
+    anterior = getattr(instance, '_resumen_anterior', None)
+    if anterior is not None:
+        sumar_deltas(deltas, anterior[0], _negar(anterior[1]))
+    orden = instance.orden
+    clave = clave_resumen(orden.fecha_orden, instance.producto_id, instance.producto.categoria,
+                          orden.metodo_pago, orden.estado)
+    sumar_deltas(deltas, clave, aporte_detalle(instance.cantidad, instance.precio_unitario,
+                                               instance.descuento, instance.subtotal))
+    aplicar_deltas(deltas)
+
+
+def detalle_post_delete(sender, instance, **kwargs):
+    if instance.orden_id in _ordenes_en_borrado.get():
+        return
+    acumular_detalles([instance], signo=-1)
+
+
+def orden_pre_save(sender, instance, raw=False, **kwargs):
+    instance._resumen_anterior = None
+    if raw or instance.pk is None:
+        return
+    instance._resumen_anterior = (
+        type(instance).objects.filter(pk=instance.pk)
+        .values_list('fecha_orden', 'metodo_pago', 'estado')
+        .first()
+    )
+
+
+def orden_post_save(sender, instance, created=False, raw=False, **kwargs):
+    anterior = getattr(instance, '_resumen_anterior', None)
+    if raw or created or anterior is None:
+        return
+    nueva = (instance.fecha_orden, instance.metodo_pago, instance.estado)
+    if (timezone.localdate(anterior[0]), *anterior[1:]) != (timezone.localdate(nueva[0]), *nueva[1:]):
+        mover_orden(instance.pk, anterior, nueva)
+
+
+def orden_pre_delete(sender, instance, **kwargs):
+    # Se descuentan todas sus líneas con una sola consulta agregada en lugar
+    # de una por cada detalle borrado en cascada.
+    mover_orden(instance.pk, (instance.fecha_orden, instance.metodo_pago, instance.estado), None)
+    _ordenes_en_borrado.set(_ordenes_en_borrado.get() | {instance.pk})
+
+
+def orden_post_delete(sender, instance, **kwargs):
+    _ordenes_en_borrado.set(_ordenes_en_borrado.get() - {instance.pk})
+
+
+def producto_post_save(sender, instance, created=False, raw=False, **kwargs):
+    # La categoría del resumen sigue a la categoría actual del producto.
+    if raw or created:
+        return
+    ResumenVentaDiaria.objects.filter(producto_id=instance.pk).exclude(
+        categoria=instance.categoria
+    ).update(categoria=instance.categoria)
+
+
+# =========================================================================
+# CAMBIOS EN BLOQUE Y RECONSTRUCCIÓN COMPLETA
+# =========================================================================
+
+def agregar_por_clave(detalles):
+    """Aportes de `detalles` sumados por clave de resumen, en una sola consulta agregada."""
+    return (
+        detalles
+        .annotate(fecha=TruncDate('orden__fecha_orden', tzinfo=timezone.get_current_timezone()))
+        .values('fecha', 'producto_id', 'producto__categoria', 'orden__metodo_pago', 'orden__estado')
+        .annotate(
+            unidades=Sum('cantidad'),
+            bruto=Sum(F('cantidad') * F('precio_unitario')),
+            descuento_total=Sum('descuento'),
+            neto=Sum('subtotal'),
+        )
+        .order_by()
+    )
+
+
+def actualizar_con_resumen(detalles, actualizar):
+    """Ejecuta `actualizar()` (un UPDATE en bloque sobre `detalles`) y ajusta el resumen.
+
+    Los aportes de esas líneas se leen agregados antes y después del UPDATE
+    y sólo se aplica la diferencia: dos consultas de lectura sin importar
+    cuántas líneas cambien. `detalles` no debe depender de las columnas
+    que cambia el UPDATE. Devuelve lo que devuelva `actualizar`.
+    """
+    deltas = {}
+
+    def sumar(signo):
+        for fila in agregar_por_clave(detalles):
+            clave = (fila['fecha'], fila['producto_id'], fila['producto__categoria'],
+                     fila['orden__metodo_pago'], fila['orden__estado'])
+            aporte = (fila['unidades'], fila['bruto'], fila['descuento_total'] or CERO, fila['neto'])
+            sumar_deltas(deltas, clave, aporte if signo > 0 else _negar(aporte))
+
+    sumar(-1)
+    resultado = actualizar()
+    sumar(1)
+    aplicar_deltas(deltas)
+    return resultado
+
+
+def mover_estado(detalles, estado_nuevo):
+    """Pasa a `estado_nuevo` los aportes de `detalles` en el resumen.
+
+    Una consulta agregada por clave, sin recorrer las líneas. Debe llamarse
+    ANTES del UPDATE de las órdenes, mientras `detalles` (filtrado por el
+    estado de origen) todavía las encuentra.
+    """
+    deltas = {}
+    for fila in agregar_por_clave(detalles):
+        aporte = (fila['unidades'], fila['bruto'], fila['descuento_total'] or CERO, fila['neto'])
+        base = (fila['fecha'], fila['producto_id'], fila['producto__categoria'], fila['orden__metodo_pago'])
+        sumar_deltas(deltas, (*base, fila['orden__estado']), _negar(aporte))
+        sumar_deltas(deltas, (*base, estado_nuevo), aporte)
+    aplicar_deltas(deltas)
+
+
+def pasar_al_archivo(detalles):
+    """Traslada los aportes de `detalles` a las filas archivadas del resumen.
+
+    Misma clave, sólo cambia `archivado`: una consulta agregada. Debe
+    llamarse antes de borrar las líneas de las tablas de trabajo.
+    """
+    deltas = {}
+    for fila in agregar_por_clave(detalles):
+        clave = (fila['fecha'], fila['producto_id'], fila['producto__categoria'],
+                 fila['orden__metodo_pago'], fila['orden__estado'])
+        sumar_deltas(deltas, clave, (fila['unidades'], fila['bruto'], fila['descuento_total'] or CERO, fila['neto']))
+    aplicar_deltas({clave: _negar(aporte) for clave, aporte in deltas.items()})
+    aplicar_deltas(deltas, archivado=True)
+
+
+def reconstruir_resumen(tamano_lote=2000, al_avanzar=None):
+    """Vacía y vuelve a calcular la tabla de resumen desde DetalleOrden y DetalleArchivado.
+
+    `al_avanzar(creadas)` se llama después de cada bloque insertado.
+    """
+    creadas = 0
+    with escritura():
+        ResumenVentaDiaria.objects.all().delete()
+        lote = []
+        for detalles, archivado in ((DetalleOrden.objects.all(), False), (DetalleArchivado.objects.all(), True)):
+            for fila in agregar_por_clave(detalles).iterator(chunk_size=tamano_lote):
+                lote.append(ResumenVentaDiaria(
+                    fecha=fila['fecha'],
+                    producto_id=fila['producto_id'],
+                    categoria=fila['producto__categoria'],
+                    metodo_pago=fila['orden__metodo_pago'],
+                    estado=fila['orden__estado'],
+                    archivado=archivado,
+                    unidades=fila['unidades'],
+                    bruto=fila['bruto'],
+                    descuento=fila['descuento_total'] or CERO,
+                    neto=fila['neto'],
+                ))
+                if len(lote) >= tamano_lote:
+                    ResumenVentaDiaria.objects.bulk_create(lote)
+                    creadas += len(lote)
+                    lote = []
+                    if al_avanzar:
+                        al_avanzar(creadas)
+        ResumenVentaDiaria.objects.bulk_create(lote)
+        creadas += len(lote)
+    return creadas
+
+
+# =========================================================================
+# CONSULTAS DE REPORTES
+# =========================================================================
+
+def _resumen_filtrado(desde=None, hasta=None, estados=None, incluir_archivo=False):
+    resumen = ResumenVentaDiaria.objects.all()
+    if not incluir_archivo:
+        resumen = resumen.filter(archivado=False)
+    if desde:
+        resumen = resumen.filter(fecha__gte=desde)
+    if hasta:
+        resumen = resumen.filter(fecha__lte=hasta)
+    if estados is not None:
+        resumen = resumen.filter(estado__in=estados)
+    return resumen
+
+
+def ingresos_por_dia(**filtros):
+    return (
+        _resumen_filtrado(**filtros)
+        .values('fecha')
+        .annotate(unidades=Sum('unidades'), bruto=Sum('bruto'), descuento=Sum('descuento'), neto=Sum('neto'))
+        .order_by('-fecha')
+    )
+
+
+def productos_mas_vendidos(limite=10, **filtros):
+    return (
+        _resumen_filtrado(**filtros)
+        .values('producto_id', 'producto__nombre', 'categoria')
+        .annotate(unidades=Sum('unidades'), neto=Sum('neto'))
+        .order_by('-neto', '-unidades')[:limite]
+    )
+
+
+def ventas_por_metodo_pago(**filtros):
+    return (
+        _resumen_filtrado(**filtros)
+        .values('metodo_pago')
+        .annotate(unidades=Sum('unidades'), neto=Sum('neto'))
+        .order_by('-neto')
+    )
+
+
+def _sumas_totales():
+    return dict(unidades=Sum('unidades'), bruto=Sum('bruto'), descuento=Sum('descuento'), neto=Sum('neto'))
+
+
+def totales_generales(**filtros):
+    return _resumen_filtrado(**filtros).aggregate(**_sumas_totales())
+
+
+async def atotales_generales(**filtros):
+    """Versión async de `totales_generales`."""
+    return await _resumen_filtrado(**filtros).aaggregate(**_sumas_totales())
@@ -0,0 +1,50 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+
+from . import basedatos, busqueda, catalogo, instrumentacion, inventario, reportes, totales, versiones
+from .models import Producto, OrdenDeVenta, DetalleOrden
+
+# =========================================================================
+# CONEXIÓN DE SEÑALES
+# =========================================================================
+# Se llama desde AppTiendademagiaConfig.ready(). Los receptores viven junto
+# a la lógica que mantienen; aquí sólo se conectan.
+
+
+def conectar():
+    # PRAGMAs de SQLite en cada conexión nueva (basedatos.py)
+    connection_created.connect(basedatos.aplicar_pragmas, dispatch_uid='basedatos_aplicar_pragmas')
+
+    # Contador de consultas de las mediciones (instrumentacion.py)
+    connection_created.connect(instrumentacion.instalar_contador_sql, dispatch_uid='instrumentacion_contador_sql')
+
+    # Tabla de resumen de ventas (reportes.py)
+    pre_save.connect(reportes.detalle_pre_save, sender=DetalleOrden, dispatch_uid='resumen_detalle_pre_save')
+    post_save.connect(reportes.detalle_post_save, sender=DetalleOrden, dispatch_uid='resumen_detalle_post_save')
+    post_delete.connect(reportes.detalle_post_delete, sender=DetalleOrden, dispatch_uid='resumen_detalle_post_delete')
+    pre_save.connect(reportes.orden_pre_save, sender=OrdenDeVenta, dispatch_uid='resumen_orden_pre_save')
+    post_save.connect(reportes.orden_post_save, sender=OrdenDeVenta, dispatch_uid='resumen_orden_post_save')
+    pre_delete.connect(reportes.orden_pre_delete, sender=OrdenDeVenta, dispatch_uid='resumen_orden_pre_delete')
+    post_delete.connect(reportes.orden_post_delete, sender=OrdenDeVenta, dispatch_uid='resumen_orden_post_delete')
+    post_save.connect(reportes.producto_post_save, sender=Producto, dispatch_uid='resumen_producto_post_save')
+
+    # Historial de movimientos de inventario (inventario.py)
+    pre_save.connect(inventario.producto_pre_save, sender=Producto, dispatch_uid='inventario_producto_pre_save')
+    post_save.connect(inventario.producto_post_save, sender=Producto, dispatch_uid='inventario_producto_post_save')
+
+    # Producto de muestra del resumen de las órdenes (totales.py)
+    post_save.connect(totales.producto_post_save, sender=Producto, dispatch_uid='totales_producto_post_save')
+
+    # Índice de búsqueda de productos (busqueda.py)
+    post_save.connect(busqueda.producto_post_save, sender=Producto, dispatch_uid='busqueda_producto_post_save')
+    post_delete.connect(busqueda.producto_post_delete, sender=Producto, dispatch_uid='busqueda_producto_post_delete')
+
+    # Catálogo en caché de los formularios de órdenes (catalogo.py)
+    post_save.connect(catalogo.producto_cambiado, sender=Producto, dispatch_uid='catalogo_producto_post_save')
+    post_delete.connect(catalogo.producto_cambiado, sender=Producto, dispatch_uid='catalogo_producto_post_delete')
+
+    # Versión de cambios por tabla para los ETag de la API (versiones.py)
+    for modelo in versiones.MODELOS_VERSIONADOS:
+        nombre = modelo._meta.model_name
+        post_save.connect(versiones.modelo_cambiado, sender=modelo, dispatch_uid=f'version_{nombre}_post_save')
+        post_delete.connect(versiones.modelo_cambiado, sender=modelo, dispatch_uid=f'version_{nombre}_post_delete')
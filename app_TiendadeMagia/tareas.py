@@ -0,0 +1,287 @@
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import F
+from django.utils import timezone
+
+from . import archivo, movimientos, reportes, totales
+from .exportacion import FORMATOS_EXPORTACION, TAMANO_BLOQUE_EXPORTACION, generar_exportacion
+from .filtros import filtrar_detalles
+from .models import OrdenDeVenta, Tarea
+
+# =========================================================================
+# TRABAJOS EN SEGUNDO PLANO
+# =========================================================================
+# Las operaciones largas (exportar, reconstruir el resumen, conciliar
+# totales) no se ejecutan dentro de la petición: la vista llama a `encolar`,
+# que inserta una fila en Tarea y responde con su id de inmediato. Uno o
+# varios procesos `manage.py ejecutar_tareas` toman las pendientes, las
+# ejecutan en un pool de hilos o de procesos y guardan el avance en la
+# misma fila, que las vistas ver_tarea / estado_tarea muestran.
+#
+#   - Tomar una tarea es un UPDATE ... WHERE estado = 'Pendiente': si dos
+#     trabajadores eligen la misma, sólo uno la actualiza.
+#   - El avance se guarda a lo más cada TAREAS_INTERVALO_AVANCE segundos y
+#     sirve de latido; una tarea 'En curso' sin latido durante
+#     TAREAS_TIEMPO_ABANDONO segundos (trabajador muerto) vuelve a la cola
+#     hasta TAREAS_MAX_INTENTOS veces.
+#
+# Cada tipo de tarea es una función registrada con @tipo_de_tarea que
+# recibe (parametros, avance, tarea) y devuelve el resultado (JSON).
+
+PENDIENTE, EN_CURSO, TERMINADA, FALLIDA = 'Pendiente', 'En curso', 'Terminada', 'Fallida'
+
+TIPOS_TAREA = {}
+
+
+class TipoDeTareaDesconocido(ValueError):
+    """No hay ninguna función registrada con ese tipo de tarea."""
+
+
+def tipo_de_tarea(nombre, descripcion, parametros=()):
+    """Decorador que registra una función como tipo de tarea.
+
+    `parametros` son los nombres que `encolar_desde` copia de un formulario.
+    """
+    def decorador(funcion):
+        TIPOS_TAREA[nombre] = {'funcion': funcion, 'descripcion': descripcion, 'parametros': tuple(parametros)}
+        return funcion
+    return decorador
+
+
+def descripcion_de(tipo):
+    return TIPOS_TAREA.get(tipo, {}).get('descripcion', tipo)
+
+
+def _intervalo_avance():
+    return getattr(settings, 'TAREAS_INTERVALO_AVANCE', 1.0)
+
+
+def _tiempo_abandono():
+    return getattr(settings, 'TAREAS_TIEMPO_ABANDONO', 600)
+
+
+def _max_intentos():
+    return getattr(settings, 'TAREAS_MAX_INTENTOS', 3)
+
+
+def directorio_archivos():
+    """Directorio donde las tareas dejan sus archivos (se crea si no existe)."""
+    directorio = Path(getattr(settings, 'TAREAS_DIRECTORIO', Path(settings.BASE_DIR) / 'tareas_archivos'))
+    directorio.mkdir(parents=True, exist_ok=True)
+    return directorio
+
+
+# -------------------------------------------------------------------------
+# COLA
+# -------------------------------------------------------------------------
+
+def encolar(tipo, **parametros):
+    """Crea una tarea pendiente de `tipo` y la devuelve (una sola consulta)."""
+    if tipo not in TIPOS_TAREA:
+        raise TipoDeTareaDesconocido(f'Tipo de tarea desconocido: {tipo}.')
+    return Tarea.objects.create(tipo=tipo, parametros=parametros)
+
+
+def encolar_desde(tipo, datos):
+    """Como `encolar`, tomando de `datos` (request.POST) sólo los parámetros declarados del tipo."""
+    if tipo not in TIPOS_TAREA:
+        raise TipoDeTareaDesconocido(f'Tipo de tarea desconocido: {tipo}.')
+    parametros = {nombre: datos[nombre] for nombre in TIPOS_TAREA[tipo]['parametros'] if datos.get(nombre)}
+    return encolar(tipo, **parametros)
+
+
+def tomar_siguiente(trabajador):
+    """Marca como 'En curso' la tarea pendiente más antigua y la devuelve (None si no hay)."""
+    while True:
+        pk = Tarea.objects.filter(estado=PENDIENTE).order_by('pk').values_list('pk', flat=True).first()
+        if pk is None:
+            return None
+        ahora = timezone.now()
+        tomada = Tarea.objects.filter(pk=pk, estado=PENDIENTE).update(
+            estado=EN_CURSO, trabajador=trabajador, iniciada=ahora, latido=ahora, intentos=F('intentos') + 1,
+        )
+        if tomada:
+            return Tarea.objects.get(pk=pk)
+        # Otro trabajador la tomó entre la lectura y el UPDATE: se intenta con la siguiente
+
+
+def recuperar_abandonadas():
+    """Devuelve a la cola (o marca como fallidas) las tareas en curso sin latido reciente."""
+    limite = timezone.now() - timedelta(seconds=_tiempo_abandono())
+    abandonadas = Tarea.objects.filter(estado=EN_CURSO, latido__lt=limite)
+    fallidas = abandonadas.filter(intentos__gte=_max_intentos()).update(
+        estado=FALLIDA, terminada=timezone.now(), error='El trabajador dejó de responder.',
+    )
+    reintentadas = abandonadas.update(estado=PENDIENTE, trabajador='')
+    return reintentadas, fallidas
+
+
+# -------------------------------------------------------------------------
+# EJECUCIÓN
+# -------------------------------------------------------------------------
+
+class Avance:
+    """Callable que recibe el avance de una tarea y lo guarda como máximo cada cierto intervalo.
+
+        avance(hechas)            # unidades terminadas
+        avance(hechas, total=n)   # también fija el total esperado
+    """
+
+    def __init__(self, tarea, intervalo=None):
+        self.tarea = tarea
+        self.intervalo = _intervalo_avance() if intervalo is None else intervalo
+        self._ultimo = 0.0
+
+    def __call__(self, hechas, total=None):
+        self.tarea.progreso = hechas
+        if total is not None:
+            self.tarea.total = total
+        ahora = time.monotonic()
+        if total is None and ahora - self._ultimo < self.intervalo:
+            return
+        self._ultimo = ahora
+        Tarea.objects.filter(pk=self.tarea.pk).update(
+            progreso=self.tarea.progreso, total=self.tarea.total, latido=timezone.now(),
+        )
+
+
+def ejecutar(tarea):
+    """Ejecuta una tarea ya tomada y guarda su resultado o el error."""
+    avance = Avance(tarea)
+    try:
+        funcion = TIPOS_TAREA[tarea.tipo]['funcion']
+        resultado = funcion(tarea.parametros, avance, tarea)
+    except Exception:
+        tarea.estado, tarea.error = FALLIDA, traceback.format_exc()
+    else:
+        tarea.estado, tarea.resultado = TERMINADA, resultado
+        if tarea.total is not None:
+            tarea.progreso = tarea.total
+    tarea.terminada = tarea.latido = timezone.now()
+    Tarea.objects.filter(pk=tarea.pk).update(
+        estado=tarea.estado, resultado=tarea.resultado, error=tarea.error, archivo=tarea.archivo,
+        progreso=tarea.progreso, total=tarea.total, terminada=tarea.terminada, latido=tarea.latido,
+    )
+    return tarea
+
+
+def ejecutar_pendientes(trabajador='local'):
+    """Ejecuta en este hilo todas las tareas pendientes; devuelve cuántas ejecutó."""
+    ejecutadas = 0
+    while (tarea := tomar_siguiente(trabajador)) is not None:
+        ejecutar(tarea)
+        ejecutadas += 1
+    return ejecutadas
+
+
+# -------------------------------------------------------------------------
+# TRABAJADORES (manage.py ejecutar_tareas)
+# -------------------------------------------------------------------------
+
+def bucle_trabajador(nombre, detener, espera=1.0, una_vez=False):
+    """Toma y ejecuta tareas hasta que se active `detener` (o se vacíe la cola con `una_vez`)."""
+    try:
+        while not detener.is_set():
+            tarea = tomar_siguiente(nombre)
+            if tarea is None:
+                if una_vez:
+                    return
+                # Sólo con la cola vacía: no agrega escrituras mientras hay trabajo
+                recuperar_abandonadas()
+                close_old_connections()
+                detener.wait(espera)
+                continue
+            ejecutar(tarea)
+            close_old_connections()
+    finally:
+        connection.close()
+
+
+def ejecutar_hilos(hilos=1, espera=1.0, una_vez=False, detener=None, prefijo=None):
+    """Ejecuta `hilos` bucles de trabajador en este proceso y espera a que terminen."""
+    detener = detener or threading.Event()
+    prefijo = prefijo or f'{socket.gethostname()}:{os.getpid()}'
+    pool = [
+        threading.Thread(target=bucle_trabajador, args=(f'{prefijo}:{i}', detener, espera, una_vez), daemon=True)
+        for i in range(max(1, hilos))
+    ]
+    for hilo in pool:
+        hilo.start()
+    # join con límite para que las señales lleguen al hilo principal
+    while any(hilo.is_alive() for hilo in pool):
+        for hilo in pool:
+            hilo.join(0.5)
+    return detener
+
+
+# =========================================================================
+# TIPOS DE TAREA
+# =========================================================================
+
+@tipo_de_tarea('exportar_detalles', 'Exportar detalles de órdenes',
+               parametros=('formato', 'estado', 'producto', 'desde', 'hasta'))
+def exportar_detalles(parametros, avance, tarea):
+    formato = parametros.get('formato', 'csv')
+    if formato not in FORMATOS_EXPORTACION:
+        raise ValueError(f'Formato de exportación no soportado: {formato}.')
+    detalles, _ = filtrar_detalles(parametros)
+    avance(0, total=detalles.count())
+
+    ruta = directorio_archivos() / f'tarea_{tarea.pk}_ordenes_detalles.{formato}'
+    lineas = -1 if formato == 'csv' else 0  # el CSV lleva encabezado
+    with open(ruta, 'w', newline='', encoding='utf-8') as destino:
+        for texto in generar_exportacion(formato, detalles):
+            destino.write(texto)
+            lineas += 1
+            if lineas and lineas % TAMANO_BLOQUE_EXPORTACION == 0:
+                avance(lineas)
+    tarea.archivo = str(ruta)
+    return {'detalles': lineas, 'formato': formato, 'bytes': ruta.stat().st_size}
+
+
+@tipo_de_tarea('reconstruir_resumen', 'Reconstruir el resumen de ventas')
+def reconstruir_resumen(parametros, avance, tarea):
+    return {'filas': reportes.reconstruir_resumen(al_avanzar=avance)}
+
+
+def _conciliar(buscar, recalcular, avance):
+    revisadas = corregidas = 0
+    avance(0, total=OrdenDeVenta.objects.count())
+    for en_bloque, desfasadas in totales.conciliar_por_bloques(buscar, recalcular):
+        revisadas += en_bloque
+        corregidas += len(desfasadas)
+        avance(revisadas)
+    return {'revisadas': revisadas, 'corregidas': corregidas}
+
+
+@tipo_de_tarea('conciliar_totales', 'Recalcular los totales de las órdenes')
+def conciliar_totales(parametros, avance, tarea):
+    return _conciliar(totales.buscar_totales_desfasados, totales.recalcular_totales, avance)
+
+
+@tipo_de_tarea('conciliar_resumen_ordenes', 'Recalcular el resumen de las órdenes')
+def conciliar_resumen_ordenes(parametros, avance, tarea):
+    return _conciliar(totales.buscar_resumenes_desfasados, totales.recalcular_resumenes, avance)
+
+
+@tipo_de_tarea('archivar_ordenes', 'Archivar las órdenes cerradas antiguas')
+def archivar_ordenes(parametros, avance, tarea):
+    limite = archivo.fecha_limite()
+    avance(0, total=archivo.ordenes_archivables(limite).count())
+    ordenes, lineas = archivo.archivar(al_avanzar=avance)
+    return {'ordenes': ordenes, 'lineas': lineas}
+
+
+@tipo_de_tarea('compactar_inventario', 'Guardar fotos de inventario y compactar movimientos antiguos')
+def compactar_inventario(parametros, avance, tarea):
+    fotos = movimientos.tomar_fotos()
+    fotos_corte, borrados = movimientos.compactar()
+    return {'fotos': fotos + fotos_corte, 'movimientos': borrados}
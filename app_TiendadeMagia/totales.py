@@ -0,0 +1,192 @@
+import decimal
+
+from django.db.models import CharField, Count, DecimalField, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from . import versiones
+from .models import OrdenDeVenta, DetalleOrden
+
+# =========================================================================
+# MANTENIMIENTO DEL TOTAL Y DEL RESUMEN DE LA ORDEN
+# =========================================================================
+# El total y el resumen (num_lineas, unidades) se ajustan con la diferencia
+# (delta) de cada línea que cambia, aplicada en la base de datos con un
+# UPDATE ... SET total = total + delta. Así el costo por cambio es O(1) sin
+# importar cuántas líneas tenga la orden y dos escrituras concurrentes no se
+# pisan entre sí. producto_muestra (el producto de la primera línea) se lee
+# con una subconsulta por índice en el mismo UPDATE cuando una línea se
+# agrega, se quita o cambia de producto.
+
+CERO = decimal.Decimal('0.00')
+
+
+def subconsulta_producto_muestra():
+    """Expresión con el nombre del producto de la primera línea de la orden externa ('' si no tiene)."""
+    primera = DetalleOrden.objects.filter(orden=OuterRef('pk')).order_by('pk').values('producto__nombre')[:1]
+    return Coalesce(Subquery(primera, output_field=CharField()), Value(''))
+
+
+def ajustar_resumen_orden(orden_pk, total=0, lineas=0, unidades=0, muestra=False):
+    """Aplica en un solo UPDATE los deltas del total, num_lineas y unidades de la orden.
+
+    Con `muestra` también vuelve a leer producto_muestra.
+    """
+    cambios = {}
+    total = decimal.Decimal(total or 0)
+    if total:
+        cambios['total'] = F('total') + total
+    if lineas:
+        cambios['num_lineas'] = F('num_lineas') + lineas
+    if unidades:
+        cambios['unidades'] = F('unidades') + unidades
+    if muestra:
+        cambios['producto_muestra'] = subconsulta_producto_muestra()
+    if not cambios:
+        return 0
+    versiones.incrementar(OrdenDeVenta)
+    return OrdenDeVenta.objects.filter(pk=orden_pk).update(**cambios)
+
+
+def ajustar_total_orden(orden_pk, delta):
+    """Suma `delta` (positivo o negativo) al total de la orden de forma atómica."""
+    return ajustar_resumen_orden(orden_pk, total=delta)
+
+
+def resumen_de_lineas(detalles):
+    """Campos de resumen de una orden nueva a partir de sus líneas (en orden de inserción).
+
+    `detalles` son DetalleOrden con `producto` cargado; la primera será la de
+    menor pk al insertarse con bulk_create.
+    """
+    return {
+        'num_lineas': len(detalles),
+        'unidades': sum(detalle.cantidad for detalle in detalles),
+        'producto_muestra': detalles[0].producto.nombre if detalles else '',
+    }
+
+
+def subconsulta_total_calculado():
+    """Expresión con la suma de subtotales de la orden externa (0 si no tiene líneas)."""
+    suma = (
+        DetalleOrden.objects.filter(orden=OuterRef('pk'))
+        .values('orden')
+        .annotate(suma=Sum('subtotal'))
+        .values('suma')
+    )
+    campo = DecimalField(max_digits=10, decimal_places=2)
+    return Coalesce(Subquery(suma, output_field=campo), Value(CERO, output_field=campo))
+
+
+def subconsultas_resumen():
+    """Expresiones con num_lineas, unidades y producto_muestra calculados desde los detalles."""
+    lineas = DetalleOrden.objects.filter(orden=OuterRef('pk')).values('orden')
+    return {
+        'num_lineas': Coalesce(
+            Subquery(lineas.annotate(n=Count('pk')).values('n'), output_field=IntegerField()), Value(0)
+        ),
+        'unidades': Coalesce(
+            Subquery(lineas.annotate(n=Sum('cantidad')).values('n'), output_field=IntegerField()), Value(0)
+        ),
+        'producto_muestra': subconsulta_producto_muestra(),
+    }
+
+
+def recalcular_totales(ordenes):
+    """Recalcula desde cero el total de las órdenes del queryset en un solo UPDATE."""
+    versiones.incrementar(OrdenDeVenta)
+    return ordenes.update(total=subconsulta_total_calculado())
+
+
+def recalcular_resumenes(ordenes):
+    """Recalcula desde cero num_lineas, unidades y producto_muestra en un solo UPDATE."""
+    versiones.incrementar(OrdenDeVenta)
+    return ordenes.update(**subconsultas_resumen())
+
+
+def buscar_totales_desfasados(desde_pk=0, limite=1000):
+    """Revisa un bloque de órdenes (por pk) y devuelve las que tienen el total desfasado.
+
+    Regresa (desfasadas, ultimo_pk, revisadas) donde `desfasadas` es una
+    lista de (pk, total_guardado, total_calculado), `ultimo_pk` es el último
+    pk revisado (None si ya no quedan órdenes) y `revisadas` el tamaño del
+    bloque.
+    """
+    bloque = list(
+        OrdenDeVenta.objects.filter(pk__gt=desde_pk)
+        .order_by('pk')
+        .annotate(total_calculado=subconsulta_total_calculado())
+        .values_list('pk', 'total', 'total_calculado')[:limite]
+    )
+    if not bloque:
+        return [], None, 0
+
+    centavo = decimal.Decimal('0.01')
+    desfasadas = [
+        (pk, total, calculado)
+        for pk, total, calculado in bloque
+        if decimal.Decimal(total).quantize(centavo) != decimal.Decimal(calculado).quantize(centavo)
+    ]
+    return desfasadas, bloque[-1][0], len(bloque)
+
+
+def buscar_resumenes_desfasados(desde_pk=0, limite=1000):
+    """Como `buscar_totales_desfasados`, pero para num_lineas, unidades y producto_muestra.
+
+    Las tuplas de `desfasadas` son (pk, guardado, calculado), cada uno
+    (num_lineas, unidades, producto_muestra).
+    """
+    calculados = {f'{campo}_calculado': expresion for campo, expresion in subconsultas_resumen().items()}
+    bloque = list(
+        OrdenDeVenta.objects.filter(pk__gt=desde_pk)
+        .order_by('pk')
+        .annotate(**calculados)
+        .values_list('pk', 'num_lineas', 'unidades', 'producto_muestra', *calculados)[:limite]
+    )
+    if not bloque:
+        return [], None, 0
+
+    desfasadas = [
+        (fila[0], tuple(fila[1:4]), tuple(fila[4:7]))
+        for fila in bloque
+        if tuple(fila[1:4]) != tuple(fila[4:7])
+    ]
+    return desfasadas, bloque[-1][0], len(bloque)
+
+
+def conciliar_por_bloques(buscar, recalcular, lote=1000, solo_reportar=False):
+    """Recorre las órdenes por bloques de pk y corrige las desfasadas.
+
+    `buscar` es buscar_totales_desfasados o buscar_resumenes_desfasados y
+    `recalcular` la función correspondiente. Produce (revisadas, desfasadas)
+    por bloque; con `solo_reportar` no modifica nada.
+    """
+    ultimo_pk = 0
+    while True:
+        desfasadas, ultimo_pk, en_bloque = buscar(desde_pk=ultimo_pk, limite=lote)
+        if ultimo_pk is None:
+            return
+        if desfasadas and not solo_reportar:
+            # Se recalcula en la base con un solo UPDATE por bloque para no
+            # pisar ajustes que lleguen entre la lectura y la escritura.
+            recalcular(OrdenDeVenta.objects.filter(pk__in=[d[0] for d in desfasadas]))
+        yield en_bloque, desfasadas
+
+
+# =========================================================================
+# RECEPTORES DE SEÑALES (conectados en signals.py)
+# =========================================================================
+
+def producto_post_save(sender, instance, created=False, raw=False, **kwargs):
+    # producto_muestra sigue al nombre actual del producto de la primera línea.
+    if raw or created:
+        return
+    primer_producto = DetalleOrden.objects.filter(orden=OuterRef('pk')).order_by('pk').values('producto')[:1]
+    desfasadas = (
+        OrdenDeVenta.objects
+        .filter(pk__in=DetalleOrden.objects.filter(producto_id=instance.pk).values('orden'))
+        .exclude(producto_muestra=instance.nombre)
+        .alias(primer_producto=Subquery(primer_producto))
+        .filter(primer_producto=instance.pk)
+    )
+    if desfasadas.update(producto_muestra=instance.nombre):
+        versiones.incrementar(OrdenDeVenta)
@@ -1,26 +1,51 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     # VISTAS GENERALES
     path('', views.inicio_TiendadeMagia, name='inicio'),
-    path('reportes/', views.ver_reportes, name='ver_reportes'), # Se mantiene la URL oculta
+    path('reportes/', views.ver_reportes, name='ver_reportes'),
 
     # CRUD DE PRODUCTO (Fase 1)
     path('productos/', views.ver_producto, name='ver_producto'),
+    path('productos/buscar/', views.buscar_productos_json, name='buscar_productos'),
+    path('productos/autocompletar/', views.autocompletar_productos, name='autocompletar_productos'),
     path('producto/agregar/', views.agregar_producto, name='agregar_producto'),
     path('producto/actualizar/<int:producto_id>/', views.actualizar_producto, name='actualizar_producto'),
     path('producto/borrar/<int:producto_id>/', views.borrar_producto, name='borrar_producto'),
+    path('productos/ajustar/', views.ajustar_productos, name='ajustar_productos'),
+    path('producto/<int:producto_id>/inventario/', views.inventario_producto, name='inventario_producto'),
 
     # CRUD DE ORDEN DE VENTA (Fase 2)
     path('ordenes/', views.ver_ordenes, name='ver_ordenes'),
+    path('ordenes/autocompletar/', views.autocompletar_ordenes, name='autocompletar_ordenes'),
     path('orden/agregar/', views.agregar_orden, name='agregar_orden'),
     path('orden/editar/<int:pk>/', views.editar_orden, name='editar_orden'),
     path('orden/eliminar/<int:pk>/', views.eliminar_orden, name='eliminar_orden'),
+    path('ordenes/estado/', views.cambiar_estado_ordenes, name='cambiar_estado_ordenes'),
     
     # CRUD DE DETALLE DE ORDEN (Fase 3)
     path('detalles/', views.ver_detalles, name='ver_detalles'),
     path('detalles/agregar/', views.agregar_detalle, name='agregar_detalle'),
     path('detalles/editar/<int:pk>/', views.editar_detalle, name='editar_detalle'),
     path('detalles/eliminar/<int:pk>/', views.eliminar_detalle, name='eliminar_detalle'),
+    path('detalles/exportar/<str:formato>/', views.exportar_detalles, name='exportar_detalles'),
+
+    # ARCHIVO DE ÓRDENES (SÓLO LECTURA)
+    path('archivo/', views.ver_archivo, name='ver_archivo'),
+    path('archivo/<int:pk>/', views.ver_orden_archivada, name='ver_orden_archivada'),
+
+    # TAREAS EN SEGUNDO PLANO
+    path('tareas/', views.ver_tareas, name='ver_tareas'),
+    path('tareas/encolar/<str:tipo>/', views.encolar_tarea, name='encolar_tarea'),
+    path('tareas/<int:pk>/', views.ver_tarea, name='ver_tarea'),
+    path('tareas/<int:pk>/estado/', views.estado_tarea, name='estado_tarea'),
+    path('tareas/<int:pk>/descargar/', views.descargar_tarea, name='descargar_tarea'),
+
+    # API JSON (v1) CON ETAG / GET CONDICIONAL
+    path('api/v1/productos/', api.productos, name='api_productos'),
+    path('api/v1/productos/<int:pk>/', api.producto, name='api_producto'),
+    path('api/v1/ordenes/', api.ordenes, name='api_ordenes'),
+    path('api/v1/ordenes/<int:pk>/', api.orden, name='api_orden'),
+    path('api/v1/detalles/', api.detalles, name='api_detalles'),
 ]
\ No newline at end of file
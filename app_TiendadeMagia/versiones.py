@@ -0,0 +1,63 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Producto, OrdenDeVenta, DetalleOrden, VersionTabla
+
+# =========================================================================
+# VERSIÓN DE CAMBIOS POR TABLA
+# =========================================================================
+# Cada escritura sobre Producto, OrdenDeVenta o DetalleOrden incrementa el
+# contador de su tabla en VersionTabla dentro de la misma transacción. La
+# API arma sus ETag y Last-Modified con esos contadores: si no cambiaron, la
+# respuesta tampoco, y se contesta 304 sin leer ni serializar las filas.
+#
+# save()/delete() lo hacen por señales; quien escriba con update() o
+# bulk_create() debe llamar a `incrementar` (ver inventario.py, totales.py,
+# ordenes.py e importar_ordenes).
+
+MODELOS_VERSIONADOS = (Producto, OrdenDeVenta, DetalleOrden)
+
+# Last-Modified para una tabla que aún no tiene fila de versión
+_INICIO = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def clave_tabla(modelo):
+    return modelo._meta.label_lower
+
+
+def incrementar(*modelos):
+    """Sube en uno la versión de las tablas de `modelos`."""
+    ahora = timezone.now()
+    for modelo in modelos:
+        clave = clave_tabla(modelo)
+        if VersionTabla.objects.filter(tabla=clave).update(version=F('version') + 1, modificado=ahora):
+            continue
+        try:
+            with transaction.atomic():
+                VersionTabla.objects.create(tabla=clave, version=1, modificado=ahora)
+        except IntegrityError:
+            VersionTabla.objects.filter(tabla=clave).update(version=F('version') + 1, modificado=ahora)
+
+
+def leer(*modelos):
+    """Devuelve ({clave: version}, ultima_modificacion) de las tablas pedidas con una consulta."""
+    claves = [clave_tabla(modelo) for modelo in modelos]
+    filas = dict(
+        (tabla, (version, modificado))
+        for tabla, version, modificado in VersionTabla.objects.filter(tabla__in=claves)
+        .values_list('tabla', 'version', 'modificado')
+    )
+    versiones = {clave: filas.get(clave, (0, None))[0] for clave in claves}
+    modificado = max((m for _, m in filas.values()), default=None) or _INICIO
+    return versiones, modificado
+
+
+# =========================================================================
+# RECEPTORES DE SEÑALES (conectados en signals.py)
+# =========================================================================
+
+def modelo_cambiado(sender, raw=False, **kwargs):
+    incrementar(sender)
@@ -1,38 +1,49 @@
-from django.shortcuts import render, redirect, get_object_or_404
-from django.db.models import Sum, F
-from django.db import transaction 
-from datetime import date 
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.shortcuts import aget_object_or_404, render, redirect, get_object_or_404
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import require_POST
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+from pathlib import Path
+from functools import partial
 import decimal
+import json
 
 # IMPORTACIONES CLAVE
 from .models import (
     Producto, 
     OrdenDeVenta, 
     DetalleOrden, 
+    MovimientoInventario,
+    Tarea,
+    CambioDeEstado,
+    OrdenArchivada,
     ESTADO_CHOICES,
     METODO_CHOICES
 ) 
-
-# =========================================================================
-# FUNCIONES DE UTILIDAD
-# =========================================================================
-
-def actualizar_total_orden(orden_pk):
-    """Calcula la suma de todos los subtotales de los detalles de una orden y actualiza el campo total."""
-    
-    try:
-        orden = OrdenDeVenta.objects.get(pk=orden_pk)
-    except OrdenDeVenta.DoesNotExist:
-        return 
-
-    # Calcula el total sumando el campo 'subtotal' de todos los detalles
-    nuevo_total = DetalleOrden.objects.filter(orden=orden).aggregate(
-        total_calculado=Sum('subtotal')
-    )['total_calculado'] or decimal.Decimal('0.00')
-        
-    orden.total = nuevo_total
-    orden.save()
-
+from . import ajustes, autocompletar, catalogo, estados, movimientos, reportes, tareas
+from .basedatos import escritura
+from .busqueda import LIMITE_RESULTADOS, buscar_productos
+from .exportacion import FORMATOS_EXPORTACION, generar_exportacion
+from .filtros import filtrar_detalles, leer_fecha
+from .fragmentos import renderizar_filas
+from .inventario import (
+    AJUSTE, RECEPCION, VENTA, StockInsuficiente, ajustar_reserva, ajustar_stock, liberar_orden, liberar_stock,
+    registrar_movimiento, reservar_stock,
+)
+from .ordenes import crear_orden
+from .paginacion import apaginar_por_cursor, paginar_por_cursor, tamano_pagina
+from .totales import ajustar_resumen_orden
+
+# Las vistas de sólo lectura (ver_producto, ver_ordenes, ver_detalles y
+# ver_reportes) son async y usan el ORM async: bajo ASGI no ocupan un hilo
+# mientras esperan a la base de datos o a un cliente lento. Bajo WSGI Django
+# las ejecuta igual. Las vistas que escriben siguen siendo síncronas.
 
 # =========================================================================
 # VISTAS GENERALES
@@ -48,14 +59,56 @@ def inicio_TiendadeMagia(request):
 # VISTAS CRUD DE PRODUCTO
 # =========================================================================
 
-def ver_producto(request):
-    """Muestra la lista de todos los productos en una tabla."""
-    productos = Producto.objects.all().order_by('nombre')
+async def ver_producto(request):
+    """Muestra la lista de productos; con ?q= muestra los resultados de la búsqueda ordenados por relevancia."""
+    q = request.GET.get('q', '').strip()
+    if q:
+        # La búsqueda usa raw() sobre FTS5, que no tiene variante async
+        productos = await sync_to_async(buscar_productos)(q, limite=200)
+    else:
+        productos = [p async for p in Producto.objects.all().order_by('nombre')]
     return render(request, 'producto/ver_producto.html', {
         'productos': productos,
+        'filas': renderizar_filas('producto', productos),
+        'q': q,
         'titulo': 'Ver Productos'
     })
 
+def buscar_productos_json(request):
+    """Endpoint de autocompletado: devuelve los productos más relevantes para ?q= en JSON."""
+    try:
+        limite = max(1, min(int(request.GET.get('limite', 10)), LIMITE_RESULTADOS))
+    except ValueError:
+        limite = 10
+    resultados = [
+        {
+            'id': p.pk,
+            'nombre': p.nombre,
+            'categoria': p.categoria,
+            'proveedor': p.proveedor,
+            'precio': str(p.precio),
+            'stock': p.stock,
+        }
+        for p in buscar_productos(request.GET.get('q', ''), limite=limite)
+    ]
+    return JsonResponse({'resultados': resultados})
+
+def _limite_autocompletar(request):
+    try:
+        return max(1, min(int(request.GET.get('limite', autocompletar.LIMITE_AUTOCOMPLETAR)),
+                          autocompletar.LIMITE_AUTOCOMPLETAR))
+    except ValueError:
+        return autocompletar.LIMITE_AUTOCOMPLETAR
+
+def autocompletar_productos(request):
+    """Autocompletado de los formularios de detalle: productos por pk o prefijo (?disponibles=1 sólo con stock)."""
+    resultados = autocompletar.productos(
+        request.GET.get('q', ''),
+        limite=_limite_autocompletar(request),
+        disponibles=request.GET.get('disponibles') == '1',
+    )
+    return JsonResponse({'resultados': resultados})
+
 def agregar_producto(request):
     if request.method == 'POST':
         try:
@@ -88,10 +141,11 @@ def actualizar_producto(request, producto_id):
             producto.categoria = request.POST['categoria']
             producto.precio = request.POST['precio']
             producto.proveedor = request.POST['proveedor']
-            producto.stock = request.POST.get('stock', producto.stock)
             producto.fecha_registro = request.POST['fecha_registro']
-            
-            producto.save()
+            # El stock no se edita aquí: se mueve con inventario_producto y
+            # ajustar_productos, que registran el movimiento con un delta.
+            producto.save(update_fields=['nombre', 'descripcion', 'categoria', 'precio',
+                                         'proveedor', 'fecha_registro', 'modificado'])
             return redirect('ver_producto')
         except Exception as e:
             return render(request, 'producto/actualizar_producto.html', {
@@ -105,6 +159,34 @@ def actualizar_producto(request, producto_id):
     })
 
 
+def ajustar_productos(request):
+    """Ajuste masivo de precio y/o stock por categoría y proveedor (ajustes.py).
+
+    'Vista previa' muestra el efecto con una consulta agregada; 'Aplicar'
+    lo ejecuta como un solo UPDATE sobre los productos filtrados.
+    """
+    contexto = {
+        'titulo': 'Ajuste Masivo de Productos',
+        'categorias': Producto.objects.order_by('categoria').values_list('categoria', flat=True).distinct(),
+        'proveedores': Producto.objects.exclude(proveedor__isnull=True).exclude(proveedor='')
+                       .order_by('proveedor').values_list('proveedor', flat=True).distinct(),
+        'modos': ajustes.MODOS_AJUSTE,
+        'datos': request.POST,
+    }
+    if request.method == 'POST':
+        try:
+            ajuste = ajustes.leer_formulario(request.POST)
+        except ajustes.AjusteInvalido as e:
+            contexto['error'] = str(e)
+        else:
+            productos = ajustes.productos_filtrados(request.POST.get('categoria'), request.POST.get('proveedor'))
+            if request.POST.get('accion') == 'aplicar':
+                contexto['resultado'] = ajustes.aplicar(productos, **ajuste)
+            else:
+                contexto['previa'] = ajustes.vista_previa(productos, **ajuste)
+    return render(request, 'producto/ajustar_productos.html', contexto, status=400 if 'error' in contexto else 200)
+
+
 def borrar_producto(request, producto_id):
     producto = get_object_or_404(Producto, id=producto_id)
     if request.method == 'POST':
@@ -122,124 +204,242 @@ def borrar_producto(request, producto_id):
         'titulo': 'Borrar Producto'
     })
 
+
+def inventario_producto(request, producto_id):
+    """Historial de stock de un producto (movimientos.py).
+
+    Muestra el stock vigente, el stock al cierre de ?fecha= y los movimientos
+    paginados por cursor; el POST registra una recepción o un ajuste.
+    """
+    error = None
+    if request.method == 'POST':
+        tipo = request.POST.get('tipo')
+        nota = (request.POST.get('nota') or '').strip()[:255]
+        try:
+            cantidad = int(request.POST.get('cantidad') or 0)
+        except ValueError:
+            cantidad = 0
+        get_object_or_404(Producto.objects.only('pk'), pk=producto_id)
+        with escritura():
+            if tipo == RECEPCION and cantidad > 0:
+                liberar_stock(producto_id, cantidad, tipo=RECEPCION, nota=nota)
+            elif tipo == AJUSTE and cantidad:
+                if not ajustar_stock(producto_id, cantidad, nota):
+                    error = 'El ajuste dejaría el stock por debajo de 0.'
+            else:
+                error = 'Indica una recepción positiva o un ajuste distinto de 0.'
+        if not error:
+            return redirect('inventario_producto', producto_id=producto_id)
+
+    fecha = leer_fecha(request.GET.get('fecha'))
+    productos = Producto.objects.filter(pk=producto_id)
+    if fecha:
+        # Stock al cierre del día, en la misma consulta que el producto
+        cierre = timezone.make_aware(datetime.combine(fecha, time.max))
+        productos = movimientos.stocks_a_fecha(productos, cierre)
+    producto = get_object_or_404(productos)
+
+    pagina = paginar_por_cursor(
+        MovimientoInventario.objects.filter(producto_id=producto_id),
+        ('-fecha', '-pk'),
+        despues=request.GET.get('despues'),
+        antes=request.GET.get('antes'),
+        tamano=tamano_pagina(request),
+    )
+    return render(request, 'producto/inventario_producto.html', {
+        'producto': producto,
+        'fecha': fecha,
+        'movimientos': pagina,
+        'pagina': pagina,
+        'error': error,
+        'datos': request.POST,
+        'titulo': f'Inventario de {producto.nombre}',
+    }, status=400 if error else 200)
+
 # =========================================================================
 # VISTAS CRUD DE ORDEN DE VENTA (MODIFICADA)
 # =========================================================================
 
-def ver_ordenes(request):
-    """Muestra la lista de todas las órdenes de venta."""
-    ordenes = OrdenDeVenta.objects.all().order_by('-fecha_orden')
-    
-    # MODIFICACIÓN: Añadir el primer detalle a cada orden para mostrarlo en la tabla
-    for orden in ordenes:
-        primer_detalle = orden.detalles.select_related('producto').first() 
-        orden.producto_muestra = primer_detalle.producto.nombre if primer_detalle else 'Sin productos'
-        orden.cantidad_muestra = primer_detalle.cantidad if primer_detalle else 0
-        
+async def ver_ordenes(request):
+    """Muestra las órdenes de venta paginadas por cursor (fecha_orden, pk).
+
+    El producto de muestra, el número de líneas y las unidades son columnas
+    de la orden (totales.py), así que cada página lee sólo la tabla de
+    órdenes sin importar cuántas existan.
+    """
+    pagina = await apaginar_por_cursor(
+        OrdenDeVenta.objects.all(),
+        ('-fecha_orden', '-pk'),
+        despues=request.GET.get('despues'),
+        antes=request.GET.get('antes'),
+        tamano=tamano_pagina(request),
+    )
+
     return render(request, 'orden/ver_ordenes.html', {
-        'ordenes': ordenes,
+        'ordenes': pagina,
+        'filas': renderizar_filas('orden', pagina),
+        'pagina': pagina,
+        'estado_choices': ESTADO_CHOICES,
         'titulo': 'Ver Órdenes de Venta'
     })
 
+def autocompletar_ordenes(request):
+    """Autocompletado de los formularios de detalle: órdenes por pk o prefijo del cliente."""
+    resultados = autocompletar.ordenes(request.GET.get('q', ''), limite=_limite_autocompletar(request))
+    return JsonResponse({'resultados': resultados})
+
+def _lineas_del_formulario(post):
+    """Lee las líneas del formulario: listas paralelas producto/cantidad/descuento.
+
+    También acepta los campos antiguos producto_inicial/cantidad_inicial.
+    """
+    productos = post.getlist('producto')
+    cantidades = post.getlist('cantidad')
+    descuentos = post.getlist('descuento')
+    if not productos and post.get('producto_inicial'):
+        productos, cantidades = [post['producto_inicial']], [post.get('cantidad_inicial')]
+    return [
+        {
+            'producto': producto,
+            'cantidad': cantidades[i] if i < len(cantidades) else None,
+            'descuento': descuentos[i] if i < len(descuentos) else None,
+        }
+        for i, producto in enumerate(productos)
+        if producto  # filas vacías del formulario
+    ]
+
+
+def _agregar_orden_json(request):
+    """Alta de orden por JSON: {"cliente", "direccion_envio", ..., "lineas": [{"producto", "cantidad"}]}."""
+    try:
+        datos = json.loads(request.body)
+        if not isinstance(datos, dict) or not isinstance(datos.get('lineas'), list):
+            raise ValueError('Se esperaba un objeto con una lista "lineas".')
+        if not datos.get('cliente') or not datos.get('direccion_envio'):
+            raise ValueError('Faltan campos obligatorios: cliente y direccion_envio.')
+        orden = crear_orden(datos, datos['lineas'])
+    except StockInsuficiente as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'orden': orden.pk,
+        'total': str(orden.total),
+        'url': reverse('editar_orden', args=[orden.pk]),
+    }, status=201)
+
+
 def agregar_orden(request):
-    productos = Producto.objects.all().filter(stock__gt=0) # Productos disponibles
-    
+    """Crea una orden con una o varias líneas.
+
+    Acepta el formulario HTML (filas producto/cantidad repetibles) o un
+    cuerpo JSON con Content-Type application/json.
+    """
+    # Productos disponibles, desde la caché del catálogo (se renderiza sólo si la plantilla lo usa)
+    opciones_productos = partial(catalogo.opciones_productos, 'disponibles')
+    contexto = {
+        'titulo': 'Agregar Orden de Venta',
+        'estado_choices': ESTADO_CHOICES,
+        'metodo_choices': METODO_CHOICES,
+        'opciones_productos': opciones_productos
+    }
+
     if request.method == 'POST':
+        if request.content_type == 'application/json':
+            return _agregar_orden_json(request)
+
         cliente = request.POST.get('cliente')
         direccion_envio = request.POST.get('direccion_envio')
-        estado = request.POST.get('estado')
-        metodo_pago = request.POST.get('metodo_pago')
-        comentarios = request.POST.get('comentarios')
-        
-        # Nuevos campos del formulario para el producto inicial
-        producto_id = request.POST.get('producto_inicial')
-        cantidad_inicial_str = request.POST.get('cantidad_inicial')
+        lineas = _lineas_del_formulario(request.POST)
         
-        if not cliente or not direccion_envio or not producto_id or not cantidad_inicial_str:
+        if not cliente or not direccion_envio or not lineas:
             return render(request, 'orden/agregar_orden.html', {
-                'titulo': 'Agregar Orden de Venta',
-                'error': 'Faltan campos obligatorios: Cliente, Dirección y Producto Inicial.',
-                'estado_choices': ESTADO_CHOICES,
-                'metodo_choices': METODO_CHOICES,
-                'productos': productos
+                **contexto,
+                'error': 'Faltan campos obligatorios: Cliente, Dirección y al menos un Producto.',
             })
 
         try:
-            cantidad_inicial = int(cantidad_inicial_str)
-            producto = get_object_or_404(Producto, pk=producto_id)
-            
-            if cantidad_inicial <= 0:
-                 raise ValueError("La cantidad debe ser mayor a cero.")
-            
-            with transaction.atomic():
-                # 1. Crear la Orden de Venta
-                nueva_orden = OrdenDeVenta.objects.create(
-                    cliente=cliente,
-                    direccion_envio=direccion_envio,
-                    estado=estado,
-                    metodo_pago=metodo_pago,
-                    comentarios=comentarios,
-                    total=0.00
-                )
-                
-                # 2. Crear el DetalleOrden con el producto inicial
-                precio_unitario = producto.precio
-                subtotal_calc = precio_unitario * cantidad_inicial
-                
-                DetalleOrden.objects.create(
-                    orden=nueva_orden,
-                    producto=producto,
-                    cantidad=cantidad_inicial,
-                    precio_unitario=precio_unitario,
-                    subtotal=subtotal_calc,
-                    descuento=decimal.Decimal('0.00'),
-                    observaciones="Producto inicial al crear orden."
-                )
-                
-                # 3. Actualizar el Total de la Orden
-                actualizar_total_orden(nueva_orden.pk)
-            
+            crear_orden(request.POST, lineas)
             return redirect('ver_ordenes')
             
         except (ValueError, Exception) as e:
              return render(request, 'orden/agregar_orden.html', {
-                'titulo': 'Agregar Orden de Venta',
-                'error': f'Error al procesar el producto: {e}',
-                'estado_choices': ESTADO_CHOICES,
-                'metodo_choices': METODO_CHOICES,
-                'productos': productos
-            })
+                **contexto,
+                'error': f'Error al procesar los productos: {e}',
+            }, status=409 if isinstance(e, StockInsuficiente) else 200)
             
-    return render(request, 'orden/agregar_orden.html', {
-        'titulo': 'Agregar Orden de Venta',
-        'estado_choices': ESTADO_CHOICES,
-        'metodo_choices': METODO_CHOICES,
-        'productos': productos
-    })
+    return render(request, 'orden/agregar_orden.html', contexto)
 
 def editar_orden(request, pk):
     orden = get_object_or_404(OrdenDeVenta, pk=pk)
+    error = None
     
     if request.method == 'POST':
-        orden.cliente = request.POST.get('cliente')
-        orden.direccion_envio = request.POST.get('direccion_envio')
-        orden.estado = request.POST.get('estado')
-        orden.metodo_pago = request.POST.get('metodo_pago')
-        orden.comentarios = request.POST.get('comentarios')
-        orden.save()
-        return redirect('ver_ordenes')
+        # El estado pasa por estados.cambiar_estado: transiciones permitidas,
+        # stock devuelto al cancelar y registro en CambioDeEstado
+        estado_nuevo = request.POST.get('estado', orden.estado)
+        if estado_nuevo != orden.estado and estado_nuevo not in estados.destinos_permitidos(orden.estado):
+            error = f'Una orden {orden.estado} no puede pasar a {estado_nuevo}.'
+        else:
+            orden.cliente = request.POST.get('cliente')
+            orden.direccion_envio = request.POST.get('direccion_envio')
+            orden.metodo_pago = request.POST.get('metodo_pago')
+            orden.comentarios = request.POST.get('comentarios')
+            with escritura():
+                # Sin total / num_lineas / unidades / producto_muestra: los mantienen
+                # los deltas de ajustar_resumen_orden y aquí se pisarían con lo leído
+                orden.save(update_fields=['cliente', 'direccion_envio', 'metodo_pago', 'comentarios', 'modificado'])
+                if estado_nuevo != orden.estado:
+                    estados.cambiar_estado(
+                        OrdenDeVenta.objects.filter(pk=orden.pk), estado_nuevo,
+                        usuario=request.user.get_username(), canal='vista', criterio={'ordenes': [orden.pk]},
+                    )
+            return redirect('ver_ordenes')
 
     return render(request, 'orden/editar_orden.html', {
         'orden': orden,
         'titulo': f'Editar Orden #{orden.pk}',
         'estado_choices': ESTADO_CHOICES,
-        'metodo_choices': METODO_CHOICES
-    })
+        'metodo_choices': METODO_CHOICES,
+        'error': error,
+    }, status=400 if error else 200)
     
+def cambiar_estado_ordenes(request):
+    """Cambia de estado varias órdenes a la vez (estados.py).
+
+    POST con 'estado_nuevo' y las órdenes marcadas en ver_ordenes
+    ('ordenes') y/o todas las de 'desde_estado'. Con Accept:
+    application/json devuelve los conteos por estado de origen.
+    """
+    contexto = {
+        'titulo': 'Cambiar Estado de Órdenes',
+        'estado_choices': ESTADO_CHOICES,
+        'transiciones': [(estado, estados.destinos_permitidos(estado)) for estado in estados.ESTADOS],
+        'datos': request.POST,
+    }
+    status = 200
+    if request.method == 'POST':
+        try:
+            ordenes, criterio = estados.leer_seleccion(request.POST)
+            contexto['resultado'] = estados.cambiar_estado(
+                ordenes, request.POST.get('estado_nuevo'),
+                usuario=request.user.get_username(), canal='vista', criterio=criterio,
+            )
+        except estados.TransicionInvalida as e:
+            contexto['error'], status = str(e), 400
+        if 'application/json' in request.headers.get('Accept', ''):
+            return JsonResponse(contexto.get('resultado') or {'error': contexto['error']}, status=status)
+    contexto['cambios'] = CambioDeEstado.objects.all()[:10]
+    return render(request, 'orden/cambiar_estado.html', contexto, status=status)
+
 def eliminar_orden(request, pk):
     orden = get_object_or_404(OrdenDeVenta, pk=pk)
     if request.method == 'POST':
-        with transaction.atomic():
+        with escritura():
+            # Una orden cancelada ya devolvió su stock al cancelarse (estados.py)
+            if orden.estado != estados.ESTADO_CANCELADO:
+                liberar_orden(orden.pk)
             orden.delete()
         return redirect('ver_ordenes')
     return render(request, 'orden/eliminar_orden.html', {
@@ -251,19 +451,112 @@ def eliminar_orden(request, pk):
 # VISTAS CRUD DE DETALLE DE ORDEN
 # =========================================================================
 
-def ver_detalles(request):
-    """Muestra la lista de todos los detalles de órdenes."""
-    detalles = DetalleOrden.objects.all().order_by('-orden__fecha_orden')
-    
+MARCADOR_FILAS = mark_safe('<!--filas-detalles-->')
+TAMANO_BLOQUE_STREAMING = 2000
+
+
+def _partes_pagina_completa(request, contexto):
+    """Renderiza la página con un marcador en lugar del <tbody> y la parte en dos."""
+    pagina = render_to_string('orden/ver_detalles.html', {
+        **contexto,
+        'modo_completo': True,
+        'marcador_filas': MARCADOR_FILAS,
+    }, request=request)
+    return pagina.split(MARCADOR_FILAS, 1)
+
+
+def _streaming_detalles(request, detalles, contexto):
+    """Genera la página completa enviando las filas por bloques.
+
+    Se envía la parte anterior al marcador, luego las filas leídas con un
+    iterador del servidor y al final el resto de la página. En memoria sólo
+    vive un bloque a la vez.
+    """
+    cabecera, pie = _partes_pagina_completa(request, contexto)
+
+    yield cabecera
+    filas = detalles.order_by('-orden__fecha_orden', '-pk').iterator(chunk_size=TAMANO_BLOQUE_STREAMING)
+    while True:
+        bloque = list(islice(filas, TAMANO_BLOQUE_STREAMING))
+        if not bloque:
+            break
+        yield renderizar_filas('detalle', bloque)
+    yield pie
+
+
+async def _astreaming_detalles(request, detalles, contexto):
+    """Igual que `_streaming_detalles` pero como iterador async (servidor ASGI)."""
+    cabecera, pie = _partes_pagina_completa(request, contexto)
+
+    yield cabecera
+    bloque = []
+    filas = detalles.order_by('-orden__fecha_orden', '-pk').aiterator(chunk_size=TAMANO_BLOQUE_STREAMING)
+    async for detalle in filas:
+        bloque.append(detalle)
+        if len(bloque) == TAMANO_BLOQUE_STREAMING:
+            yield renderizar_filas('detalle', bloque)
+            bloque = []
+    if bloque:
+        yield renderizar_filas('detalle', bloque)
+    yield pie
+
+
+async def ver_detalles(request):
+    """Muestra los detalles de órdenes con filtros (el producto, con autocompletado).
+
+    Por defecto pagina por cursor (fecha de la orden, pk). Con ?modo=completo
+    envía todas las filas filtradas como respuesta en streaming.
+    """
+    detalles, filtros = filtrar_detalles(request.GET)
+    contexto = {
+        'titulo': 'Ver Detalles de Órdenes',
+        'filtros': filtros,
+        'estado_choices': ESTADO_CHOICES,
+    }
+    # El producto se elige con autocompletar_productos: sólo se lee el filtrado
+    if 'producto' in filtros:
+        fila = await Producto.objects.filter(pk=filtros['producto']).values_list('nombre', 'precio', 'stock').afirst()
+        contexto['texto_producto'] = autocompletar.texto_producto(*fila) if fila else ''
+
+    if request.GET.get('modo') == 'completo':
+        # Cada servidor recibe el tipo de iterador que consume sin adaptarlo
+        generar = _astreaming_detalles if isinstance(request, ASGIRequest) else _streaming_detalles
+        return StreamingHttpResponse(generar(request, detalles, contexto))
+
+    pagina = await apaginar_por_cursor(
+        detalles,
+        ('-orden__fecha_orden', '-pk'),
+        despues=request.GET.get('despues'),
+        antes=request.GET.get('antes'),
+        tamano=tamano_pagina(request),
+    )
     return render(request, 'orden/ver_detalles.html', {
-        'detalles': detalles,
-        'titulo': 'Ver Detalles de Órdenes'
+        **contexto,
+        'detalles': pagina,
+        'filas': renderizar_filas('detalle', pagina),
+        'pagina': pagina,
     })
 
-def agregar_detalle(request):
-    ordenes = OrdenDeVenta.objects.all()
-    productos = Producto.objects.all().filter(stock__gt=0)
+def exportar_detalles(request, formato):
+    """Descarga los detalles filtrados (con su orden y producto) como CSV o JSONL.
+
+    La respuesta se envía en streaming: el primer byte sale de inmediato y la
+    memoria se mantiene constante sin importar cuántas líneas se exporten.
+    """
+    if formato not in FORMATOS_EXPORTACION:
+        raise Http404('Formato de exportación no soportado.')
+
+    detalles, _ = filtrar_detalles(request.GET)
+    respuesta = StreamingHttpResponse(
+        generar_exportacion(formato, detalles),
+        content_type=FORMATOS_EXPORTACION[formato],
+    )
+    respuesta['Content-Disposition'] = f'attachment; filename="ordenes_detalles.{formato}"'
+    return respuesta
 
+def agregar_detalle(request):
+    # Orden y producto se eligen con autocompletado (autocompletar_ordenes /
+    # autocompletar_productos): la página no crece con el tamaño de las tablas.
     if request.method == 'POST':
         orden_id = request.POST.get('orden')
         producto_id = request.POST.get('producto')
@@ -288,19 +581,31 @@ def agregar_detalle(request):
             if subtotal_calc < 0:
                  raise ValueError("El subtotal no puede ser negativo.")
 
-            detalle_existente = DetalleOrden.objects.filter(
-                orden=orden,
-                producto=producto
-            ).first()
+            with escritura():
+                # Reservar primero: toma el candado de escritura antes de leer
+                # la línea existente, así dos altas simultáneas no se pisan.
+                # El movimiento se registra al final, cuando ya hay línea.
+                # Una orden cancelada ya devolvió su stock y no admite líneas.
+                estados.exigir_abiertas(orden.pk)
+                reservar_stock(producto.pk, cantidad, registrar=False)
+
+                detalle_existente = DetalleOrden.objects.select_for_update().filter(
+                    orden=orden,
+                    producto=producto
+                ).first()
 
-            with transaction.atomic():
                 if detalle_existente:
+                    subtotal_anterior = detalle_existente.subtotal
                     detalle_existente.cantidad += cantidad
                     detalle_existente.descuento += descuento
                     detalle_existente.subtotal = detalle_existente.subtotal_calculado
                     detalle_existente.save()
+                    ajustar_resumen_orden(
+                        orden.pk, total=detalle_existente.subtotal - subtotal_anterior, unidades=cantidad
+                    )
+                    detalle_pk = detalle_existente.pk
                 else:
-                    DetalleOrden.objects.create(
+                    detalle_pk = DetalleOrden.objects.create(
                         orden=orden,
                         producto=producto,
                         cantidad=cantidad,
@@ -308,9 +613,10 @@ def agregar_detalle(request):
                         subtotal=subtotal_calc,      
                         descuento=descuento,         
                         observaciones=observaciones  
-                    )
-            
-            actualizar_total_orden(orden.pk)
+                    ).pk
+                    ajustar_resumen_orden(orden.pk, total=subtotal_calc, lineas=1, unidades=cantidad, muestra=True)
+                registrar_movimiento(producto.pk, VENTA, -cantidad, detalle_pk)
+
             return redirect('ver_detalles')
             
         except (ValueError, Exception) as e:
@@ -318,23 +624,21 @@ def agregar_detalle(request):
             return render(request, 'orden/agregar_detalle.html', {
                 'error': error_msg,
                 'titulo': 'Agregar Detalle de Orden',
-                'ordenes': ordenes,
-                'productos': productos
-            })
+            }, status=409 if isinstance(e, (StockInsuficiente, estados.OrdenCancelada)) else 200)
 
     return render(request, 'orden/agregar_detalle.html', {
         'titulo': 'Agregar Detalle de Orden',
-        'ordenes': ordenes,
-        'productos': productos
     })
 
 def editar_detalle(request, pk):
-    detalle = get_object_or_404(DetalleOrden, pk=pk)
-    ordenes = OrdenDeVenta.objects.all()
-    productos = Producto.objects.all()
+    detalle = get_object_or_404(DetalleOrden.objects.select_related('orden', 'producto'), pk=pk)
+    error = None
 
     if request.method == 'POST':
-        orden_anterior_pk = detalle.orden.pk 
+        orden_anterior_pk = detalle.orden_id
+        producto_anterior_pk = detalle.producto_id
+        cantidad_anterior = detalle.cantidad
+        subtotal_anterior = detalle.subtotal
         
         cantidad = int(request.POST.get('cantidad'))
         descuento = decimal.Decimal(request.POST.get('descuento', '0.00') or '0.00')
@@ -346,41 +650,65 @@ def editar_detalle(request, pk):
         orden_nueva = get_object_or_404(OrdenDeVenta, pk=request.POST.get('orden'))
         nuevo_producto = get_object_or_404(Producto, pk=request.POST.get('producto'))
         
-        with transaction.atomic():
-            detalle.orden = orden_nueva
-            detalle.cantidad = cantidad
-            detalle.descuento = descuento
-            detalle.observaciones = observaciones
-
-            if detalle.producto.pk != nuevo_producto.pk:
-                detalle.precio_unitario = nuevo_producto.precio 
-            detalle.producto = nuevo_producto
-            
-            detalle.subtotal = detalle.subtotal_calculado
-            detalle.save()
-        
-            if orden_anterior_pk != detalle.orden.pk:
-                 actualizar_total_orden(orden_anterior_pk)
+        try:
+            with escritura():
+                estados.exigir_abiertas(orden_anterior_pk, orden_nueva.pk)
+                ajustar_reserva(producto_anterior_pk, cantidad_anterior, nuevo_producto.pk, cantidad, detalle.pk)
+
+                detalle.orden = orden_nueva
+                detalle.cantidad = cantidad
+                detalle.descuento = descuento
+                detalle.observaciones = observaciones
+
+                if detalle.producto.pk != nuevo_producto.pk:
+                    detalle.precio_unitario = nuevo_producto.precio 
+                detalle.producto = nuevo_producto
+                
+                detalle.subtotal = detalle.subtotal_calculado
+                detalle.save()
             
-            actualizar_total_orden(detalle.orden.pk)
+                if orden_anterior_pk != detalle.orden_id:
+                    ajustar_resumen_orden(orden_anterior_pk, total=-subtotal_anterior, lineas=-1,
+                                          unidades=-cantidad_anterior, muestra=True)
+                    ajustar_resumen_orden(detalle.orden_id, total=detalle.subtotal, lineas=1,
+                                          unidades=cantidad, muestra=True)
+                else:
+                    ajustar_resumen_orden(detalle.orden_id, total=detalle.subtotal - subtotal_anterior,
+                                          unidades=cantidad - cantidad_anterior,
+                                          muestra=producto_anterior_pk != nuevo_producto.pk)
+
             return redirect('ver_detalles')
 
+        except (StockInsuficiente, estados.OrdenCancelada) as e:
+            # El detalle en memoria no se guardó; se vuelve a leer para el formulario
+            detalle = get_object_or_404(DetalleOrden.objects.select_related('orden', 'producto'), pk=pk)
+            error = str(e)
+
     return render(request, 'orden/editar_detalle.html', {
         'detalle': detalle,
         'titulo': f'Editar Detalle #{detalle.pk}',
-        'ordenes': ordenes,
-        'productos': productos
-    })
+        'texto_orden': autocompletar.texto_orden(detalle.orden_id, detalle.orden.cliente),
+        'texto_producto': autocompletar.texto_producto(
+            detalle.producto.nombre, detalle.producto.precio, detalle.producto.stock
+        ),
+        'nota_producto': f'Precio unitario registrado: ${detalle.precio_unitario:.2f}',
+        'error': error,
+    }, status=409 if error else 200)
 
 def eliminar_detalle(request, pk):
     detalle = get_object_or_404(DetalleOrden, pk=pk)
     
     if request.method == 'POST':
-        orden_pk = detalle.orden.pk 
+        orden_pk = detalle.orden_id
+        detalle_pk = detalle.pk
+        subtotal = detalle.subtotal
         
-        with transaction.atomic():
+        with escritura():
             detalle.delete()
-            actualizar_total_orden(orden_pk)
+            ajustar_resumen_orden(orden_pk, total=-subtotal, lineas=-1, unidades=-detalle.cantidad, muestra=True)
+            # La línea de una orden cancelada ya devolvió su stock al cancelarse
+            if estados.primera_cancelada(orden_pk) is None:
+                liberar_stock(detalle.producto_id, detalle.cantidad, detalle_pk)
             
         return redirect('ver_detalles')
 
@@ -391,9 +719,163 @@ def eliminar_detalle(request, pk):
 
 
 # =========================================================================
-# VISTA DE REPORTES (Mínima)
+# VISTA DE REPORTES
 # =========================================================================
 
-def ver_reportes(request):
-    """Vista mínima para el módulo de reportes."""
-    return render(request, 'reportes/ver_reportes.html', {'titulo': 'Reportes'})
\ No newline at end of file
+async def ver_reportes(request):
+    """Reportes de ventas leídos de la tabla de resumen (ResumenVentaDiaria).
+
+    Muestra ingresos por día, productos más vendidos y ventas por método de
+    pago en el rango de fechas pedido (últimos 30 días por defecto). Los
+    pedidos cancelados y las órdenes archivadas se excluyen salvo que se
+    pida lo contrario.
+    """
+    hoy = timezone.localdate()
+    desde = leer_fecha(request.GET.get('desde')) or hoy - timedelta(days=29)
+    hasta = leer_fecha(request.GET.get('hasta')) or hoy
+    incluir_cancelados = request.GET.get('incluir_cancelados') == '1'
+    incluir_archivo = request.GET.get('incluir_archivo') == '1'
+
+    estados = [valor for valor, _ in ESTADO_CHOICES if incluir_cancelados or valor != 'Cancelado']
+    filtros = {'desde': desde, 'hasta': hasta, 'estados': estados, 'incluir_archivo': incluir_archivo}
+    metodos = dict(METODO_CHOICES)
+
+    por_metodo = [fila async for fila in reportes.ventas_por_metodo_pago(**filtros)]
+    for fila in por_metodo:
+        fila['etiqueta'] = metodos.get(fila['metodo_pago'], fila['metodo_pago'])
+
+    return render(request, 'reportes/ver_reportes.html', {
+        'titulo': 'Reportes',
+        'desde': desde,
+        'hasta': hasta,
+        'incluir_cancelados': incluir_cancelados,
+        'incluir_archivo': incluir_archivo,
+        'totales': await reportes.atotales_generales(**filtros),
+        'por_dia': [fila async for fila in reportes.ingresos_por_dia(**filtros)],
+        'top_productos': [fila async for fila in reportes.productos_mas_vendidos(**filtros)],
+        'por_metodo': por_metodo,
+        'tareas_mantenimiento': [
+            (tipo, tareas.descripcion_de(tipo))
+            for tipo in ('reconstruir_resumen', 'conciliar_totales', 'conciliar_resumen_ordenes', 'archivar_ordenes',
+                         'compactar_inventario')
+        ],
+    })
+
+
+# =========================================================================
+# VISTAS DE TAREAS EN SEGUNDO PLANO
+# =========================================================================
+# Las operaciones largas se encolan (tareas.py) y las ejecuta
+# `manage.py ejecutar_tareas`; la petición sólo inserta la fila.
+
+def _estado_tarea_json(tarea):
+    datos = {
+        'id': tarea.pk,
+        'tipo': tarea.tipo,
+        'descripcion': tareas.descripcion_de(tarea.tipo),
+        'estado': tarea.estado,
+        'progreso': tarea.progreso,
+        'total': tarea.total,
+        'porcentaje': tarea.porcentaje,
+        'resultado': tarea.resultado,
+        'error': tarea.error.strip().splitlines()[-1] if tarea.error.strip() else '',
+        'creada': tarea.creada,
+        'terminada': tarea.terminada,
+        'url': reverse('ver_tarea', args=[tarea.pk]),
+        'estado_url': reverse('estado_tarea', args=[tarea.pk]),
+    }
+    if tarea.archivo and tarea.estado == 'Terminada':
+        datos['descarga'] = reverse('descargar_tarea', args=[tarea.pk])
+    return datos
+
+@require_POST
+def encolar_tarea(request, tipo):
+    """Encola la tarea `tipo` con los parámetros del formulario y responde de inmediato.
+
+    Con Accept: application/json devuelve 202 y el estado de la tarea; si no,
+    redirige a su página de avance.
+    """
+    try:
+        tarea = tareas.encolar_desde(tipo, request.POST)
+    except tareas.TipoDeTareaDesconocido:
+        raise Http404('Tipo de tarea desconocido.')
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse(_estado_tarea_json(tarea), status=202)
+    return redirect('ver_tarea', pk=tarea.pk)
+
+async def ver_tareas(request):
+    """Lista de tareas, las más recientes primero, paginada por cursor."""
+    pagina = await apaginar_por_cursor(
+        Tarea.objects.all(),
+        ('-pk',),
+        despues=request.GET.get('despues'),
+        antes=request.GET.get('antes'),
+        tamano=tamano_pagina(request),
+    )
+    for tarea in pagina:
+        tarea.descripcion = tareas.descripcion_de(tarea.tipo)
+    return render(request, 'tareas/ver_tareas.html', {
+        'tareas': pagina,
+        'pagina': pagina,
+        'titulo': 'Tareas en Segundo Plano',
+    })
+
+async def ver_tarea(request, pk):
+    """Avance de una tarea; la página se recarga sola mientras sigue activa."""
+    tarea = await aget_object_or_404(Tarea, pk=pk)
+    return render(request, 'tareas/ver_tarea.html', {
+        'tarea': tarea,
+        'estado': _estado_tarea_json(tarea),
+        'titulo': f'Tarea #{tarea.pk}',
+    })
+
+async def estado_tarea(request, pk):
+    """Estado de una tarea en JSON, para sondear su avance."""
+    tarea = await aget_object_or_404(Tarea, pk=pk)
+    return JsonResponse(_estado_tarea_json(tarea))
+
+def descargar_tarea(request, pk):
+    """Descarga el archivo que generó una tarea terminada (p. ej. una exportación)."""
+    tarea = get_object_or_404(Tarea, pk=pk, estado='Terminada')
+    ruta = Path(tarea.archivo) if tarea.archivo else None
+    if ruta is None or not ruta.is_file():
+        raise Http404('La tarea no generó un archivo o ya no existe.')
+    return FileResponse(open(ruta, 'rb'), as_attachment=True, filename=ruta.name)
+
+
+# =========================================================================
+# VISTAS DEL ARCHIVO DE ÓRDENES (SÓLO LECTURA)
+# =========================================================================
+# Órdenes cerradas que `manage.py archivar_ordenes` sacó de las tablas de
+# trabajo (archivo.py).
+
+async def ver_archivo(request):
+    """Órdenes archivadas paginadas por cursor (fecha_orden, pk), con filtro opcional por estado."""
+    ordenes = OrdenArchivada.objects.all()
+    estado = request.GET.get('estado')
+    if estado:
+        ordenes = ordenes.filter(estado=estado)
+    pagina = await apaginar_por_cursor(
+        ordenes,
+        ('-fecha_orden', '-pk'),
+        despues=request.GET.get('despues'),
+        antes=request.GET.get('antes'),
+        tamano=tamano_pagina(request),
+    )
+    return render(request, 'archivo/ver_archivo.html', {
+        'ordenes': pagina,
+        'pagina': pagina,
+        'estado': estado,
+        'estado_choices': ESTADO_CHOICES,
+        'titulo': 'Archivo de Órdenes',
+    })
+
+async def ver_orden_archivada(request, pk):
+    """Una orden archivada con sus líneas."""
+    orden = await aget_object_or_404(OrdenArchivada, pk=pk)
+    detalles = [detalle async for detalle in orden.detalles.select_related('producto').order_by('pk')]
+    return render(request, 'archivo/ver_orden_archivada.html', {
+        'orden': orden,
+        'detalles': detalles,
+        'titulo': f'Orden archivada #{orden.pk}',
+    })
@@ -36,6 +36,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Sólo actúa si INSTRUMENTACION_ACTIVA es True (ver más abajo)
+    'app_TiendadeMagia.instrumentacion.InstrumentacionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -47,19 +49,44 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'backend_TiendadeMagia.urls'
 
+
+# =========================================================================
+# PLANTILLAS Y MODO DE RENDERIZADO
+# =========================================================================
+# TIENDA_RENDERIZADO=produccion activa el modo de producción:
+#   - cargador de plantillas en caché declarado explícitamente: las
+#     plantillas se compilan una vez por proceso y no se vigilan cambios
+#     (sin él Django también las guarda, pero con DEBUG=True el autoreload
+#     vacía esa caché);
+#   - filas de ver_producto, ver_ordenes y ver_detalles en caché por pk +
+#     `modificado` (fragmentos.py, alias 'fragmentos' de CACHES).
+
+RENDERIZADO_PRODUCCION = os.environ.get('TIENDA_RENDERIZADO') == 'produccion'
+
+OPCIONES_PLANTILLAS = {
+    'context_processors': [
+        'django.template.context_processors.debug',
+        'django.template.context_processors.request',
+        'django.contrib.auth.context_processors.auth',
+        'django.contrib.messages.context_processors.messages',
+    ],
+}
+
+if RENDERIZADO_PRODUCCION:
+    OPCIONES_PLANTILLAS['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
-        'OPTIONS': {
-            'context_processors': [
-                'django.template.context_processors.debug',
-                'django.template.context_processors.request',
-                'django.contrib.auth.context_processors.auth',
-                'django.contrib.messages.context_processors.messages',
-            ],
-        },
+        # APP_DIRS no se puede combinar con 'loaders' (app_directories ya está en la lista)
+        'APP_DIRS': not RENDERIZADO_PRODUCCION,
+        'OPTIONS': OPCIONES_PLANTILLAS,
     },
 ]
 
@@ -69,13 +96,65 @@ WSGI_APPLICATION = 'backend_TiendadeMagia.wsgi.application'
 # =========================================================================
 # BASE DE DATOS
 # =========================================================================
-
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Perfil por defecto: SQLite ajustado para escrituras concurrentes.
+#   - TIENDA_BD apunta a otro archivo (lo usan los benchmarks).
+#   - TIENDA_SQLITE_AJUSTES=0 vuelve a la configuración original de SQLite
+#     (sin PRAGMAs, transacciones DEFERRED, sin conexiones persistentes).
+#   - TIENDA_BD_MOTOR=postgresql usa PostgreSQL con pool de conexiones
+#     (requiere `pip install "psycopg[binary,pool]"`); se configura con
+#     TIENDA_PG_NOMBRE, TIENDA_PG_USUARIO, TIENDA_PG_CLAVE, TIENDA_PG_HOST,
+#     TIENDA_PG_PUERTO y TIENDA_PG_POOL_MAX.
+
+SQLITE_AJUSTES_ACTIVOS = os.environ.get('TIENDA_SQLITE_AJUSTES', '1') != '0'
+
+# PRAGMAs aplicados a cada conexión SQLite nueva (ver app_TiendadeMagia/basedatos.py).
+# journal_mode = WAL se guarda en el archivo: se activa una sola vez con
+# `python manage.py activar_wal` en lugar de reescribirse en cada conexión.
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,         # ms que un escritor espera el candado antes de fallar
+    'synchronous': 'NORMAL',      # seguro con WAL; evita un fsync por transacción
+    'cache_size': -20000,         # ~20 MB de caché de páginas por conexión
+    'mmap_size': 134217728,       # 128 MB de lectura mapeada en memoria
+    'temp_store': 'MEMORY',
+} if SQLITE_AJUSTES_ACTIVOS else {}
+
+# BEGIN IMMEDIATE sólo en las transacciones de escritura (basedatos.escritura):
+# el candado se pide al inicio y se espera con busy_timeout, en lugar de
+# fallar con "database is locked" al pasar de lectura a escritura a media
+# transacción. Las demás transacciones siguen siendo DEFERRED.
+SQLITE_MODO_ESCRITURA = 'IMMEDIATE' if SQLITE_AJUSTES_ACTIVOS else None
+
+if os.environ.get('TIENDA_BD_MOTOR') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('TIENDA_PG_NOMBRE', 'tienda_magia'),
+            'USER': os.environ.get('TIENDA_PG_USUARIO', 'tienda'),
+            'PASSWORD': os.environ.get('TIENDA_PG_CLAVE', ''),
+            'HOST': os.environ.get('TIENDA_PG_HOST', 'localhost'),
+            'PORT': os.environ.get('TIENDA_PG_PUERTO', '5432'),
+            # Con el pool de psycopg las conexiones ya se reutilizan: CONN_MAX_AGE debe ser 0
+            'CONN_MAX_AGE': 0,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': 2,
+                    'max_size': int(os.environ.get('TIENDA_PG_POOL_MAX', 10)),
+                    'timeout': 10,
+                },
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('TIENDA_BD', BASE_DIR / 'db.sqlite3'),
+            # Conexiones persistentes: los PRAGMAs se aplican una vez por conexión.
+            # Bajo ASGI (uvicorn) usar TIENDA_CONN_MAX_AGE=0, como indica Django.
+            'CONN_MAX_AGE': int(os.environ.get('TIENDA_CONN_MAX_AGE', 60)) if SQLITE_AJUSTES_ACTIVOS else 0,
+            'CONN_HEALTH_CHECKS': SQLITE_AJUSTES_ACTIVOS,
+        }
     }
-}
 
 
 # =========================================================================
@@ -118,6 +197,142 @@ USE_TZ = True
 STATIC_URL = 'static/'
 
 
+# =========================================================================
+# CACHÉ
+# =========================================================================
+# El catálogo de productos de los formularios de órdenes (catalogo.py) y las
+# filas renderizadas de las listas (fragmentos.py) usan su propio alias para
+# poder moverlos a Redis/Memcached sin tocar lo demás.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalogo': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tienda-catalogo',
+    },
+    'fragmentos': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tienda-fragmentos',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+}
+
+CATALOGO_CACHE = 'catalogo'
+
+CATALOGO_TIMEOUT = 3600  # segundos
+
+# Respuestas de autocompletado de órdenes y productos (autocompletar.py)
+AUTOCOMPLETAR_CACHE = 'default'
+
+AUTOCOMPLETAR_TIMEOUT = 15  # segundos
+
+# Filas de las listas ya renderizadas (fragmentos.py)
+FRAGMENTOS_ACTIVOS = RENDERIZADO_PRODUCCION
+
+FRAGMENTOS_CACHE = 'fragmentos'
+
+FRAGMENTOS_TIMEOUT = 86400  # segundos
+
+
+# =========================================================================
+# TAREAS EN SEGUNDO PLANO
+# =========================================================================
+# Exportaciones, reconstrucción del resumen y conciliaciones encoladas desde
+# las vistas (app_TiendadeMagia/tareas.py). Las ejecuta:
+#     python manage.py ejecutar_tareas --hilos 2 [--procesos N]
+
+# Archivos generados por las tareas (exportaciones)
+TAREAS_DIRECTORIO = Path(os.environ.get('TIENDA_TAREAS_DIR', BASE_DIR / 'tareas_archivos'))
+
+TAREAS_INTERVALO_AVANCE = 1.0  # segundos mínimos entre escrituras del avance
+
+TAREAS_TIEMPO_ABANDONO = 600  # segundos sin avance para devolver una tarea a la cola
+
+TAREAS_MAX_INTENTOS = 3
+
+
+# =========================================================================
+# ARCHIVO DE ÓRDENES CERRADAS
+# =========================================================================
+# Las órdenes 'Entregado' / 'Cancelado' más antiguas que esto pasan a las
+# tablas de archivo (app_TiendadeMagia/archivo.py) con:
+#     python manage.py archivar_ordenes
+
+ARCHIVO_ANTIGUEDAD_DIAS = int(os.environ.get('TIENDA_ARCHIVO_DIAS', 365))
+
+ARCHIVO_TAMANO_LOTE = 500  # órdenes por transacción
+
+
+# =========================================================================
+# HISTORIAL DE INVENTARIO
+# =========================================================================
+# Los movimientos de stock más antiguos que esto se reemplazan por una foto
+# del stock de cada producto (app_TiendadeMagia/movimientos.py) con:
+#     python manage.py compactar_inventario
+
+INVENTARIO_CONSERVAR_DIAS = int(os.environ.get('TIENDA_INVENTARIO_DIAS', 90))
+
+
+# =========================================================================
+# INSTRUMENTACIÓN Y PRESUPUESTOS DE CONSULTAS
+# =========================================================================
+# Activar con la variable de entorno TIENDA_INSTRUMENTACION=1. Cada petición
+# emite una línea JSON en el logger 'app_TiendadeMagia.instrumentacion' y las
+# cabeceras Server-Timing / X-Consultas-SQL.
+
+INSTRUMENTACION_ACTIVA = os.environ.get('TIENDA_INSTRUMENTACION') == '1'
+
+# Si es True, exceder un presupuesto lanza una excepción en lugar de avisar
+INSTRUMENTACION_ESTRICTA = os.environ.get('TIENDA_INSTRUMENTACION_ESTRICTA') == '1'
+
+# Máximo de consultas SQL por nombre de URL (para peticiones GET)
+PRESUPUESTOS_CONSULTAS = {
+    'inicio': 0,
+    'ver_producto': 1,
+    'buscar_productos': 1,
+    'ajustar_productos': 2,
+    'inventario_producto': 2,
+    'autocompletar_productos': 1,
+    'autocompletar_ordenes': 1,
+    'ver_ordenes': 3,
+    'ver_detalles': 3,
+    'ver_reportes': 4,
+    'exportar_detalles': 1,
+    'ver_tareas': 1,
+    'ver_tarea': 1,
+    'estado_tarea': 1,
+    'agregar_orden': 1,
+    'editar_orden': 1,
+    'cambiar_estado_ordenes': 1,
+    'ver_archivo': 1,
+    'ver_orden_archivada': 2,
+    'agregar_detalle': 0,
+    'editar_detalle': 1,
+    'api_productos': 2,
+    'api_producto': 2,
+    'api_ordenes': 2,
+    'api_orden': 3,
+    'api_detalles': 2,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'app_TiendadeMagia.instrumentacion': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+
 # =========================================================================
 # CLAVE PRIMARIA PREDETERMINADA
 # =========================================================================
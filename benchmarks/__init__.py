@@ -0,0 +1,17 @@
+"""
+Suite de benchmarks de la Tienda de Magia.
+
+Genera tiendas sintéticas reproducibles (generador.py) y mide cada ruta de
+app_TiendadeMagia con el cliente de pruebas de Django (ejecutar.py).
+
+Uso:
+    python -m benchmarks --tamanos 1000 100000 --salida resultados.json
+    python -m benchmarks --tamanos 1000 --comparar resultados.json
+
+servidores.py compara WSGI contra ASGI (uvicorn) con muchos clientes lentos:
+    python -m benchmarks.servidores --tamano 10000 --lentos 200 --duracion 15
+
+concurrencia.py mide lecturas y escrituras concurrentes con SQLite original
+contra el perfil ajustado de settings.py (WAL, conexiones persistentes):
+    python -m benchmarks.concurrencia --tamano 10000 --escritores 8 --lectores 8
+"""
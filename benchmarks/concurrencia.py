@@ -0,0 +1,219 @@
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+# =========================================================================
+# LECTURAS Y ESCRITURAS CONCURRENTES: SQLITE ORIGINAL vs PERFIL AJUSTADO
+# =========================================================================
+# Copia la tienda sintética de `python -m benchmarks` y, para cada perfil,
+# lanza un subproceso con --escritores hilos que crean órdenes con
+# `agregar_orden` y --lectores hilos que consultan `api_ordenes`, ambos
+# llamando a la vista directamente (sin red). Después de cada operación se
+# cierran las conexiones viejas igual que al terminar una petición, así que
+# CONN_MAX_AGE tiene efecto.
+#
+#   - original: TIENDA_SQLITE_AJUSTES=0 (journal DELETE, BEGIN DEFERRED,
+#     una conexión por petición)
+#   - ajustado: el perfil de settings.py (WAL, busy_timeout, synchronous
+#     NORMAL, caché/mmap, BEGIN IMMEDIATE en las escrituras, conexiones
+#     persistentes; WAL se fija en la copia como haría `activar_wal`)
+#
+# Uso:
+#     python -m benchmarks.concurrencia --tamano 10000 --escritores 8 --lectores 8 --duracion 10
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+PERFILES = {
+    'original': {'TIENDA_SQLITE_AJUSTES': '0'},
+    'ajustado': {'TIENDA_SQLITE_AJUSTES': '1'},
+}
+
+
+def copiar_base(origen, destino, journal_mode):
+    """Copia la base con la API de respaldo de SQLite y fija su modo de journal."""
+    destino.unlink(missing_ok=True)
+    with sqlite3.connect(origen) as fuente, sqlite3.connect(destino) as copia:
+        fuente.backup(copia)
+        copia.execute(f'PRAGMA journal_mode = {journal_mode}')
+        # Stock de sobra: aquí interesa la contención, no las sobreventas
+        copia.execute('UPDATE app_TiendadeMagia_producto SET stock = 1000000000')
+    fuente.close()
+    copia.close()
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    valores = sorted(valores)
+    return round(valores[max(0, int(round(p * len(valores))) - 1)], 2)
+
+
+# -------------------------------------------------------------------------
+# CARGA (se ejecuta en el subproceso de cada perfil)
+# -------------------------------------------------------------------------
+
+def ejecutar_carga(escritores, lectores, duracion, lineas):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_TiendadeMagia.settings')
+    sys.path.insert(0, str(RAIZ))
+    import django
+    django.setup()
+
+    from django.db import close_old_connections, connection
+    from django.test import RequestFactory
+    from django.urls import reverse
+
+    from app_TiendadeMagia import api, views
+    from app_TiendadeMagia.models import Producto
+
+    productos = list(Producto.objects.order_by('pk').values_list('pk', flat=True))
+    connection.close()
+    fabrica = RequestFactory()
+    url_orden, url_api = reverse('agregar_orden'), reverse('api_ordenes')
+    fin = time.monotonic() + duracion
+    resultados = {'escritura': [], 'lectura': []}
+    errores = {'bloqueos': 0, 'otros': 0}
+    candado = threading.Lock()
+
+    def escritor(numero):
+        vuelta = 0
+        while time.monotonic() < fin:
+            inicio = numero * 7919 + vuelta * lineas
+            elegidos = [productos[(inicio + i) % len(productos)] for i in range(lineas)]
+            vuelta += 1
+            peticion = fabrica.post(url_orden, {
+                'cliente': f'Concurrencia {numero}', 'direccion_envio': 'Calle 1', 'estado': 'Pendiente',
+                'metodo_pago': 'Efectivo', 'producto': elegidos, 'cantidad': [1] * lineas,
+            })
+            medir(peticion, views.agregar_orden, 'escritura', 302)
+
+    def lector(numero):
+        while time.monotonic() < fin:
+            medir(fabrica.get(url_api, {'por_pagina': 25}), api.ordenes, 'lectura', 200)
+
+    def medir(peticion, vista, tipo, esperado):
+        inicio = time.perf_counter()
+        try:
+            respuesta = vista(peticion)
+            ok = respuesta.status_code == esperado
+            bloqueo = not ok and b'locked' in respuesta.content
+        except Exception as e:
+            ok, bloqueo = False, 'locked' in str(e)
+        finally:
+            close_old_connections()
+        with candado:
+            if ok:
+                resultados[tipo].append((time.perf_counter() - inicio) * 1000)
+            elif bloqueo:
+                errores['bloqueos'] += 1
+            else:
+                errores['otros'] += 1
+
+    def hilo(funcion, numero):
+        try:
+            funcion(numero)
+        finally:
+            connection.close()
+
+    hilos = [threading.Thread(target=hilo, args=(escritor, i)) for i in range(escritores)]
+    hilos += [threading.Thread(target=hilo, args=(lector, i)) for i in range(lectores)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    return {
+        'escrituras_por_segundo': round(len(resultados['escritura']) / duracion, 2),
+        'lecturas_por_segundo': round(len(resultados['lectura']) / duracion, 2),
+        'escritura_p50_ms': percentil(resultados['escritura'], 0.50),
+        'escritura_p95_ms': percentil(resultados['escritura'], 0.95),
+        'lectura_p50_ms': percentil(resultados['lectura'], 0.50),
+        'lectura_p95_ms': percentil(resultados['lectura'], 0.95),
+        'errores_bloqueo': errores['bloqueos'],
+        'errores_otros': errores['otros'],
+    }
+
+
+# -------------------------------------------------------------------------
+# PUNTO DE ENTRADA
+# -------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.concurrencia',
+        description='Lecturas y escrituras por segundo con SQLite original contra el perfil ajustado.',
+    )
+    parser.add_argument('--tamano', type=int, default=1000, help='Detalles de orden de la tienda sintética.')
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--perfiles', nargs='+', choices=list(PERFILES), default=list(PERFILES))
+    parser.add_argument('--escritores', type=int, default=8)
+    parser.add_argument('--lectores', type=int, default=8)
+    parser.add_argument('--lineas', type=int, default=3, help='Líneas por orden creada.')
+    parser.add_argument('--duracion', type=float, default=10.0, help='Segundos de carga por perfil.')
+    parser.add_argument('--regenerar', action='store_true')
+    parser.add_argument('--salida', help='Guarda el resultado JSON en este archivo.')
+    # Uso interno: el subproceso que aplica la carga de un perfil
+    parser.add_argument('--cargar', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.cargar:
+        print(json.dumps(ejecutar_carga(args.escritores, args.lectores, args.duracion, args.lineas)))
+        return 0
+
+    def salida(mensaje):
+        print(mensaje, file=sys.stderr)
+
+    from benchmarks.ejecutar import DIRECTORIO_DATOS, configurar_django, preparar_tienda
+    configurar_django()
+    import django
+    from django.db import connections
+
+    base = preparar_tienda(args.tamano, args.semilla, args.regenerar, salida)
+    connections.close_all()
+
+    resultado = {
+        'meta': {
+            'tamano': args.tamano,
+            'escritores': args.escritores,
+            'lectores': args.lectores,
+            'lineas': args.lineas,
+            'duracion': args.duracion,
+            'sqlite': sqlite3.sqlite_version,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'resultados': {},
+    }
+    for perfil in args.perfiles:
+        copia = DIRECTORIO_DATOS / f'concurrencia_{perfil}.sqlite3'
+        copiar_base(base, copia, 'WAL' if perfil == 'ajustado' else 'DELETE')
+        salida(f'[{perfil}] {args.escritores} escritores + {args.lectores} lectores durante {args.duracion} s...')
+        proceso = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.concurrencia', '--cargar',
+             '--escritores', str(args.escritores), '--lectores', str(args.lectores),
+             '--lineas', str(args.lineas), '--duracion', str(args.duracion)],
+            cwd=RAIZ, capture_output=True, text=True, check=True,
+            env={**os.environ, **PERFILES[perfil], 'TIENDA_BD': str(copia)},
+        )
+        medida = json.loads(proceso.stdout.strip().splitlines()[-1])
+        resultado['resultados'][perfil] = medida
+        salida(f'[{perfil}] {medida["escrituras_por_segundo"]} escrituras/s, '
+               f'{medida["lecturas_por_segundo"]} lecturas/s, {medida["errores_bloqueo"]} "database is locked"')
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        Path(args.salida).write_text(texto, encoding='utf-8')
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from urllib.parse import urlencode
+
+import django
+
+# =========================================================================
+# ARNÉS DE MEDICIÓN
+# =========================================================================
+# Para cada tamaño de tienda crea (o reutiliza) una base SQLite aparte,
+# recorre todas las rutas GET de app_TiendadeMagia/urls.py con el cliente de
+# pruebas de Django y reporta mediana/p95 de latencia, consultas SQL y pico
+# de memoria en JSON. Con --comparar contrasta contra un resultado guardado.
+
+DIRECTORIO_DATOS = Path(tempfile.gettempdir()) / 'tienda_magia_bench'
+
+# Variantes adicionales con querystring (nombre_url, etiqueta, parámetros)
+VARIANTES = [
+    ('ver_producto', 'ver_producto?q', {'q': 'varita'}),
+    ('buscar_productos', 'buscar_productos?q', {'q': 'var', 'limite': 10}),
+    ('ver_detalles', 'ver_detalles?estado', {'estado': 'Pendiente'}),
+]
+
+
+def configurar_django():
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_TiendadeMagia.settings')
+    django.setup()
+    from django.test.utils import setup_test_environment
+    # Sin DEBUG para no acumular connection.queries durante la medición
+    setup_test_environment(debug=False)
+
+
+def usar_base(ruta):
+    """Apunta la conexión 'default' a `ruta` y aplica las migraciones."""
+    from django.core.management import call_command
+    from django.db import connections
+
+    conexion = connections['default']
+    conexion.close()
+    conexion.settings_dict['NAME'] = str(ruta)
+    call_command('migrate', verbosity=0, interactive=False)
+
+
+def preparar_tienda(num_detalles, semilla, regenerar, salida):
+    from benchmarks.generador import generar_tienda
+    from django.db import connections
+
+    DIRECTORIO_DATOS.mkdir(parents=True, exist_ok=True)
+    ruta = DIRECTORIO_DATOS / f'tienda_{num_detalles}_{semilla}.sqlite3'
+    if regenerar and ruta.exists():
+        connections['default'].close()
+        ruta.unlink()
+    existia = ruta.exists()
+    usar_base(ruta)
+    if not existia:
+        salida(f'Generando tienda de {num_detalles} detalles (semilla {semilla}) en {ruta}...')
+        inicio = time.perf_counter()
+        conteos = generar_tienda(num_detalles, semilla=semilla, salida=salida)
+        salida(f'  listo en {time.perf_counter() - inicio:.1f} s: {conteos}')
+    return ruta
+
+
+def rutas_a_medir():
+    """Devuelve [(etiqueta, url)] para cada ruta GET de la app más las VARIANTES."""
+    from django.urls import reverse
+    from app_TiendadeMagia.models import Producto, OrdenDeVenta, DetalleOrden
+    from app_TiendadeMagia.urls import urlpatterns
+
+    muestras = {
+        'producto': Producto.objects.order_by('pk').values_list('pk', flat=True).first(),
+        'orden': OrdenDeVenta.objects.order_by('-fecha_orden').values_list('pk', flat=True).first(),
+        'detalle': DetalleOrden.objects.order_by('pk').values_list('pk', flat=True).first(),
+    }
+
+    rutas = []
+    for patron in urlpatterns:
+        nombre = patron.name
+        if not nombre:
+            continue
+        kwargs = {}
+        for parametro in patron.pattern.converters:
+            if parametro == 'producto_id':
+                kwargs[parametro] = muestras['producto']
+            elif parametro == 'pk':
+                recurso = next((r for r in ('producto', 'detalle') if r in nombre), 'orden')
+                kwargs[parametro] = muestras[recurso]
+            elif parametro == 'formato':
+                kwargs[parametro] = 'csv'
+            else:
+                kwargs = None
+                break
+        if kwargs is None or None in kwargs.values():
+            continue
+        rutas.append((nombre, reverse(nombre, kwargs=kwargs)))
+
+    for nombre, etiqueta, parametros in VARIANTES:
+        rutas.append((etiqueta, f'{reverse(nombre)}?{urlencode(parametros)}'))
+    return rutas
+
+
+def _consumir(respuesta):
+    if getattr(respuesta, 'streaming', False):
+        for _ in respuesta.streaming_content:
+            pass
+    else:
+        respuesta.content
+
+
+def medir_ruta(cliente, url, repeticiones, calentamiento=1):
+    from app_TiendadeMagia.instrumentacion import medir
+
+    for _ in range(calentamiento):
+        _consumir(cliente.get(url))
+
+    tiempos, consultas, estado = [], None, None
+    for _ in range(repeticiones):
+        with medir() as medicion:
+            respuesta = cliente.get(url)
+            _consumir(respuesta)
+        tiempos.append(medicion.tiempo_total * 1000)
+        consultas = medicion.consultas
+        estado = respuesta.status_code
+
+    # El pico de memoria se mide en una corrida aparte: tracemalloc altera los tiempos
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        _consumir(cliente.get(url))
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    tiempos.sort()
+    indice_p95 = max(0, int(round(0.95 * len(tiempos))) - 1)
+    return {
+        'estado': estado,
+        'mediana_ms': round(statistics.median(tiempos), 3),
+        'p95_ms': round(tiempos[indice_p95], 3),
+        'consultas': consultas,
+        'memoria_pico_kb': round(pico / 1024, 1),
+    }
+
+
+def comparar(actual, base, umbral):
+    """Compara dos resultados y devuelve (líneas de reporte, número de regresiones)."""
+    lineas, regresiones = [], 0
+    for tamano, rutas in actual['resultados'].items():
+        rutas_base = base.get('resultados', {}).get(tamano)
+        if not rutas_base:
+            lineas.append(f'[{tamano}] sin línea base')
+            continue
+        for etiqueta, medida in rutas.items():
+            anterior = rutas_base.get(etiqueta)
+            if not anterior:
+                continue
+            cambio = (medida['mediana_ms'] - anterior['mediana_ms']) / max(anterior['mediana_ms'], 1e-6)
+            consultas_cambio = (medida['consultas'] or 0) - (anterior['consultas'] or 0)
+            marca = ''
+            if cambio > umbral or consultas_cambio > 0:
+                marca = '  <-- REGRESIÓN'
+                regresiones += 1
+            elif cambio < -umbral:
+                marca = '  (mejora)'
+            lineas.append(
+                f'[{tamano}] {etiqueta:<28} {anterior["mediana_ms"]:>10.2f} -> {medida["mediana_ms"]:>10.2f} ms '
+                f'({cambio:+.0%}), consultas {anterior["consultas"]} -> {medida["consultas"]}{marca}'
+            )
+    return lineas, regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Mide las rutas de la tienda sobre tiendas sintéticas de varios tamaños.',
+    )
+    parser.add_argument('--tamanos', type=int, nargs='+', default=[1000],
+                        help='Número de detalles de orden por tienda (ej. 1000 100000 1000000).')
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--repeticiones', type=int, default=7)
+    parser.add_argument('--solo', nargs='*', help='Medir sólo estas etiquetas de ruta.')
+    parser.add_argument('--regenerar', action='store_true', help='Vuelve a generar las bases aunque existan.')
+    parser.add_argument('--salida', help='Guarda el resultado JSON en este archivo.')
+    parser.add_argument('--comparar', help='Archivo JSON de línea base contra el cual comparar.')
+    parser.add_argument('--umbral', type=float, default=0.20,
+                        help='Aumento relativo de la mediana considerado regresión (por defecto 0.20).')
+    args = parser.parse_args(argv)
+
+    def salida(mensaje):
+        print(mensaje, file=sys.stderr)
+
+    configurar_django()
+    from django.test import Client
+
+    resultado = {
+        'meta': {
+            'semilla': args.semilla,
+            'repeticiones': args.repeticiones,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'resultados': {},
+    }
+
+    for tamano in args.tamanos:
+        preparar_tienda(tamano, args.semilla, args.regenerar, salida)
+        cliente = Client()
+        medidas = {}
+        for etiqueta, url in rutas_a_medir():
+            if args.solo and etiqueta not in args.solo:
+                continue
+            medidas[etiqueta] = medir_ruta(cliente, url, args.repeticiones)
+            salida(f'[{tamano}] {etiqueta:<28} mediana {medidas[etiqueta]["mediana_ms"]:>10.2f} ms  '
+                   f'p95 {medidas[etiqueta]["p95_ms"]:>10.2f} ms  consultas {medidas[etiqueta]["consultas"]}')
+        resultado['resultados'][str(tamano)] = medidas
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        Path(args.salida).write_text(texto, encoding='utf-8')
+    else:
+        print(texto)
+
+    if args.comparar:
+        base = json.loads(Path(args.comparar).read_text(encoding='utf-8'))
+        lineas, regresiones = comparar(resultado, base, args.umbral)
+        for linea in lineas:
+            salida(linea)
+        if regresiones:
+            salida(f'{regresiones} regresiones respecto a {args.comparar}.')
+            return 1
+    return 0
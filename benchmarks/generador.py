@@ -0,0 +1,185 @@
+import decimal
+import random
+from contextlib import contextmanager
+from datetime import date, timedelta
+from collections import Counter
+from itertools import accumulate
+
+from django.db import transaction
+from django.utils import timezone
+
+# =========================================================================
+# GENERADOR DE TIENDAS SINTÉTICAS
+# =========================================================================
+# Con la misma semilla y los mismos tamaños produce exactamente los mismos
+# datos. La popularidad de los productos sigue una distribución tipo Zipf y
+# el número de líneas por orden es geométrico (muchas órdenes pequeñas y
+# pocas grandes), como en una tienda real.
+#
+# El historial de inventario cuadra con Producto.stock después de cada lote:
+# cada producto abre con una foto al inicio de la historia y cada línea
+# agrega su venta (y su devolución, si la orden está cancelada) en la misma
+# transacción que la crea. El stock generado es el final, así que la foto de
+# apertura se sube en cada lote con las unidades vendidas en él.
+
+CATEGORIAS = ['Varitas', 'Pociones', 'Capas', 'Libros', 'Amuletos', 'Cristales', 'Calderos', 'Ingredientes']
+PROVEEDORES = ['Ollivander', 'Borgin & Burkes', 'Slug & Jiggers', 'Flourish & Blotts', 'Gambol & Japes', None]
+ADJETIVOS = ['Antigua', 'Encantada', 'Brillante', 'Oscura', 'Lunar', 'Solar', 'Veloz', 'Eterna', 'Mística', 'Arcana']
+SUSTANTIVOS = ['Varita', 'Poción', 'Capa', 'Grimorio', 'Amuleto', 'Esfera', 'Runa', 'Caldero', 'Pluma', 'Reloj']
+CLIENTES = ['Ana', 'Beto', 'Carla', 'Diego', 'Elena', 'Fausto', 'Gala', 'Hugo', 'Irene', 'Julio', 'Karen', 'Luis']
+
+ESTADOS_PESOS = [('Pendiente', 15), ('Enviado', 20), ('Entregado', 55), ('Cancelado', 10)]
+METODOS_PESOS = [('Efectivo', 30), ('Tarjeta', 55), ('Transferencia', 15)]
+
+DIAS_DE_HISTORIA = 365
+
+
+@contextmanager
+def fecha_orden_manual():
+    """Desactiva auto_now_add de fecha_orden para poder cargar fechas históricas."""
+    from app_TiendadeMagia.models import OrdenDeVenta
+
+    campo = OrdenDeVenta._meta.get_field('fecha_orden')
+    original = campo.auto_now_add
+    campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        campo.auto_now_add = original
+
+
+def _elegir_distintos(rng, poblacion, pesos_acumulados, k):
+    elegidos = dict.fromkeys(rng.choices(poblacion, cum_weights=pesos_acumulados, k=k * 2))
+    elegidos = list(elegidos)[:k]
+    while len(elegidos) < k:
+        candidato = rng.choice(poblacion)
+        if candidato not in elegidos:
+            elegidos.append(candidato)
+    return elegidos
+
+
+def generar_tienda(num_detalles, semilla=42, num_productos=None, lineas_promedio=3.0, lote=5000, salida=None):
+    """Llena la base de datos actual con una tienda sintética.
+
+    Crea `num_productos` productos (por defecto uno por cada 50 líneas, mínimo
+    20), y órdenes hasta sumar `num_detalles` líneas con sus movimientos de
+    inventario y la foto de apertura de cada producto. Al final reconstruye la
+    tabla de resumen y el índice de búsqueda y sube las versiones de tabla.
+    Devuelve un dict con los conteos.
+    """
+    from app_TiendadeMagia import versiones
+    from app_TiendadeMagia.busqueda import reconstruir_indice
+    from app_TiendadeMagia.inventario import DEVOLUCION, VENTA
+    from app_TiendadeMagia.models import Producto, OrdenDeVenta, DetalleOrden, FotoInventario, MovimientoInventario
+    from app_TiendadeMagia.reportes import reconstruir_resumen
+
+    rng = random.Random(semilla)
+    num_productos = num_productos or max(20, num_detalles // 50)
+    ahora = timezone.now()
+
+    # 1. Catálogo
+    productos = []
+    for i in range(num_productos):
+        productos.append(Producto(
+            nombre=f'{rng.choice(SUSTANTIVOS)} {rng.choice(ADJETIVOS)} {i:06d}',
+            descripcion=f'{rng.choice(ADJETIVOS)} y {rng.choice(ADJETIVOS).lower()}, ideal para aprendices.',
+            categoria=rng.choice(CATEGORIAS),
+            precio=decimal.Decimal(rng.randint(100, 50000)) / 100,
+            proveedor=rng.choice(PROVEEDORES),
+            stock=rng.randint(0, 500),
+            fecha_registro=date.today() - timedelta(days=rng.randint(0, DIAS_DE_HISTORIA * 2)),
+        ))
+    # La foto de apertura va justo antes de la orden más antigua posible
+    apertura = ahora - timedelta(days=DIAS_DE_HISTORIA, seconds=1)
+    with transaction.atomic():
+        Producto.objects.bulk_create(productos, batch_size=lote)
+        fotos = {
+            producto.pk: FotoInventario(producto_id=producto.pk, fecha=apertura, stock=producto.stock)
+            for producto in productos
+        }
+        FotoInventario.objects.bulk_create(fotos.values(), batch_size=lote)
+    precios = dict(Producto.objects.values_list('pk', 'precio'))
+    nombres = dict(Producto.objects.values_list('pk', 'nombre'))
+    pks = sorted(precios)
+    pesos = list(accumulate(1.0 / (rango + 1) ** 1.1 for rango in range(len(pks))))
+    rng.shuffle(pks)
+
+    estados, pesos_estados = zip(*ESTADOS_PESOS)
+    metodos, pesos_metodos = zip(*METODOS_PESOS)
+    probabilidad_fin = 1.0 / max(lineas_promedio, 1.0)
+
+    # 2. Órdenes y detalles, en transacciones de `lote` líneas
+    creadas_ordenes = creadas_detalles = 0
+    with fecha_orden_manual():
+        while creadas_detalles < num_detalles:
+            ordenes, lineas_por_orden = [], []
+            en_lote = 0
+            while en_lote < lote and creadas_detalles + en_lote < num_detalles:
+                k = 1
+                while rng.random() > probabilidad_fin and k < len(pks):
+                    k += 1
+                k = min(k, num_detalles - creadas_detalles - en_lote)
+                lineas = []
+                total = decimal.Decimal('0.00')
+                for producto_pk in _elegir_distintos(rng, pks, pesos, k):
+                    cantidad = rng.choices((1, 2, 3, 5, 10), weights=(60, 20, 10, 7, 3))[0]
+                    precio = precios[producto_pk]
+                    descuento = (precio * cantidad / 10).quantize(decimal.Decimal('0.01')) if rng.random() < 0.1 else decimal.Decimal('0.00')
+                    subtotal = precio * cantidad - descuento
+                    total += subtotal
+                    lineas.append(DetalleOrden(
+                        producto_id=producto_pk, cantidad=cantidad, precio_unitario=precio,
+                        descuento=descuento, subtotal=subtotal,
+                    ))
+                ordenes.append(OrdenDeVenta(
+                    cliente=f'{rng.choice(CLIENTES)} {rng.randint(1, 99999):05d}',
+                    fecha_orden=ahora - timedelta(seconds=rng.randint(0, DIAS_DE_HISTORIA * 86400)),
+                    direccion_envio=f'Callejón Diagon {rng.randint(1, 999)}',
+                    total=total,
+                    num_lineas=len(lineas),
+                    unidades=sum(detalle.cantidad for detalle in lineas),
+                    producto_muestra=nombres[lineas[0].producto_id],
+                    estado=rng.choices(estados, weights=pesos_estados)[0],
+                    metodo_pago=rng.choices(metodos, weights=pesos_metodos)[0],
+                ))
+                lineas_por_orden.append(lineas)
+                en_lote += len(lineas)
+
+            with transaction.atomic():
+                OrdenDeVenta.objects.bulk_create(ordenes)
+                for orden, lineas in zip(ordenes, lineas_por_orden):
+                    for detalle in lineas:
+                        detalle.orden_id = orden.pk
+                DetalleOrden.objects.bulk_create([d for lineas in lineas_por_orden for d in lineas])
+
+                movimientos, vendidas = [], Counter()
+                for orden, lineas in zip(ordenes, lineas_por_orden):
+                    for detalle in lineas:
+                        movimientos.append(MovimientoInventario(
+                            producto_id=detalle.producto_id, tipo=VENTA, cantidad=-detalle.cantidad,
+                            detalle_id=detalle.pk, fecha=orden.fecha_orden,
+                        ))
+                        if orden.estado == 'Cancelado':
+                            movimientos.append(MovimientoInventario(
+                                producto_id=detalle.producto_id, tipo=DEVOLUCION, cantidad=detalle.cantidad,
+                                detalle_id=detalle.pk, nota='Orden cancelada',
+                                fecha=min(orden.fecha_orden + timedelta(hours=1), ahora),
+                            ))
+                        else:
+                            vendidas[detalle.producto_id] += detalle.cantidad
+                MovimientoInventario.objects.bulk_create(movimientos)
+                for producto_pk, cantidad in vendidas.items():
+                    fotos[producto_pk].stock += cantidad
+                FotoInventario.objects.bulk_update([fotos[pk] for pk in vendidas], ['stock'], batch_size=lote)
+
+            creadas_ordenes += len(ordenes)
+            creadas_detalles += en_lote
+            if salida:
+                salida(f'  {creadas_detalles}/{num_detalles} detalles')
+
+    # 3. Estructuras derivadas
+    reconstruir_resumen()
+    reconstruir_indice()
+    versiones.incrementar(*versiones.MODELOS_VERSIONADOS)
+
+    return {'productos': num_productos, 'ordenes': creadas_ordenes, 'detalles': creadas_detalles}
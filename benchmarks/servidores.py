@@ -0,0 +1,269 @@
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# =========================================================================
+# WSGI vs ASGI CON CLIENTES LENTOS
+# =========================================================================
+# Levanta la tienda sintética (la misma base que `python -m benchmarks`) en
+# dos servidores locales y los somete a la misma carga:
+#
+#   - wsgi: servidor WSGI de la biblioteca estándar con un pool fijo de
+#     hilos (--hilos), como un gunicorn con worker gthread.
+#   - asgi: uvicorn con un solo proceso sobre backend_TiendadeMagia.asgi
+#     (requiere `pip install uvicorn`; si no está se omite).
+#
+# La carga son --lentos clientes que envían las cabeceras línea por línea
+# con --pausa segundos entre cada una (y leen la respuesta igual de lento)
+# más --rapidos clientes normales. Se reporta el rendimiento y la latencia
+# de los clientes rápidos: con WSGI cada cliente lento retiene un hilo del
+# pool, con ASGI sólo una corrutina.
+#
+# Uso:
+#     python -m benchmarks.servidores --tamano 10000 --lentos 200 --duracion 15
+
+RAIZ = Path(__file__).resolve().parent.parent
+HOST = '127.0.0.1'
+
+# Vistas de lectura (async en views.py)
+RUTAS = ['/productos/', '/ordenes/', '/detalles/', '/reportes/']
+
+
+# -------------------------------------------------------------------------
+# SERVIDORES (se ejecutan en un subproceso)
+# -------------------------------------------------------------------------
+
+def servir_wsgi(puerto, hilos):
+    from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+    from django.core.wsgi import get_wsgi_application
+
+    class ManejadorSilencioso(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    class ServidorConPool(WSGIServer):
+        """WSGIServer que atiende cada conexión en un pool fijo de hilos."""
+        request_queue_size = 1024
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.pool = ThreadPoolExecutor(max_workers=hilos)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._atender, request, client_address)
+
+        def _atender(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    servidor = ServidorConPool((HOST, puerto), ManejadorSilencioso)
+    servidor.set_app(get_wsgi_application())
+    servidor.serve_forever()
+
+
+def comando_servidor(tipo, puerto, hilos):
+    if tipo == 'asgi':
+        return [sys.executable, '-m', 'uvicorn', 'backend_TiendadeMagia.asgi:application',
+                '--host', HOST, '--port', str(puerto), '--log-level', 'warning', '--no-access-log']
+    return [sys.executable, '-m', 'benchmarks.servidores', '--servir', 'wsgi',
+            '--puerto', str(puerto), '--hilos', str(hilos)]
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def esperar_puerto(puerto, limite=30.0):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        try:
+            with socket.create_connection((HOST, puerto), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+# -------------------------------------------------------------------------
+# CLIENTES
+# -------------------------------------------------------------------------
+
+async def peticion(puerto, ruta, pausa=0.0):
+    """Hace un GET con HTTP/1.1 (Connection: close); con `pausa` lo hace lentamente.
+
+    Devuelve el código de estado.
+    """
+    lector, escritor = await asyncio.open_connection(HOST, puerto)
+    try:
+        lineas = [f'GET {ruta} HTTP/1.1', f'Host: {HOST}:{puerto}', 'User-Agent: benchmarks',
+                  'Accept: text/html', 'Connection: close', '']
+        if pausa:
+            for linea in lineas:
+                escritor.write(f'{linea}\r\n'.encode('ascii'))
+                await escritor.drain()
+                await asyncio.sleep(pausa)
+        else:
+            escritor.write('\r\n'.join(lineas + ['']).encode('ascii'))
+            await escritor.drain()
+
+        estado = (await lector.readline()).split(b' ', 2)
+        while True:
+            bloque = await lector.read(1024 if pausa else 65536)
+            if not bloque:
+                break
+            if pausa:
+                await asyncio.sleep(pausa)
+        return int(estado[1]) if len(estado) > 1 else 0
+    finally:
+        escritor.close()
+
+
+async def aplicar_carga(puerto, lentos, rapidos, duracion, pausa):
+    fin = time.monotonic() + duracion
+    latencias, estados = [], {}
+    contadores = {'lentas': 0, 'errores': 0}
+
+    async def cliente(numero, lento):
+        vuelta = numero
+        while time.monotonic() < fin:
+            ruta = RUTAS[vuelta % len(RUTAS)]
+            vuelta += 1
+            inicio = time.perf_counter()
+            try:
+                estado = await asyncio.wait_for(peticion(puerto, ruta, pausa if lento else 0.0), duracion + 60)
+            except (OSError, asyncio.TimeoutError):
+                contadores['errores'] += 1
+                await asyncio.sleep(0.05)
+                continue
+            estados[estado] = estados.get(estado, 0) + 1
+            if lento:
+                contadores['lentas'] += 1
+            elif time.monotonic() <= fin:
+                latencias.append((time.perf_counter() - inicio) * 1000)
+
+    await asyncio.gather(
+        *(cliente(i, True) for i in range(lentos)),
+        *(cliente(i, False) for i in range(rapidos)),
+    )
+
+    latencias.sort()
+    return {
+        'rapidas_por_segundo': round(len(latencias) / duracion, 2),
+        'mediana_ms': round(statistics.median(latencias), 2) if latencias else None,
+        'p95_ms': round(latencias[max(0, int(round(0.95 * len(latencias))) - 1)], 2) if latencias else None,
+        'lentas_completadas': contadores['lentas'],
+        'errores': contadores['errores'],
+        'estados': {str(k): v for k, v in sorted(estados.items())},
+    }
+
+
+def medir_servidor(tipo, ruta_bd, args, salida):
+    puerto = puerto_libre()
+    entorno = {**os.environ, 'TIENDA_BD': str(ruta_bd), 'PYTHONPATH': str(RAIZ)}
+    proceso = subprocess.Popen(comando_servidor(tipo, puerto, args.hilos), cwd=RAIZ, env=entorno)
+    try:
+        if not esperar_puerto(puerto):
+            raise RuntimeError(f'El servidor {tipo} no respondió en el puerto {puerto}.')
+        # Calentamiento: primera carga de plantillas, catálogo en caché, etc.
+        for ruta in RUTAS:
+            asyncio.run(peticion(puerto, ruta))
+        salida(f'[{tipo}] {args.lentos} clientes lentos + {args.rapidos} rápidos durante {args.duracion} s...')
+        return asyncio.run(aplicar_carga(puerto, args.lentos, args.rapidos, args.duracion, args.pausa))
+    finally:
+        proceso.terminate()
+        try:
+            proceso.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+
+
+# -------------------------------------------------------------------------
+# PUNTO DE ENTRADA
+# -------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.servidores',
+        description='Compara WSGI (pool de hilos) contra ASGI (uvicorn) con muchos clientes lentos.',
+    )
+    parser.add_argument('--tamano', type=int, default=1000, help='Detalles de orden de la tienda sintética.')
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--servidores', nargs='+', choices=['wsgi', 'asgi'], default=['wsgi', 'asgi'])
+    parser.add_argument('--lentos', type=int, default=100, help='Clientes lentos concurrentes.')
+    parser.add_argument('--rapidos', type=int, default=10, help='Clientes rápidos concurrentes (se miden).')
+    parser.add_argument('--pausa', type=float, default=0.5, help='Segundos entre cada línea de un cliente lento.')
+    parser.add_argument('--duracion', type=float, default=10.0, help='Segundos de carga por servidor.')
+    parser.add_argument('--hilos', type=int, default=8, help='Hilos del pool WSGI.')
+    parser.add_argument('--regenerar', action='store_true')
+    parser.add_argument('--salida', help='Guarda el resultado JSON en este archivo.')
+    # Uso interno: el subproceso que sirve WSGI
+    parser.add_argument('--servir', choices=['wsgi'], help=argparse.SUPPRESS)
+    parser.add_argument('--puerto', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.servir:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_TiendadeMagia.settings')
+        servir_wsgi(args.puerto, args.hilos)
+        return 0
+
+    def salida(mensaje):
+        print(mensaje, file=sys.stderr)
+
+    from benchmarks.ejecutar import configurar_django, preparar_tienda
+    configurar_django()
+    import django
+    from django.db import connections
+
+    ruta_bd = preparar_tienda(args.tamano, args.semilla, args.regenerar, salida)
+    connections.close_all()
+
+    resultado = {
+        'meta': {
+            'tamano': args.tamano,
+            'lentos': args.lentos,
+            'rapidos': args.rapidos,
+            'pausa': args.pausa,
+            'duracion': args.duracion,
+            'hilos_wsgi': args.hilos,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'resultados': {},
+    }
+    for tipo in args.servidores:
+        if tipo == 'asgi' and importlib.util.find_spec('uvicorn') is None:
+            salida('[asgi] uvicorn no está instalado (pip install uvicorn); se omite.')
+            continue
+        medida = medir_servidor(tipo, ruta_bd, args, salida)
+        resultado['resultados'][tipo] = medida
+        salida(f'[{tipo}] {medida["rapidas_por_segundo"]} pet/s rápidas, mediana {medida["mediana_ms"]} ms, '
+               f'p95 {medida["p95_ms"]} ms, {medida["lentas_completadas"]} lentas, {medida["errores"]} errores')
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        Path(args.salida).write_text(texto, encoding='utf-8')
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())